@@ -14,27 +14,49 @@ License: MIT
 """
 
 import functools
+import threading
 import time
 import hashlib
+import heapq
+import hmac
+import inspect
 import logging
-from datetime import datetime, timedelta
-from typing import Generator, Callable, Any, Dict, List
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from dataclasses import dataclass
+import os
+import pickle
+import struct
+import sys
+import weakref
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter
+from collections.abc import MutableMapping, Sequence
+from itertools import chain, compress, islice
+from datetime import date, datetime, timedelta
+from operator import attrgetter, sub
+from typing import Generator, Callable, Any, Dict, Iterable, List, Optional, Tuple, Type
+from concurrent.futures import Executor, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
 from enum import Enum
 import random
 import json
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# لا إعدادات logging عند الاستيراد - الواجهة النصية (main) تضبطها
+# الوحدات الثقيلة (asyncio، process pools، tempfile) تُستورد عند أول استخدام
 logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
 
 
 # ==================== DECORATORS ====================
 
+def hash_identifier(value: Any) -> str:
+    """التجزئة المعتمدة للمعرفات الحساسة (أول 16 خانة hex من SHA-256)"""
+    return hashlib.sha256(str(value).encode()).hexdigest()[:16]
+
+
+SENSITIVE_FIELDS = ('national_id', 'passport_number', 'phone')
+
+
 def privacy_compliance(func: Callable) -> Callable:
     """
     Decorator: تطبيق سياسات الخصوصية على البيانات الحساسة
@@ -47,12 +69,10 @@ def privacy_compliance(func: Callable) -> Callable:
         # تشفير البيانات الحساسة
         if args and isinstance(args[0], dict):
             data = args[0].copy()
-            sensitive_fields = ['national_id', 'passport_number', 'phone']
             
-            for field in sensitive_fields:
+            for field in SENSITIVE_FIELDS:
                 if field in data:
-                    original = data[field]
-                    data[field] = hashlib.sha256(str(original).encode()).hexdigest()[:16]
+                    data[field] = hash_identifier(data[field])
             
             return func(data, *args[1:], **kwargs)
         
@@ -61,6 +81,21 @@ def privacy_compliance(func: Callable) -> Callable:
     return wrapper
 
 
+def redact_records(records: List[Any]) -> List[Dict]:
+    """
+    تطبيق سياسة الخصوصية على دفعة كاملة مرة واحدة
+    (بديل privacy_compliance عند معالجة آلاف السجلات)
+    """
+    logger.info(f"🔒 Privacy check: batch of {len(records):,} records")
+    redacted = []
+    for record in records:
+        data = record.to_dict()
+        for field in SENSITIVE_FIELDS:
+            data[field] = hash_identifier(data[field])
+        redacted.append(data)
+    return redacted
+
+
 def performance_monitor(func: Callable) -> Callable:
     """
     Decorator: مراقبة أداء الدوال وتسجيل الوقت المستغرق
@@ -77,22 +112,211 @@ def performance_monitor(func: Callable) -> Callable:
     return wrapper
 
 
-def retry_on_failure(max_retries: int = 3, delay: float = 1.0):
+class CircuitOpenError(RuntimeError):
+    """الاستثناء المرفوع عند رفض الاستدعاء لأن قاطع الدائرة مفتوح"""
+
+
+class CircuitBreaker:
+    """
+    قاطع دائرة: يفشل فوراً عندما يكون المصدر معطلاً
+    closed -> open بعد failure_threshold إخفاقات متتالية،
+    open -> half_open بعد recovery_timeout ثانية (محاولة تجريبية واحدة)
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30.0,
+                 name: str = 'default'):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.name = name
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        # بداية المحاولة التجريبية الجارية في half_open (None = لا توجد)
+        self._trial_started: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _current_state(self, now: float) -> str:
+        """يُستدعى مع القفل"""
+        if self._state == self.OPEN and now - self._opened_at >= self.recovery_timeout:
+            self._state = self.HALF_OPEN
+            self._trial_started = None
+        return self._state
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def before_call(self):
+        """
+        التحقق قبل الاستدعاء - يرفع CircuitOpenError إذا كانت الدائرة مفتوحة،
+        أو إذا كانت half_open وهناك محاولة تجريبية جارية (يمر مستدعٍ واحد فقط)
+        المحاولة التي لا تُسجَّل نتيجتها تنتهي صلاحيتها بعد recovery_timeout
+        """
+        with self._lock:
+            now = time.monotonic()
+            state = self._current_state(now)
+            if state == self.OPEN:
+                raise CircuitOpenError(f"Circuit '{self.name}' is open")
+            if state == self.HALF_OPEN:
+                if (self._trial_started is not None
+                        and now - self._trial_started < self.recovery_timeout):
+                    raise CircuitOpenError(f"Circuit '{self.name}' is half-open with a trial call in flight")
+                self._trial_started = now
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._state = self.CLOSED
+            self._trial_started = None
+
+    def release_trial(self):
+        """إنهاء المحاولة التجريبية دون احتسابها (فشلت بخطأ لا يخص المصدر)"""
+        with self._lock:
+            self._trial_started = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_started = None
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning(f"🔌 Circuit '{self.name}' opened after {self._failures} failures")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class RetryBudget:
+    """
+    ميزانية إعادة المحاولة المشتركة (token bucket)
+    كل استدعاء ناجح يضيف ratio من الرصيد وكل إعادة محاولة تستهلك وحدة،
+    فلا تتضاعف الحمولة على مصدر متعثر عندما تعيد كل الخيوط المحاولة معاً
+    """
+
+    def __init__(self, ratio: float = 0.2, min_retries: int = 10):
+        self.ratio = ratio
+        self.max_tokens = float(min_retries)
+        self._tokens = float(min_retries)
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return True
+            return False
+
+
+def _backoff_delay(attempt: int, delay: float, backoff: float, max_delay: float,
+                   jitter: bool) -> float:
+    """حساب زمن الانتظار: exponential backoff مع full jitter"""
+    ceiling = min(max_delay, delay * (backoff ** attempt))
+    return random.uniform(0, ceiling) if jitter else ceiling
+
+
+def retry_on_failure(
+    max_retries: int = 3,
+    delay: float = 1.0,
+    backoff: float = 2.0,
+    max_delay: float = 30.0,
+    jitter: bool = True,
+    exceptions: Tuple[Type[BaseException], ...] = (Exception,),
+    deadline: Optional[float] = None,
+    budget: Optional[RetryBudget] = None,
+    circuit_breaker: Optional[CircuitBreaker] = None,
+):
     """
     Decorator: إعادة المحاولة عند الفشل (للعمليات الحرجة)
+    - exponential backoff مع jitter لتفادي إعادة المحاولة المتزامنة
+    - exceptions: أنواع الاستثناءات التي تستحق إعادة المحاولة فقط
+    - deadline: أقصى زمن كلي (بالثواني) لكل الاستدعاءات
+    - budget: ميزانية إعادة محاولة مشتركة بين الاستدعاءات
+    - circuit_breaker: يفشل فوراً عندما يكون المصدر معطلاً
+    يدعم دوال async تلقائياً باستخدام asyncio.sleep دون حجب حلقة الأحداث
     """
+    def next_delay(attempt: int, started: float, error: BaseException) -> Optional[float]:
+        """زمن الانتظار قبل المحاولة التالية، أو None إذا يجب التوقف"""
+        if attempt == max_retries - 1:
+            logger.error(f"❌ Failed after {max_retries} attempts: {error}")
+            return None
+        wait = _backoff_delay(attempt, delay, backoff, max_delay, jitter)
+        if deadline is not None and time.monotonic() - started + wait > deadline:
+            logger.error(f"❌ Retry deadline of {deadline}s exceeded: {error}")
+            return None
+        if budget is not None and not budget.withdraw():
+            logger.error(f"❌ Retry budget exhausted: {error}")
+            return None
+        logger.warning(f"⚠️  Attempt {attempt + 1} failed, retrying in {wait:.2f}s...")
+        return wait
+
+    def on_success():
+        if circuit_breaker is not None:
+            circuit_breaker.record_success()
+        if budget is not None:
+            budget.deposit()
+
+    def on_failure():
+        if circuit_breaker is not None:
+            circuit_breaker.record_failure()
+
+    def on_other_error():
+        # استثناء خارج exceptions (خطأ المستدعي): لا يُحسب على المصدر ولا يحجز المحاولة التجريبية
+        if circuit_breaker is not None:
+            circuit_breaker.release_trial()
+
     def decorator(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                started = time.monotonic()
+                for attempt in range(max_retries):
+                    if circuit_breaker is not None:
+                        circuit_breaker.before_call()
+                    try:
+                        result = await func(*args, **kwargs)
+                    except exceptions as e:
+                        on_failure()
+                        wait = next_delay(attempt, started, e)
+                        if wait is None:
+                            raise
+                        import asyncio
+                        await asyncio.sleep(wait)
+                    except BaseException:
+                        on_other_error()
+                        raise
+                    else:
+                        on_success()
+                        return result
+                return None
+            return async_wrapper
+
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
+            started = time.monotonic()
             for attempt in range(max_retries):
+                if circuit_breaker is not None:
+                    circuit_breaker.before_call()
                 try:
-                    return func(*args, **kwargs)
-                except Exception as e:
-                    if attempt == max_retries - 1:
-                        logger.error(f"❌ Failed after {max_retries} attempts: {e}")
+                    result = func(*args, **kwargs)
+                except exceptions as e:
+                    on_failure()
+                    wait = next_delay(attempt, started, e)
+                    if wait is None:
                         raise
-                    logger.warning(f"⚠️  Attempt {attempt + 1} failed, retrying...")
-                    time.sleep(delay)
+                    time.sleep(wait)
+                except BaseException:
+                    on_other_error()
+                    raise
+                else:
+                    on_success()
+                    return result
             return None
         return wrapper
     return decorator
@@ -126,6 +350,9 @@ def cache_results(ttl_seconds: int = 300):
 
 # ==================== ENUMS & DATA CLASSES ====================
 
+HEALTH_ATTENTION_STATUS = 'يحتاج متابعة'
+
+
 class PilgrimType(Enum):
     """نوع الزائر"""
     HAJJ = "حج"
@@ -144,6 +371,35 @@ class Nationality(Enum):
     OTHER = "أخرى"
 
 
+class _EpochDateField:
+    """
+    واصف حقل تاريخ: كل إسناد (في __init__ وبعده) يعيد حساب الساعة واليوم المشتقين
+    القيم تُحفظ في __dict__ بنفس الأسماء فتبقى قراءة الحقول المشتقة والـ pickle كما هي
+    """
+    def __init__(self, hour_field: str, day_field: str):
+        self.hour_field = hour_field
+        self.day_field = day_field
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            # لا قيمة افتراضية للحقل في الـ dataclass
+            raise AttributeError(self.name)
+        try:
+            return obj.__dict__[self.name]
+        except KeyError:
+            raise AttributeError(self.name) from None
+
+    def __set__(self, obj, value):
+        hour = to_epoch_hour(value)
+        state = obj.__dict__
+        state[self.name] = value
+        state[self.hour_field] = hour
+        state[self.day_field] = hour // 24
+
+
 @dataclass
 class PilgrimRecord:
     """سجل حاج أو معتمر"""
@@ -156,11 +412,16 @@ class PilgrimRecord:
     nationality: Nationality
     phone: str
     pilgrim_type: PilgrimType
-    arrival_date: datetime
-    departure_date: datetime
+    arrival_date: datetime = _EpochDateField('arrival_hour', 'arrival_day')
+    departure_date: datetime = _EpochDateField('departure_hour', 'departure_day')
     accommodation_id: str
     transport_id: str
     health_status: str
+    # ترميز التواريخ كأعداد صحيحة (أيام/ساعات منذ 1970-01-01) للتجميع السريع
+    arrival_day: int = field(init=False, repr=False, compare=False)
+    arrival_hour: int = field(init=False, repr=False, compare=False)
+    departure_day: int = field(init=False, repr=False, compare=False)
+    departure_hour: int = field(init=False, repr=False, compare=False)
     
     def to_dict(self) -> Dict:
         return {
@@ -179,297 +440,2925 @@ class PilgrimRecord:
             'transport_id': self.transport_id,
             'health_status': self.health_status
         }
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'PilgrimRecord':
+        """عكس to_dict (الجنسية والنوع بالقيم العربية، التواريخ بصيغة ISO)"""
+        return cls(
+            id=data['id'],
+            national_id=data['national_id'],
+            passport_number=data['passport_number'],
+            name=data['name'],
+            age=int(data['age']),
+            gender=data['gender'],
+            nationality=Nationality(data['nationality']),
+            phone=data['phone'],
+            pilgrim_type=PilgrimType(data['pilgrim_type']),
+            arrival_date=datetime.fromisoformat(data['arrival_date']),
+            departure_date=datetime.fromisoformat(data['departure_date']),
+            accommodation_id=data['accommodation_id'],
+            transport_id=data['transport_id'],
+            health_status=data['health_status']
+        )
 
 
-# ==================== GENERATORS ====================
+# ==================== CALENDAR ====================
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+# بداية التقويم الهجري (16 يوليو 622م) بترقيم R.D. المطابق لـ date.toordinal
+ISLAMIC_EPOCH_ORDINAL = 227015
+
+OUTSIDE_SEASON = 'خارج المواسم'
+
+# مراحل الموسم حسب (الشهر الهجري، اليوم)
+SEASON_PHASES = {
+    **{(12, d): 'العشر الأوائل' for d in range(1, 8)},
+    (12, 8): 'يوم التروية',
+    (12, 9): 'يوم عرفة',
+    (12, 10): 'يوم النحر',
+    **{(12, d): 'أيام التشريق' for d in range(11, 14)},
+    **{(9, d): 'رمضان' for d in range(1, 31)},
+}
+
+
+def to_epoch_hour(value: datetime) -> int:
+    """عدد الساعات منذ 1970-01-01 (بالتوقيت المحلي للسجل)"""
+    return (value.toordinal() - EPOCH_ORDINAL) * 24 + value.hour
+
+
+def epoch_day_to_date(day: int) -> date:
+    return date.fromordinal(day + EPOCH_ORDINAL)
+
+
+def epoch_hour_to_datetime(hour: int) -> datetime:
+    day, hour_of_day = divmod(hour, 24)
+    return datetime.fromordinal(day + EPOCH_ORDINAL).replace(hour=hour_of_day)
 
-def generate_synthetic_pilgrims(count: int) -> Generator[PilgrimRecord, None, None]:
+
+def _fixed_from_hijri(year: int, month: int, day: int) -> int:
+    return (day + 29 * (month - 1) + (6 * month - 1) // 11 + (year - 1) * 354
+            + (3 + 11 * year) // 30 + ISLAMIC_EPOCH_ORDINAL - 1)
+
+
+# بدايات أشهر أم القرى لموسم الحج (ذو الحجة ومحرم التالي) حيث يتأخر الحساب الجدولي
+# بيوم في معظم المواسم؛ يُضاف موسم جديد هنا عند اعتماد تقويمه
+UMM_AL_QURA_MONTH_STARTS = {
+    (1438, 12): date(2017, 8, 23), (1439, 1): date(2017, 9, 21),
+    (1439, 12): date(2018, 8, 12), (1440, 1): date(2018, 9, 11),
+    (1440, 12): date(2019, 8, 2), (1441, 1): date(2019, 8, 31),
+    (1441, 12): date(2020, 7, 22), (1442, 1): date(2020, 8, 20),
+    (1442, 12): date(2021, 7, 11), (1443, 1): date(2021, 8, 9),
+    (1443, 12): date(2022, 6, 30), (1444, 1): date(2022, 7, 30),
+    (1444, 12): date(2023, 6, 19), (1445, 1): date(2023, 7, 19),
+    (1445, 12): date(2024, 6, 7), (1446, 1): date(2024, 7, 7),
+    (1446, 12): date(2025, 5, 28), (1447, 1): date(2025, 6, 26),
+}
+_UMM_AL_QURA_ORDINALS = {key: value.toordinal() for key, value in UMM_AL_QURA_MONTH_STARTS.items()}
+
+
+def _hijri_month_start(year: int, month: int) -> int:
     """
-    Generator: توليد بيانات تجريبية للحجاج والمعتمرين
-    يستخدم Generator لتوفير الذاكرة عند معالجة ملايين السجلات
+    بداية الشهر من جدول أم القرى إن وُجدت، وإلا من الحساب الجدولي
+    (مع إبقاء الشهر الذي يلي شهراً مصححاً بين 29 و30 يوماً)
     """
-    logger.info(f"🔄 Generating {count} synthetic pilgrim records...")
-    
-    names = ["محمد", "أحمد", "فاطمة", "عائشة", "عبدالله", "سارة", "خالد", "مريم"]
-    
-    for i in range(count):
-        arrival = datetime.now() - timedelta(days=random.randint(1, 30))
-        departure = arrival + timedelta(days=random.randint(5, 15))
-        
-        record = PilgrimRecord(
-            id=f"PIL{i:08d}",
-            national_id=f"{random.randint(1000000000, 9999999999)}",
-            passport_number=f"P{random.randint(10000000, 99999999)}",
-            name=random.choice(names),
-            age=random.randint(18, 80),
-            gender=random.choice(["ذكر", "أنثى"]),
-            nationality=random.choice(list(Nationality)),
-            phone=f"+966{random.randint(500000000, 599999999)}",
-            pilgrim_type=random.choice(list(PilgrimType)),
-            arrival_date=arrival,
-            departure_date=departure,
-            accommodation_id=f"ACC{random.randint(1000, 9999)}",
-            transport_id=f"TRN{random.randint(100, 999)}",
-            health_status=random.choice(["جيد", "ممتاز", "يحتاج متابعة"])
-        )
-        
-        yield record
-        
-        # عرض التقدم كل 10000 سجل
-        if (i + 1) % 10000 == 0:
-            logger.info(f"  Generated {i + 1:,} records...")
+    start = _UMM_AL_QURA_ORDINALS.get((year, month))
+    if start is not None:
+        return start
+    start = _fixed_from_hijri(year, month, 1)
+    previous = _UMM_AL_QURA_ORDINALS.get((year - 1, 12) if month == 1 else (year, month - 1))
+    if previous is not None:
+        start = min(max(start, previous + 29), previous + 30)
+    return start
 
 
-def stream_time_series_analysis(
-    records: List[PilgrimRecord],
-    chunk_size: int = 1000
-) -> Generator[Dict[str, Any], None, None]:
+def hijri_from_ordinal(ordinal: int) -> Tuple[int, int, int]:
     """
-    Generator: تحليل البيانات الزمنية بشكل متدفق
-    معالجة البيانات على دفعات لتجنب استهلاك الذاكرة
+    التحويل إلى التقويم الهجري: الحساب الجدولي مع بدايات أشهر أم القرى المعتمدة
+    (UMM_AL_QURA_MONTH_STARTS)، فيوم عرفة يطابق التقويم الرسمي للمواسم المدرجة
+    الشهر يمتد حتى بداية الشهر التالي، فلا تتكرر التسميات عند حدود التصحيح
     """
-    logger.info("📊 Starting time-series analysis...")
-    
-    for i in range(0, len(records), chunk_size):
-        chunk = records[i:i + chunk_size]
-        
-        # تحليل الدفعة
-        analysis = {
-            'chunk_id': i // chunk_size + 1,
-            'chunk_size': len(chunk),
-            'date_range': {
-                'start': min(r.arrival_date for r in chunk).isoformat(),
-                'end': max(r.departure_date for r in chunk).isoformat()
-            },
-            'statistics': {
-                'total_pilgrims': len(chunk),
-                'avg_age': sum(r.age for r in chunk) / len(chunk),
-                'male_count': sum(1 for r in chunk if r.gender == "ذكر"),
-                'female_count': sum(1 for r in chunk if r.gender == "أنثى"),
-                'hajj_count': sum(1 for r in chunk if r.pilgrim_type == PilgrimType.HAJJ),
-                'umrah_count': sum(1 for r in chunk if r.pilgrim_type == PilgrimType.UMRAH),
-            }
-        }
-        
-        yield analysis
+    year = (30 * (ordinal - ISLAMIC_EPOCH_ORDINAL) + 10646) // 10631
+    prior_days = ordinal - _fixed_from_hijri(year, 1, 1)
+    month = (11 * prior_days + 330) // 325
+    # التصحيح لا يتجاوز يوماً أو يومين، فالشهر الفعلي هو الجدولي أو أحد جاريه
+    following = (year + 1, 1) if month == 12 else (year, month + 1)
+    preceding = (year - 1, 12) if month == 1 else (year, month - 1)
+    for y, m in (following, (year, month), preceding):
+        start = _hijri_month_start(y, m)
+        if start <= ordinal:
+            return y, m, ordinal - start + 1
+    return preceding[0], preceding[1], ordinal - _hijri_month_start(*preceding) + 1
 
 
-def filter_by_criteria(
-    records: Generator[PilgrimRecord, None, None],
-    criteria: Dict[str, Any]
-) -> Generator[PilgrimRecord, None, None]:
+class CalendarTable:
     """
-    Generator: تصفية السجلات حسب معايير محددة
+    جدول تقويم محسوب مسبقاً: رقم اليوم -> تاريخ ميلادي، تاريخ هجري، مرحلة الموسم
+    التجميع يتم على أرقام الأيام ثم يُترجم المفتاح بفهرسة قائمة فقط
     """
-    logger.info(f"🔍 Filtering records with criteria: {criteria}")
-    
-    for record in records:
-        match = True
-        
-        if 'nationality' in criteria:
-            match = match and record.nationality == criteria['nationality']
-        
-        if 'min_age' in criteria:
-            match = match and record.age >= criteria['min_age']
-        
-        if 'max_age' in criteria:
-            match = match and record.age <= criteria['max_age']
-        
-        if 'pilgrim_type' in criteria:
-            match = match and record.pilgrim_type == criteria['pilgrim_type']
-        
-        if match:
-            yield record
+    CALENDARS = ('gregorian', 'hijri', 'phase')
 
+    def __init__(self, first_day: int, last_day: int):
+        self.first_day = first_day
+        self.last_day = last_day
+        self.gregorian: List[str] = []
+        self.hijri: List[str] = []
+        self.phase: List[str] = []
+        for day in range(first_day, last_day + 1):
+            ordinal = day + EPOCH_ORDINAL
+            h_year, h_month, h_day = hijri_from_ordinal(ordinal)
+            self.gregorian.append(date.fromordinal(ordinal).isoformat())
+            self.hijri.append(f"{h_year:04d}-{h_month:02d}-{h_day:02d}")
+            self.phase.append(SEASON_PHASES.get((h_month, h_day), OUTSIDE_SEASON))
 
-# ==================== MULTITHREADING ====================
+    def covers(self, first_day: int, last_day: int) -> bool:
+        return self.first_day <= first_day and last_day <= self.last_day
 
-class DataAnalyzer:
-    """محلل البيانات مع دعم المعالجة المتوازية"""
-    
-    def __init__(self, max_workers: int = 4):
-        self.max_workers = max_workers
-        self.executor = ThreadPoolExecutor(max_workers=max_workers)
-    
-    @performance_monitor
-    def analyze_by_nationality(self, records: List[PilgrimRecord]) -> Dict[str, int]:
-        """تحليل التوزيع حسب الجنسية"""
-        logger.info("🌍 Analyzing nationality distribution...")
-        
-        nationality_count = {}
-        for record in records:
-            nat = record.nationality.value
-            nationality_count[nat] = nationality_count.get(nat, 0) + 1
-        
-        return nationality_count
-    
-    @performance_monitor
-    def analyze_age_groups(self, records: List[PilgrimRecord]) -> Dict[str, int]:
-        """تحليل التوزيع العمري"""
-        logger.info("👥 Analyzing age group distribution...")
-        
-        age_groups = {
-            '18-30': 0,
-            '31-45': 0,
-            '46-60': 0,
-            '60+': 0
-        }
-        
-        for record in records:
-            if record.age <= 30:
-                age_groups['18-30'] += 1
-            elif record.age <= 45:
-                age_groups['31-45'] += 1
-            elif record.age <= 60:
-                age_groups['46-60'] += 1
-            else:
-                age_groups['60+'] += 1
-        
-        return age_groups
-    
-    @performance_monitor
-    def analyze_peak_periods(self, records: List[PilgrimRecord]) -> Dict[str, int]:
-        """تحليل فترات الذروة"""
-        logger.info("📅 Analyzing peak periods...")
-        
-        daily_arrivals = {}
-        for record in records:
-            date_key = record.arrival_date.strftime('%Y-%m-%d')
-            daily_arrivals[date_key] = daily_arrivals.get(date_key, 0) + 1
-        
-        return daily_arrivals
-    
-    @performance_monitor
-    @privacy_compliance
-    def analyze_health_status(self, record: Dict) -> Dict[str, Any]:
-        """تحليل الحالة الصحية (مع حماية الخصوصية)"""
-        return {
-            'status': record.get('health_status', 'غير محدد'),
-            'requires_attention': record.get('health_status') == 'يحتاج متابعة'
-        }
-    
-    @performance_monitor
-    def parallel_comprehensive_analysis(
-        self,
-        records: List[PilgrimRecord]
-    ) -> Dict[str, Any]:
-        """
-        تحليل شامل متوازي باستخدام Multithreading
-        يقوم بتشغيل عدة تحليلات في نفس الوقت
-        """
-        logger.info(f"🚀 Starting parallel analysis with {self.max_workers} workers...")
-        
-        futures = {
-            'nationality': self.executor.submit(self.analyze_by_nationality, records),
-            'age_groups': self.executor.submit(self.analyze_age_groups, records),
-            'peak_periods': self.executor.submit(self.analyze_peak_periods, records)
-        }
-        
-        results = {}
-        for name, future in futures.items():
-            try:
-                results[name] = future.result()
-                logger.info(f"  ✅ {name} analysis completed")
-            except Exception as e:
-                logger.error(f"  ❌ {name} analysis failed: {e}")
-                results[name] = None
-        
-        return results
-    
-    def shutdown(self):
-        """إيقاف executor"""
-        self.executor.shutdown(wait=True)
+    def labels(self, calendar: str = 'gregorian') -> List[str]:
+        if calendar not in self.CALENDARS:
+            raise ValueError(f"Unknown calendar: {calendar}")
+        return getattr(self, calendar)
 
+    def label(self, day: int, calendar: str = 'gregorian') -> str:
+        return self.labels(calendar)[day - self.first_day]
 
-# ==================== MAIN APPLICATION ====================
+    def relabel(self, day_counts: Dict[int, int], calendar: str = 'gregorian') -> Dict[str, int]:
+        """تحويل عدّ بمفاتيح أرقام الأيام إلى مفاتيح التقويم المطلوب"""
+        labels = self.labels(calendar)
+        first = self.first_day
+        result: Dict[str, int] = {}
+        for day, count in day_counts.items():
+            key = labels[day - first]
+            result[key] = result.get(key, 0) + count
+        return result
 
-class HajjUmrahAnalyticsPlatform:
-    """المنصة الرئيسية لتحليل بيانات الحج والعمرة"""
-    
-    def __init__(self):
-        self.analyzer = DataAnalyzer(max_workers=4)
-        self.records: List[PilgrimRecord] = []
-    
-    @retry_on_failure(max_retries=3, delay=1.0)
-    @performance_monitor
-    def load_data(self, count: int = 50000):
-        """تحميل البيانات باستخدام Generator"""
-        logger.info(f"📥 Loading {count:,} pilgrim records...")
-        
-        # استخدام Generator لتوليد البيانات
-        generator = generate_synthetic_pilgrims(count)
-        self.records = list(generator)
-        
-        logger.info(f"✅ Successfully loaded {len(self.records):,} records")
-    
-    @cache_results(ttl_seconds=300)
-    @performance_monitor
-    def get_summary_statistics(self) -> Dict[str, Any]:
-        """الحصول على إحصائيات ملخصة"""
-        logger.info("📈 Calculating summary statistics...")
-        
-        total = len(self.records)
-        
-        return {
-            'total_pilgrims': total,
-            'hajj_pilgrims': sum(1 for r in self.records if r.pilgrim_type == PilgrimType.HAJJ),
-            'umrah_pilgrims': sum(1 for r in self.records if r.pilgrim_type == PilgrimType.UMRAH),
-            'average_age': sum(r.age for r in self.records) / total if total > 0 else 0,
-            'male_percentage': (sum(1 for r in self.records if r.gender == "ذكر") / total * 100) if total > 0 else 0,
-            'female_percentage': (sum(1 for r in self.records if r.gender == "أنثى") / total * 100) if total > 0 else 0,
-        }
-    
-    def stream_analysis(self, chunk_size: int = 5000):
-        """تحليل متدفق للبيانات الزمنية"""
-        logger.info("🌊 Starting streaming analysis...")
-        
-        for chunk_analysis in stream_time_series_analysis(self.records, chunk_size):
-            logger.info(f"  Chunk {chunk_analysis['chunk_id']}: {chunk_analysis['statistics']['total_pilgrims']} records")
-            yield chunk_analysis
-    
-    @performance_monitor
-    def run_comprehensive_analysis(self) -> Dict[str, Any]:
-        """تشغيل التحليل الشامل"""
-        logger.info("🎯 Running comprehensive analysis...")
-        
-        # التحليل المتوازي
-        parallel_results = self.analyzer.parallel_comprehensive_analysis(self.records)
-        
-        # الإحصائيات الملخصة
-        summary = self.get_summary_statistics()
-        
-        # دمج النتائج
-        report = {
-            'generated_at': datetime.now().isoformat(),
-            'summary': summary,
-            'detailed_analysis': parallel_results,
-            'top_nationalities': dict(
-                sorted(
-                    parallel_results.get('nationality', {}).items(),
-                    key=lambda x: x[1],
-                    reverse=True
-                )[:5]
-            ) if parallel_results.get('nationality') else {}
-        }
-        
-        return report
-    
-    def export_report(self, report: Dict[str, Any], filename: str = 'report.json'):
-        """تصدير التقرير"""
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(report, f, ensure_ascii=False, indent=2)
-        logger.info(f"📄 Report exported to {filename}")
-    
-    def cleanup(self):
-        """تنظيف الموارد"""
-        self.analyzer.shutdown()
+
+_calendar_table: Optional[CalendarTable] = None
+_calendar_lock = threading.Lock()
+# هامش التوسعة عند بناء الجدول لتفادي إعادة البناء المتكررة
+CALENDAR_MARGIN_DAYS = 400
+
+
+def get_calendar(first_day: int, last_day: int) -> CalendarTable:
+    """الجدول المشترك بعد توسيعه ليغطي المدى المطلوب عند الحاجة"""
+    global _calendar_table
+    table = _calendar_table
+    if table is not None and table.covers(first_day, last_day):
+        return table
+    with _calendar_lock:
+        table = _calendar_table
+        if table is None or not table.covers(first_day, last_day):
+            if table is not None:
+                first_day = min(first_day, table.first_day)
+                last_day = max(last_day, table.last_day)
+            table = _calendar_table = CalendarTable(
+                first_day - CALENDAR_MARGIN_DAYS, last_day + CALENDAR_MARGIN_DAYS
+            )
+        return table
+
+
+def relabel_days(day_counts: Dict[int, int], calendar: str = 'gregorian') -> Dict[str, int]:
+    """ترجمة عدّ الأيام عبر الجدول المشترك"""
+    if not day_counts:
+        return {}
+    table = get_calendar(min(day_counts), max(day_counts))
+    return table.relabel(day_counts, calendar)
+
+
+# ==================== INDEXING ====================
+
+def identity_key(value: Any) -> int:
+    """
+    مفتاح الفهرس المضغوط لمعرف حساس: نفس قيمة hash_identifier كعدد 64-bit
+    (int أصغر من نص hex بطول 16 في الذاكرة ويُقارن أسرع)
+    """
+    return int.from_bytes(hashlib.sha256(str(value).encode()).digest()[:8], 'big')
+
+
+_MISSING = object()
+
+
+class ShardedDict(MutableMapping):
+    """
+    قاموس مقسم إلى عدد ثابت من الـ shards حسب hash المفتاح، بنسخ copy-on-write لكل shard
+    copy() تنسخ قائمة المراجع فقط، وأول كتابة على shard تنسخه وحده
+    (نفس أسلوب PartitionedStore مع الـ partitions: كلفة الكتابة لا تتناسب مع حجم الفهرس)
+    القاموس المبني دفعة واحدة يبقى مسطحاً (بلا كلفة تقسيم) حتى أول كتابة عليه
+    """
+    SHARDS = 256
+    _MASK = SHARDS - 1
+
+    def __init__(self, items: Optional[Dict] = None):
+        # items يُتبنى كما هو دون نسخ ولا يُعدَّل بعد ذلك
+        self._flat: Optional[dict] = items or None
+        # shard فارغ مشترك يُنسخ عند أول كتابة
+        self._shards: List[dict] = [] if items else [{}] * self.SHARDS
+        self._owned: set = set()
+        self._len = len(items) if items else 0
+
+    def _shard(self, key: Any) -> dict:
+        if self._flat is not None:
+            return self._flat
+        return self._shards[hash(key) & self._MASK]
+
+    def _writable(self, key: Any) -> dict:
+        if self._flat is not None:
+            shards = [{} for _ in range(self.SHARDS)]
+            for item, value in self._flat.items():
+                shards[hash(item) & self._MASK][item] = value
+            self._shards, self._owned, self._flat = shards, set(range(self.SHARDS)), None
+        shard = hash(key) & self._MASK
+        if shard not in self._owned:
+            self._shards[shard] = dict(self._shards[shard])
+            self._owned.add(shard)
+        return self._shards[shard]
+
+    def copy(self) -> 'ShardedDict':
+        """نسخة تتشارك كل الـ shards مع الأصل (O(عدد الـ shards))"""
+        clone = ShardedDict()
+        clone._flat = self._flat
+        clone._shards = list(self._shards)
+        clone._len = self._len
+        self._owned = set()
+        return clone
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self):
+        if self._flat is not None:
+            return iter(self._flat)
+        return chain.from_iterable(self._shards)
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self._shard(key)
+
+    def __getitem__(self, key: Any) -> Any:
+        return self._shard(key)[key]
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        return self._shard(key).get(key, default)
+
+    def __setitem__(self, key: Any, value: Any):
+        shard = self._writable(key)
+        size = len(shard)
+        shard[key] = value
+        self._len += len(shard) - size
+
+    def __delitem__(self, key: Any):
+        if key not in self:
+            raise KeyError(key)
+        del self._writable(key)[key]
+        self._len -= 1
+
+    def pop(self, key: Any, default: Any = _MISSING) -> Any:
+        if key not in self:
+            if default is _MISSING:
+                raise KeyError(key)
+            return default
+        self._len -= 1
+        return self._writable(key).pop(key)
+
+    def setdefault(self, key: Any, default: Any = None) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            self[key] = value = default
+        return value
+
+    def __repr__(self) -> str:
+        return f"ShardedDict({dict(self.items())!r})"
+
+    def __reduce__(self):
+        # hash النصوص يختلف بين العمليات، فيُعاد التوزيع على الـ shards عند فك التسلسل
+        return ShardedDict, (dict(self.items()),)
+
+
+class BlockList(Sequence):
+    """
+    قائمة مقسمة إلى كتل ثابتة الحجم بنسخ copy-on-write لكل كتلة
+    copy() تنسخ قائمة الكتل فقط، والتعديل (تعيين، إلحاق، حذف الأخير) ينسخ كتلته وحدها
+    """
+    BLOCK_SIZE = 4096
+
+    def __init__(self, items: Iterable = ()):
+        items = list(items)
+        size = self.BLOCK_SIZE
+        self._blocks: List[list] = [items[i:i + size] for i in range(0, len(items), size)]
+        self._owned: set = set(range(len(self._blocks)))
+        self._len = len(items)
+
+    def _writable(self, block: int) -> list:
+        if block not in self._owned:
+            self._blocks[block] = list(self._blocks[block])
+            self._owned.add(block)
+        return self._blocks[block]
+
+    def copy(self) -> 'BlockList':
+        """نسخة تتشارك كل الكتل مع الأصل (O(عدد الكتل))"""
+        clone = BlockList()
+        clone._blocks = list(self._blocks)
+        clone._len = self._len
+        self._owned = set()
+        return clone
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self):
+        return chain.from_iterable(self._blocks)
+
+    def _position(self, item: int) -> Tuple[int, int]:
+        position = item + self._len if item < 0 else item
+        if not 0 <= position < self._len:
+            raise IndexError("record index out of range")
+        return divmod(position, self.BLOCK_SIZE)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            start, stop, step = item.indices(self._len)
+            if step < 0:
+                return list(self)[item]
+            if stop <= start:
+                return []
+            first = start // self.BLOCK_SIZE
+            offset = first * self.BLOCK_SIZE
+            return list(islice(chain.from_iterable(self._blocks[first:]),
+                               start - offset, stop - offset, step))
+        block, offset = self._position(item)
+        return self._blocks[block][offset]
+
+    def __setitem__(self, item: int, value: Any):
+        block, offset = self._position(item)
+        self._writable(block)[offset] = value
+
+    def append(self, value: Any):
+        if not self._blocks or len(self._blocks[-1]) == self.BLOCK_SIZE:
+            self._blocks.append([])
+            self._owned.add(len(self._blocks) - 1)
+        self._writable(len(self._blocks) - 1).append(value)
+        self._len += 1
+
+    def pop(self) -> Any:
+        """حذف العنصر الأخير وإعادته"""
+        if not self._len:
+            raise IndexError("pop from empty BlockList")
+        last = len(self._blocks) - 1
+        value = self._writable(last).pop()
+        if not self._blocks[last]:
+            self._blocks.pop()
+            self._owned.discard(last)
+        self._len -= 1
+        return value
+
+
+class PilgrimIndex:
+    """
+    فهرس أساسي على PilgrimRecord.id وفهارس هوية مجزأة على national_id و passport_number
+    - البحث والتحديث والحذف O(1)
+    - الفهارس لا تحتفظ بالقيم الأصلية للمعرفات الحساسة، فقط بمفاتيح مجزأة
+    - الحذف يستبدل السجل بآخر سجل في القائمة (swap-remove) لذلك لا يحفظ الترتيب
+    - عند التكرار يبقى أول سجل: المعرف المكرر يُرفض، والهوية تبقى مرتبطة بمالكها الأول
+    - القائمة والقواميس copy-on-write (BlockList و ShardedDict) لتكون النسخ لكل كتابة رخيصة
+    """
+    IDENTITY_FIELDS = ('national_id', 'passport_number')
+
+    def __init__(self, records: Optional[List['PilgrimRecord']] = None):
+        self.records: BlockList = BlockList()
+        self.primary: ShardedDict = ShardedDict()
+        self.identities: Dict[str, ShardedDict] = {f: ShardedDict() for f in self.IDENTITY_FIELDS}
+        if records is not None:
+            self.build(records)
+
+    def __len__(self) -> int:
+        return len(self.primary)
+
+    def copy(self) -> 'PilgrimIndex':
+        """
+        نسخة مستقلة تتشارك كتل القائمة والـ shards غير المعدلة مع الأصل
+        (كل كتابة لاحقة تنسخ الكتلة أو الـ shard الذي تلمسه فقط)
+        """
+        clone = PilgrimIndex()
+        clone.records = self.records.copy()
+        clone.primary = self.primary.copy()
+        clone.identities = {name: index.copy() for name, index in self.identities.items()}
+        return clone
+
+    def __contains__(self, record_id: str) -> bool:
+        return record_id in self.primary
+
+    def build(self, records: List['PilgrimRecord']) -> List[Dict[str, str]]:
+        """
+        بناء الفهارس دفعة واحدة (dict(zip(...)) بدل إدراج سجل بسجل)
+        يعيد قائمة التكرارات المكتشفة في المعرفات
+        السجلات ذات المعرف المكرر تُستبعد من self.records (يبقى أول ظهور)
+        """
+        ids = list(map(attrgetter('id'), records))
+        # المفاتيح بترتيب عكسي ليبقى أول ظهور عند التكرار
+        positions = dict(zip(reversed(ids), range(len(ids) - 1, -1, -1)))
+
+        duplicates: List[Dict[str, str]] = []
+        if len(positions) != len(ids):
+            duplicates.extend(self._collect_duplicates('id', ids, ids))
+            keep = sorted(positions.values())
+            records = [records[i] for i in keep]
+            ids = [ids[i] for i in keep]
+            positions = dict(zip(ids, range(len(ids))))
+        self.records = BlockList(records)
+        self.primary = ShardedDict(positions)
+
+        for name in self.IDENTITY_FIELDS:
+            keys = list(map(identity_key, map(attrgetter(name), records)))
+            index = dict(zip(reversed(keys), reversed(ids)))
+            if len(index) != len(keys):
+                duplicates.extend(self._collect_duplicates(name, keys, ids))
+            self.identities[name] = ShardedDict(index)
+
+        return duplicates
+
+    @staticmethod
+    def _collect_duplicates(name: str, keys: List[Any], ids: List[str]) -> List[Dict[str, str]]:
+        repeated = {key for key, n in Counter(keys).items() if n > 1}
+        first_seen: Dict[Any, int] = {}
+        duplicates = []
+        for position in [i for i, key in enumerate(keys) if key in repeated]:
+            first = first_seen.setdefault(keys[position], position)
+            if first != position:
+                duplicates.append({'field': name, 'record_id': ids[position], 'existing_id': ids[first]})
+        return duplicates
+
+    def get(self, record_id: str) -> Optional['PilgrimRecord']:
+        position = self.primary.get(record_id)
+        return None if position is None else self.records[position]
+
+    def get_many(self, record_ids: Iterable[str]) -> Dict[str, 'PilgrimRecord']:
+        """السجلات الموجودة لدفعة معرفات (المعرف -> السجل)"""
+        found = {}
+        for record_id in record_ids:
+            position = self.primary.get(record_id)
+            if position is not None:
+                found[record_id] = self.records[position]
+        return found
+
+    def find_by_identity(self, name: str, value: Any) -> Optional['PilgrimRecord']:
+        """البحث بالقيمة الأصلية للمعرف (تُجزأ قبل البحث)"""
+        record_id = self.identities[name].get(identity_key(value))
+        return None if record_id is None else self.get(record_id)
+
+    def identity_conflicts(self, record: 'PilgrimRecord') -> List[Dict[str, str]]:
+        """المعرفات المسجلة مسبقاً لسجل آخر"""
+        conflicts = []
+        for name in self.IDENTITY_FIELDS:
+            existing = self.identities[name].get(identity_key(getattr(record, name)))
+            if existing is not None and existing != record.id:
+                conflicts.append({'field': name, 'record_id': record.id, 'existing_id': existing})
+        return conflicts
+
+    def _link_identities(self, record: 'PilgrimRecord'):
+        """ربط هويات السجل دون الاستيلاء على هوية مسجلة لسجل آخر"""
+        for name in self.IDENTITY_FIELDS:
+            self.identities[name].setdefault(identity_key(getattr(record, name)), record.id)
+
+    def _unlink_identities(self, record: 'PilgrimRecord'):
+        for name in self.IDENTITY_FIELDS:
+            index = self.identities[name]
+            key = identity_key(getattr(record, name))
+            if index.get(key) == record.id:
+                del index[key]
+
+    def upsert(self, record: 'PilgrimRecord', existing: Any = _MISSING) -> bool:
+        """
+        إدراج أو تحديث سجل - يعيد True إذا كان السجل جديداً
+        existing: السجل الحالي إن حُلّ مسبقاً بـ get/get_many (لا يلزم هنا، البحث O(1))
+        """
+        position = self.primary.get(record.id)
+        if position is None:
+            self.primary[record.id] = len(self.records)
+            self.records.append(record)
+            inserted = True
+        else:
+            self._unlink_identities(self.records[position])
+            self.records[position] = record
+            inserted = False
+
+        self._link_identities(record)
+        return inserted
+
+    def delete(self, record_id: str, existing: Any = _MISSING) -> bool:
+        """حذف سجل - يعيد False إذا لم يكن موجوداً (existing كما في upsert)"""
+        position = self.primary.pop(record_id, None)
+        if position is None:
+            return False
+
+        self._unlink_identities(self.records[position])
+        last = self.records.pop()
+        if position < len(self.records):
+            self.records[position] = last
+            self.primary[last.id] = position
+        return True
+
+
+# ==================== PARTITIONED STORAGE ====================
+
+class PartitionStats:
+    """إحصائيات محسوبة مسبقاً لكل partition (تُحدَّث مع الإضافة والحذف)"""
+
+    def __init__(self):
+        self.count = 0
+        self.hajj = 0
+        self.age_sum = 0
+        self.male = 0
+        self.female = 0
+        self.daily_arrivals: Counter = Counter()
+        self.nationality: Counter = Counter()
+
+    def update(self, records: List['PilgrimRecord'], sign: int = 1):
+        """إضافة (sign=1) أو طرح (sign=-1) مجموعة سجلات"""
+        self.count += sign * len(records)
+        self.hajj += sign * sum(1 for r in records if r.pilgrim_type is PilgrimType.HAJJ)
+        self.age_sum += sign * sum(map(attrgetter('age'), records))
+        genders = Counter(map(attrgetter('gender'), records))
+        self.male += sign * genders.get("ذكر", 0)
+        self.female += sign * genders.get("أنثى", 0)
+        days = Counter(map(attrgetter('arrival_day'), records))
+        nationalities = Counter(map(attrgetter('nationality'), records))
+        if sign > 0:
+            self.daily_arrivals.update(days)
+            self.nationality.update(nationalities)
+        else:
+            self.daily_arrivals.subtract(days)
+            self.nationality.subtract(nationalities)
+            self.daily_arrivals += Counter()  # حذف المفاتيح الصفرية
+            self.nationality += Counter()
+
+    def merge(self, other: 'PartitionStats') -> 'PartitionStats':
+        self.count += other.count
+        self.hajj += other.hajj
+        self.age_sum += other.age_sum
+        self.male += other.male
+        self.female += other.female
+        self.daily_arrivals.update(other.daily_arrivals)
+        self.nationality.update(other.nationality)
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        """شكل قابل للتسلسل بـ JSON (لنقل الإحصائيات بين العقد)"""
+        return {
+            'count': self.count,
+            'hajj': self.hajj,
+            'age_sum': self.age_sum,
+            'male': self.male,
+            'female': self.female,
+            'daily_arrivals': list(self.daily_arrivals.items()),
+            'nationality': {nat.name: n for nat, n in self.nationality.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'PartitionStats':
+        stats = cls()
+        for name in ('count', 'hajj', 'age_sum', 'male', 'female'):
+            setattr(stats, name, data[name])
+        stats.daily_arrivals = Counter(dict(data['daily_arrivals']))
+        stats.nationality = Counter({Nationality[name]: n for name, n in data['nationality'].items()})
+        return stats
+
+    def to_summary(self) -> Dict[str, Any]:
+        """نفس شكل get_summary_statistics"""
+        total = self.count
+        return {
+            'total_pilgrims': total,
+            'hajj_pilgrims': self.hajj,
+            'umrah_pilgrims': total - self.hajj,
+            'average_age': self.age_sum / total if total > 0 else 0,
+            'male_percentage': (self.male / total * 100) if total > 0 else 0,
+            'female_percentage': (self.female / total * 100) if total > 0 else 0,
+        }
+
+
+_SEGMENT_STR_FIELDS = ('id', 'national_id', 'passport_number', 'name', 'gender', 'phone',
+                       'accommodation_id', 'transport_id', 'health_status')
+_NATIONALITIES = list(Nationality)
+_PILGRIM_TYPES = list(PilgrimType)
+_EPOCH_DATETIME = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def encode_segment(records: List['PilgrimRecord']) -> bytes:
+    """
+    ترميز مضغوط لدفعة سجلات على القرص: أعمدة بدل كائنات
+    (الأعمار والجنسيات والأنواع بايت واحد، التواريخ أعداد 64-bit، ثم zlib)
+    """
+    nationality_codes = {nat: i for i, nat in enumerate(_NATIONALITIES)}
+    type_codes = {kind: i for i, kind in enumerate(_PILGRIM_TYPES)}
+    columns = {name: list(map(attrgetter(name), records)) for name in _SEGMENT_STR_FIELDS}
+    columns['age'] = array('B', map(attrgetter('age'), records)).tobytes()
+    columns['nationality'] = bytes(nationality_codes[r.nationality] for r in records)
+    columns['pilgrim_type'] = bytes(type_codes[r.pilgrim_type] for r in records)
+    for name in ('arrival_date', 'departure_date'):
+        columns[name] = array('q', ((getattr(r, name) - _EPOCH_DATETIME) // _MICROSECOND
+                                    for r in records)).tobytes()
+    return zlib.compress(pickle.dumps(columns, protocol=pickle.HIGHEST_PROTOCOL), 1)
+
+
+def decode_segment(payload: bytes) -> List['PilgrimRecord']:
+    """فك ترميز encode_segment"""
+    return _segment_records(_segment_columns(payload))
+
+
+def decode_segment_ids(payload: bytes) -> List[str]:
+    """معرفات سجلات الـ segment فقط (دون بناء كائنات PilgrimRecord)"""
+    return _segment_columns(payload)['id']
+
+
+def _segment_columns(payload: bytes) -> Dict[str, Any]:
+    return pickle.loads(zlib.decompress(payload))
+
+
+def _segment_records(
+    columns: Dict[str, Any],
+    positions: Optional[List[int]] = None
+) -> List['PilgrimRecord']:
+    """بناء سجلات من أعمدة segment (كلها أو المواضع المحددة فقط)"""
+    ages = array('B')
+    ages.frombytes(columns['age'])
+    values = [columns[name] for name in _SEGMENT_STR_FIELDS]
+    values += [ages, columns['nationality'], columns['pilgrim_type']]
+    for name in ('arrival_date', 'departure_date'):
+        stamps = array('q')
+        stamps.frombytes(columns[name])
+        values.append(stamps)
+    if positions is not None:
+        values = [[column[i] for i in positions] for column in values]
+    return [
+        PilgrimRecord(
+            id=rid, national_id=nid, passport_number=passport, name=name, age=age,
+            gender=gender, nationality=_NATIONALITIES[nat], phone=phone,
+            pilgrim_type=_PILGRIM_TYPES[kind],
+            arrival_date=_EPOCH_DATETIME + timedelta(microseconds=arrival),
+            departure_date=_EPOCH_DATETIME + timedelta(microseconds=departure),
+            accommodation_id=acc, transport_id=trn, health_status=health,
+        )
+        for rid, nid, passport, name, gender, phone, acc, trn, health,
+            age, nat, kind, arrival, departure in zip(*values)
+    ]
+
+
+# عدد الـ partitions (في كل نسخ البيانات) التي تشير إلى كل ملف segment
+_SEGMENT_REFS: Counter = Counter()
+_SEGMENT_REFS_LOCK = threading.RLock()
+
+
+def _retain_segments(paths: List[str]):
+    with _SEGMENT_REFS_LOCK:
+        _SEGMENT_REFS.update(paths)
+
+
+def _release_segments(paths: List[str]):
+    """تحرير مراجع ملفات segments؛ الملف يُحذف حين لا تشير إليه أي partition"""
+    orphaned = []
+    with _SEGMENT_REFS_LOCK:
+        for path in paths:
+            _SEGMENT_REFS[path] -= 1
+            if _SEGMENT_REFS[path] <= 0:
+                del _SEGMENT_REFS[path]
+                orphaned.append(path)
+    for path in orphaned:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class Partition:
+    """
+    partition لمدى من أيام الوصول: سجلات مرتبة حسب ساعة الوصول مع فهرس للبحث الثنائي
+    السجلات إما في الذاكرة أو في segments مضغوطة على القرص، والإحصائيات تبقى في الذاكرة
+    """
+    # دمج الـ segments في ملف واحد عند تجاوز هذا العدد
+    MAX_SEGMENTS = 8
+
+    def __init__(self, first_day: int, days: int):
+        self.first_day = first_day
+        self.days = days
+        self.stats = PartitionStats()
+        self._records: List['PilgrimRecord'] = []
+        self._arrival_hours: List[int] = []
+        # ملفات الـ segments غير قابلة للتعديل وقد تتشاركها عدة نسخ من البيانات؛
+        # القائمة تُعدَّل في مكانها ليحرر finalizer مراجعها عند تحرير الـ partition
+        self.segments: List[str] = []
+        weakref.finalize(self, _release_segments, self.segments)
+        # المعرفات المحذوفة من كل segment (frozenset لكل ملف، تُستبدل ولا تُعدَّل)
+        self.tombstones: Dict[str, frozenset] = {}
+
+    @property
+    def last_day(self) -> int:
+        return self.first_day + self.days - 1
+
+    def clone(self) -> 'Partition':
+        """نسخة قابلة للتعديل تتشارك ملفات الـ segments مع الأصل (copy-on-write)"""
+        clone = Partition(self.first_day, self.days)
+        clone.stats = PartitionStats().merge(self.stats)
+        clone._records = list(self._records)
+        clone._arrival_hours = list(self._arrival_hours)
+        clone.segments.extend(self.segments)
+        _retain_segments(self.segments)
+        clone.tombstones = dict(self.tombstones)
+        return clone
+
+    @property
+    def is_evicted(self) -> bool:
+        """لا سجلات في الذاكرة وكل البيانات على القرص"""
+        return not self._records and bool(self.segments)
+
+    @property
+    def resident_count(self) -> int:
+        return len(self._records)
+
+    def __len__(self) -> int:
+        return self.stats.count
+
+    def _load(self) -> Tuple[List['PilgrimRecord'], List[int]]:
+        if not self.segments:
+            return self._records, self._arrival_hours
+        records = list(self._records)
+        for path in self.segments:
+            with open(path, 'rb') as f:
+                segment = decode_segment(f.read())
+            removed = self.tombstones.get(path)
+            if removed:
+                segment = [r for r in segment if r.id not in removed]
+            records.extend(segment)
+        records.sort(key=attrgetter('arrival_hour'))
+        return records, list(map(attrgetter('arrival_hour'), records))
+
+    @property
+    def records(self) -> List['PilgrimRecord']:
+        """كل سجلات الـ partition (الـ segments تُقرأ تسلسلياً دون إبقائها في الذاكرة)"""
+        return self._load()[0]
+
+    def add(self, records: List['PilgrimRecord']):
+        """
+        الإضافة إلى الجزء المقيم في الذاكرة فقط، دون قراءة الـ segments
+        الدفعات الصغيرة تُدرج بالبحث الثنائي، والكبيرة تُلحق ثم يُعاد الترتيب مرة واحدة
+        """
+        if len(records) * 8 < len(self._records):
+            for record in records:
+                hour = record.arrival_hour
+                position = bisect_right(self._arrival_hours, hour)
+                self._arrival_hours.insert(position, hour)
+                self._records.insert(position, record)
+        else:
+            self._records.extend(records)
+            self._records.sort(key=attrgetter('arrival_hour'))
+            self._arrival_hours = list(map(attrgetter('arrival_hour'), self._records))
+        self.stats.update(records)
+
+    def remove(self, record: 'PilgrimRecord') -> bool:
+        return self.remove_many([record]) == 1
+
+    def remove_many(self, records: List['PilgrimRecord']) -> int:
+        """
+        حذف من الجزء المقيم بالبحث الثنائي، والبقية بعلامات حذف على الـ segments التي تحويها
+        معرفات كل segment تُقرأ مرة واحدة للدفعة كلها (الـ segments لا تُعاد إلى الذاكرة
+        ولا تُعدَّل ملفاتها) - يعيد عدد السجلات المحذوفة
+        """
+        pending = {r.id: r for r in records if not self._remove_resident(r)}
+        removed = len(records) - len(pending)
+        for path in self.segments:
+            if not pending:
+                break
+            removed_ids = self.tombstones.get(path, frozenset())
+            with open(path, 'rb') as f:
+                ids = decode_segment_ids(f.read())
+            hits = [pending.pop(rid) for rid in ids if rid in pending and rid not in removed_ids]
+            if hits:
+                self.tombstones[path] = removed_ids.union(map(attrgetter('id'), hits))
+                self.stats.update(hits, sign=-1)
+                removed += len(hits)
+        return removed
+
+    def _remove_resident(self, record: 'PilgrimRecord') -> bool:
+        position = bisect_left(self._arrival_hours, record.arrival_hour)
+        while position < len(self._records) and self._arrival_hours[position] == record.arrival_hour:
+            if self._records[position].id == record.id:
+                removed = self._records.pop(position)
+                del self._arrival_hours[position]
+                self.stats.update([removed], sign=-1)
+                return True
+            position += 1
+        return False
+
+    def find(self, record_id: str) -> Optional['PilgrimRecord']:
+        return self.find_many([record_id]).get(record_id)
+
+    def find_many(self, record_ids: Iterable[str]) -> Dict[str, 'PilgrimRecord']:
+        """
+        البحث عن عدة معرفات بقراءة واحدة: الجزء المقيم ثم كل segment مرة واحدة على الأكثر
+        (تُبنى كائنات السجلات المطلوبة فقط، دون ترتيب الـ partition)
+        """
+        wanted = set(record_ids)
+        found = {r.id: r for r in self._records if r.id in wanted}
+        for path in self.segments:
+            if len(found) == len(wanted):
+                break
+            removed_ids = self.tombstones.get(path, frozenset())
+            with open(path, 'rb') as f:
+                columns = _segment_columns(f.read())
+            positions = [i for i, rid in enumerate(columns['id'])
+                         if rid in wanted and rid not in removed_ids]
+            if positions:
+                found.update((r.id, r) for r in _segment_records(columns, positions))
+        return found
+
+    def range(self, start_hour: Optional[int], end_hour: Optional[int]) -> List['PilgrimRecord']:
+        """السجلات ذات ساعة وصول ضمن [start_hour, end_hour) بالبحث الثنائي"""
+        records, hours = self._load()
+        lo = 0 if start_hour is None else bisect_left(hours, start_hour)
+        hi = len(hours) if end_hour is None else bisect_left(hours, end_hour)
+        return records[lo:hi]
+
+    def evict(self, directory: str) -> List[str]:
+        """كتابة السجلات المقيمة كـ segment مضغوط وتحرير الذاكرة"""
+        if not self._records:
+            return self.segments
+        if len(self.segments) >= self.MAX_SEGMENTS:
+            self._records, self._arrival_hours = self._load()
+            self._drop_segments()
+        path = os.path.join(directory, f"partition_{self.first_day}_{os.urandom(6).hex()}.seg")
+        with open(path, 'wb') as f:
+            f.write(encode_segment(self._records))
+        self.segments.append(path)
+        _retain_segments([path])
+        self._records = []
+        self._arrival_hours = []
+        return self.segments
+
+    def restore(self):
+        """إعادة الـ segments إلى الذاكرة (الملفات تبقى لمن يتشاركها وتُحذف إن لم يبقَ أحد)"""
+        if self.segments:
+            self._records, self._arrival_hours = self._load()
+            self._drop_segments()
+
+    def _drop_segments(self):
+        _release_segments(self.segments)
+        self.segments.clear()
+        self.tombstones = {}
+
+
+def _hour_bound(value: Optional[datetime], end: bool = False) -> Optional[int]:
+    """حد المدى كساعة منذ 1970: بداية شاملة أو نهاية حصرية"""
+    if value is None:
+        return None
+    hour = to_epoch_hour(value)
+    if end and (value.minute or value.second or value.microsecond):
+        hour += 1
+    return hour
+
+
+class PartitionedStore:
+    """
+    تخزين السجلات مقسمة حسب يوم الوصول (أو عدة أيام عبر granularity_days)
+    استعلامات المدى الزمني تتخطى الـ partitions غير المعنية وتبحث ثنائياً داخل الحدود
+    """
+
+    def __init__(self, granularity_days: int = 1, spill_dir: Optional[str] = None):
+        if granularity_days < 1:
+            raise ValueError("granularity_days must be >= 1")
+        self.granularity_days = granularity_days
+        self.spill_dir = spill_dir
+        self.partitions: Dict[int, Partition] = {}
+        self._keys: List[int] = []
+        # الـ partitions التي أنشأها هذا المخزن؛ غيرها مشترك مع نسخ أخرى ويُنسخ قبل التعديل
+        self._owned: set = set()
+
+    def __len__(self) -> int:
+        return sum(len(p) for p in self.partitions.values())
+
+    def __iter__(self):
+        for records in self.chunks():
+            yield from records
+
+    def _partition_key(self, day: int) -> int:
+        return day - day % self.granularity_days
+
+    def _partition(self, key: int) -> Partition:
+        """الـ partition القابلة للتعديل لهذا المفتاح (تُنشأ أو تُنسخ عند الحاجة)"""
+        partition = self.partitions.get(key)
+        if partition is None:
+            partition = self.partitions[key] = Partition(key, self.granularity_days)
+            insort(self._keys, key)
+        elif key not in self._owned:
+            partition = self.partitions[key] = partition.clone()
+        self._owned.add(key)
+        return partition
+
+    def copy(self) -> 'PartitionedStore':
+        """
+        نسخة جديدة تتشارك كل الـ partitions مع الأصل (O(عدد الـ partitions))
+        وتنسخ الـ partition فقط عند أول تعديل عليها
+        """
+        clone = PartitionedStore(self.granularity_days, self.spill_dir)
+        clone.partitions = dict(self.partitions)
+        clone._keys = list(self._keys)
+        self._owned = set()
+        return clone
+
+    def add(self, records: Iterable['PilgrimRecord']):
+        """إضافة سجلات (تُجمع حسب الـ partition ثم تُرتب مرة واحدة لكل partition)"""
+        groups: Dict[int, List['PilgrimRecord']] = {}
+        granularity = self.granularity_days
+        for record in records:
+            day = record.arrival_day
+            groups.setdefault(day - day % granularity, []).append(record)
+        for key, group in groups.items():
+            self._partition(key).add(group)
+
+    def remove(self, record: 'PilgrimRecord') -> bool:
+        return self.remove_many([record]) == 1
+
+    def remove_many(self, records: Iterable['PilgrimRecord']) -> int:
+        """حذف دفعة (تُجمع حسب الـ partition فتُقرأ كل partition مرة واحدة) - يعيد عدد المحذوف"""
+        groups: Dict[int, List['PilgrimRecord']] = {}
+        for record in records:
+            groups.setdefault(self._partition_key(record.arrival_day), []).append(record)
+        return sum(self._partition(key).remove_many(group)
+                   for key, group in groups.items() if key in self.partitions)
+
+    def partitions_between(self, start_day: Optional[int] = None,
+                           end_day: Optional[int] = None) -> List[Partition]:
+        """الـ partitions المتقاطعة مع [start_day, end_day] (تقليم بالبحث الثنائي)"""
+        lo = 0 if start_day is None else bisect_left(self._keys, self._partition_key(start_day))
+        hi = len(self._keys) if end_day is None else bisect_right(self._keys, end_day)
+        return [self.partitions[key] for key in self._keys[lo:hi]]
+
+    def range(self, start: Optional[datetime] = None,
+              end: Optional[datetime] = None) -> Generator['PilgrimRecord', None, None]:
+        """
+        Generator: السجلات ذات تاريخ وصول في [start, end) بدقة الساعة
+        (للدقة الكاملة تُطبق filter_by_criteria المقارنة النهائية)
+        """
+        start_hour = _hour_bound(start)
+        end_hour = _hour_bound(end, end=True)
+        start_day = None if start_hour is None else start_hour // 24
+        end_day = None if end_hour is None else (end_hour - 1) // 24
+        for partition in self.partitions_between(start_day, end_day):
+            inner_start = start_hour if start_hour is not None and start_hour > partition.first_day * 24 else None
+            inner_end = end_hour if end_hour is not None and end_hour <= partition.last_day * 24 + 23 else None
+            yield from partition.range(inner_start, inner_end)
+
+    def daily_arrivals(self, start_day: Optional[int] = None,
+                       end_day: Optional[int] = None) -> Dict[int, int]:
+        """عدد الوصول اليومي من الإحصائيات المحسوبة مسبقاً (دون قراءة السجلات)"""
+        result: Dict[int, int] = {}
+        for partition in self.partitions_between(start_day, end_day):
+            for day, count in partition.stats.daily_arrivals.items():
+                if (start_day is None or day >= start_day) and (end_day is None or day <= end_day):
+                    result[day] = count
+        return dict(sorted(result.items()))
+
+    def stats(self) -> PartitionStats:
+        """الإحصائيات المجمعة لكل الـ partitions"""
+        total = PartitionStats()
+        for partition in self.partitions.values():
+            total.merge(partition.stats)
+        return total
+
+    def find(self, record_id: str) -> Optional['PilgrimRecord']:
+        """بحث تسلسلي عبر الـ partitions (عندما لا يتوفر فهرس في الذاكرة)"""
+        for key in self._keys:
+            record = self.partitions[key].find(record_id)
+            if record is not None:
+                return record
+        return None
+
+    def chunks(self) -> Generator[List['PilgrimRecord'], None, None]:
+        """Generator: سجلات كل partition كدفعة واحدة بالترتيب (قراءة تسلسلية)"""
+        for key in self._keys:
+            records = self.partitions[key].records
+            if records:
+                yield records
+
+    @property
+    def resident_count(self) -> int:
+        return sum(p.resident_count for p in self.partitions.values())
+
+    def _ensure_spill_dir(self) -> str:
+        if self.spill_dir is None:
+            import tempfile
+            self.spill_dir = tempfile.mkdtemp(prefix='hajj_partitions_')
+        return self.spill_dir
+
+    def enforce_budget(self, max_resident: int) -> int:
+        """
+        إخلاء أقدم الـ partitions إلى القرص حتى لا يتجاوز عدد السجلات المقيمة max_resident
+        (حد صارم: تُخلى أحدث partition أيضاً إن بقي التجاوز) - يعيد عدد السجلات المُخلاة
+        """
+        resident = self.resident_count
+        spilled = 0
+        for key in list(self._keys):
+            if resident <= max_resident:
+                break
+            count = self.partitions[key].resident_count
+            if count:
+                self._partition(key).evict(self._ensure_spill_dir())
+                resident -= count
+                spilled += count
+        return spilled
+
+    def evict_before(self, day: int) -> List[Partition]:
+        """إخلاء الـ partitions التي تنتهي قبل اليوم المحدد إلى القرص"""
+        evicted = []
+        for partition in self.partitions_between(None, day - 1):
+            if partition.last_day < day and partition.resident_count:
+                partition = self._partition(partition.first_day)
+                partition.evict(self._ensure_spill_dir())
+                evicted.append(partition)
+        logger.info(f"💾 Evicted {len(evicted)} partitions to {self.spill_dir}")
+        return evicted
+
+
+class SegmentedRecords(Sequence):
+    """
+    عرض للقراءة فقط لكل سجلات PartitionedStore (في الذاكرة وعلى القرص)
+    يحل محل قائمة records في وضع الذاكرة المحدودة: التكرار يقرأ الـ partitions تسلسلياً
+    والتقطيع يتخطى الـ partitions السابقة بالاعتماد على أعدادها دون قراءتها
+    """
+
+    def __init__(self, store: PartitionedStore):
+        self.store = store
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def __iter__(self):
+        return iter(self.store)
+
+    def chunks(self) -> Generator[List['PilgrimRecord'], None, None]:
+        return self.store.chunks()
+
+    def _iter_from(self, start: int):
+        for key in self.store._keys:
+            partition = self.store.partitions[key]
+            if start >= len(partition):
+                start -= len(partition)
+                continue
+            yield from partition.records[start:]
+            start = 0
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            start, stop, step = item.indices(len(self))
+            if step < 0:
+                return list(self)[item]
+            return list(islice(self._iter_from(start), 0, max(0, stop - start), step))
+        position = item + len(self) if item < 0 else item
+        if position < 0:
+            raise IndexError("record index out of range")
+        for record in self._iter_from(position):
+            return record
+        raise IndexError("record index out of range")
+
+
+class PartitionLocatorIndex(PilgrimIndex):
+    """
+    فهرس وضع الذاكرة المحدودة: المعرف -> مفتاح الـ partition بدل موضع السجل
+    لا يحتفظ بمراجع للسجلات، فالبحث بالمعرف يقرأ partition واحدة فقط
+    """
+
+    def __init__(self, store: PartitionedStore):
+        super().__init__()
+        self.store = store
+        self.partition_of: ShardedDict = self.primary
+
+    @classmethod
+    def from_index(cls, index: PilgrimIndex, store: PartitionedStore) -> 'PartitionLocatorIndex':
+        """تحويل فهرس الذاكرة الكاملة (بعد إخلاء partitions منه) مع الإبقاء على فهارس الهوية"""
+        locator = cls(store)
+        records = index.records
+        locator.primary = locator.partition_of = ShardedDict(dict(zip(
+            map(attrgetter('id'), records),
+            map(store._partition_key, map(attrgetter('arrival_day'), records))
+        )))
+        locator.identities = {name: ids.copy() for name, ids in index.identities.items()}
+        return locator
+
+    def copy(self, store: Optional[PartitionedStore] = None) -> 'PartitionLocatorIndex':
+        clone = PartitionLocatorIndex(store or self.store)
+        clone.primary = clone.partition_of = self.primary.copy()
+        clone.identities = {name: index.copy() for name, index in self.identities.items()}
+        return clone
+
+    def add_chunk(
+        self,
+        records: List['PilgrimRecord']
+    ) -> Tuple[List['PilgrimRecord'], List[Dict[str, str]]]:
+        """
+        تسجيل دفعة أثناء الاستيعاب
+        يعيد السجلات المقبولة (دون المعرفات المكررة) وتكرارات المعرفات المكتشفة
+        """
+        accepted, duplicates = [], []
+        for record in records:
+            if record.id in self.partition_of:
+                duplicates.append({'field': 'id', 'record_id': record.id, 'existing_id': record.id})
+                continue
+            duplicates.extend(self.identity_conflicts(record))
+            self._register(record)
+            accepted.append(record)
+        return accepted, duplicates
+
+    def _register(self, record: 'PilgrimRecord'):
+        self.partition_of[record.id] = self.store._partition_key(record.arrival_day)
+        self._link_identities(record)
+
+    def get(self, record_id: str) -> Optional['PilgrimRecord']:
+        key = self.partition_of.get(record_id)
+        if key is None:
+            return None
+        return self.store.partitions[key].find(record_id)
+
+    def get_many(self, record_ids: Iterable[str]) -> Dict[str, 'PilgrimRecord']:
+        """المعرفات تُجمع حسب الـ partition فتُقرأ كل partition معنية مرة واحدة"""
+        groups: Dict[int, List[str]] = {}
+        for record_id in record_ids:
+            key = self.partition_of.get(record_id)
+            if key is not None:
+                groups.setdefault(key, []).append(record_id)
+        found: Dict[str, 'PilgrimRecord'] = {}
+        for key, ids in groups.items():
+            found.update(self.store.partitions[key].find_many(ids))
+        return found
+
+    def upsert(self, record: 'PilgrimRecord', existing: Any = _MISSING) -> bool:
+        if existing is _MISSING:
+            existing = self.get(record.id)
+        if existing is not None:
+            self._unlink_identities(existing)
+        self._register(record)
+        return existing is None
+
+    def delete(self, record_id: str, existing: Any = _MISSING) -> bool:
+        if existing is _MISSING:
+            existing = self.get(record_id)
+        if existing is None:
+            return False
+        self._unlink_identities(existing)
+        del self.partition_of[record_id]
+        return True
+
+
+# ==================== GENERATORS ====================
+
+def generate_synthetic_pilgrims(
+    count: int,
+    seed: Optional[int] = None,
+    reference: Optional[datetime] = None
+) -> Generator[PilgrimRecord, None, None]:
+    """
+    Generator: توليد بيانات تجريبية للحجاج والمعتمرين
+    يستخدم Generator لتوفير الذاكرة عند معالجة ملايين السجلات
+    seed و reference (تاريخ المرجع) يجعلان البيانات قابلة لإعادة الإنتاج
+    """
+    logger.info(f"🔄 Generating {count} synthetic pilgrim records...")
+    
+    rng = random.Random(seed)
+    reference = reference or datetime.now()
+    names = ["محمد", "أحمد", "فاطمة", "عائشة", "عبدالله", "سارة", "خالد", "مريم"]
+    genders = ["ذكر", "أنثى"]
+    nationalities = list(Nationality)
+    pilgrim_types = list(PilgrimType)
+    health_statuses = ["جيد", "ممتاز", HEALTH_ATTENTION_STATUS]
+    
+    for i in range(count):
+        # الوصول موزع على أيام وساعات الشهر السابق لتاريخ المرجع
+        arrival = reference - timedelta(days=rng.randint(1, 30), seconds=rng.uniform(0, 86400))
+        departure = arrival + timedelta(days=rng.randint(5, 15))
+        
+        record = PilgrimRecord(
+            id=f"PIL{i:08d}",
+            national_id=f"{rng.randint(1000000000, 9999999999)}",
+            passport_number=f"P{rng.randint(10000000, 99999999)}",
+            name=rng.choice(names),
+            age=rng.randint(18, 80),
+            gender=rng.choice(genders),
+            nationality=rng.choice(nationalities),
+            phone=f"+966{rng.randint(500000000, 599999999)}",
+            pilgrim_type=rng.choice(pilgrim_types),
+            arrival_date=arrival,
+            departure_date=departure,
+            accommodation_id=f"ACC{rng.randint(1000, 9999)}",
+            transport_id=f"TRN{rng.randint(100, 999)}",
+            health_status=rng.choice(health_statuses)
+        )
+        
+        yield record
+        
+        # عرض التقدم كل 10000 سجل
+        if (i + 1) % 10000 == 0:
+            logger.info(f"  Generated {i + 1:,} records...")
+
+
+def stream_time_series_analysis(
+    records: Iterable[PilgrimRecord],
+    chunk_size: int = 1000
+) -> Generator[Dict[str, Any], None, None]:
+    """
+    Generator: تحليل البيانات الزمنية بشكل متدفق
+    معالجة البيانات على دفعات لتجنب استهلاك الذاكرة
+    يقبل قائمة أو أي iterable (مثل PartitionedStore.range)
+    """
+    logger.info("📊 Starting time-series analysis...")
+    
+    iterator = iter(records)
+    chunk_id = 0
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            break
+        chunk_id += 1
+        start = min(map(attrgetter('arrival_date'), chunk))
+        end = max(map(attrgetter('departure_date'), chunk))
+        first_day = start.toordinal() - EPOCH_ORDINAL
+        last_day = end.toordinal() - EPOCH_ORDINAL
+        calendar = get_calendar(first_day, last_day)
+        
+        # تحليل الدفعة
+        analysis = {
+            'chunk_id': chunk_id,
+            'chunk_size': len(chunk),
+            'date_range': {
+                'start': start.isoformat(),
+                'end': end.isoformat()
+            },
+            'hijri_range': {
+                'start': calendar.label(first_day, 'hijri'),
+                'end': calendar.label(last_day, 'hijri')
+            },
+            'statistics': {
+                'total_pilgrims': len(chunk),
+                'avg_age': sum(r.age for r in chunk) / len(chunk),
+                'male_count': sum(1 for r in chunk if r.gender == "ذكر"),
+                'female_count': sum(1 for r in chunk if r.gender == "أنثى"),
+                'hajj_count': sum(1 for r in chunk if r.pilgrim_type == PilgrimType.HAJJ),
+                'umrah_count': sum(1 for r in chunk if r.pilgrim_type == PilgrimType.UMRAH),
+            }
+        }
+        
+        yield analysis
+
+
+def filter_by_criteria(
+    records: Iterable[PilgrimRecord],
+    criteria: Dict[str, Any]
+) -> Generator[PilgrimRecord, None, None]:
+    """
+    Generator: تصفية السجلات حسب معايير محددة
+    arrival_from / arrival_to: مدى تاريخ الوصول [from, to)
+    مع PartitionedStore تُتخطى الـ partitions خارج المدى دون قراءتها
+    """
+    logger.info(f"🔍 Filtering records with criteria: {criteria}")
+    
+    arrival_from = criteria.get('arrival_from')
+    arrival_to = criteria.get('arrival_to')
+    if isinstance(records, PartitionedStore):
+        records = records.range(arrival_from, arrival_to)
+    
+    for record in records:
+        match = True
+        
+        if 'nationality' in criteria:
+            match = match and record.nationality == criteria['nationality']
+        
+        if 'min_age' in criteria:
+            match = match and record.age >= criteria['min_age']
+        
+        if 'max_age' in criteria:
+            match = match and record.age <= criteria['max_age']
+        
+        if 'pilgrim_type' in criteria:
+            match = match and record.pilgrim_type == criteria['pilgrim_type']
+        
+        if arrival_from is not None:
+            match = match and record.arrival_date >= arrival_from
+        
+        if arrival_to is not None:
+            match = match and record.arrival_date < arrival_to
+        
+        if match:
+            yield record
+
+
+# ==================== EXECUTION PLANNING ====================
+
+class SharedWorkerPool:
+    """
+    مجمع عمال مشترك (threads أو processes) بين كل المحللات
+    يُنشأ الـ executor عند أول acquire ويُغلق عند تحرير آخر مستخدم
+    """
+    _registry: Dict[Tuple[str, int], 'SharedWorkerPool'] = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, kind: str, max_workers: int):
+        if kind not in ('thread', 'process'):
+            raise ValueError(f"Unknown pool kind: {kind}")
+        self.kind = kind
+        self.max_workers = max_workers
+        self._executor: Optional[Executor] = None
+        self._users = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get(cls, kind: str = 'thread', max_workers: Optional[int] = None) -> 'SharedWorkerPool':
+        """الحصول على المجمع المشترك لهذا النوع والحجم"""
+        workers = max_workers or os.cpu_count() or 1
+        with cls._registry_lock:
+            pool = cls._registry.get((kind, workers))
+            if pool is None:
+                pool = cls._registry[(kind, workers)] = cls(kind, workers)
+            return pool
+
+    @property
+    def is_running(self) -> bool:
+        return self._executor is not None
+
+    @property
+    def executor(self) -> Optional[Executor]:
+        return self._executor
+
+    def acquire(self) -> Executor:
+        """حجز المجمع وإنشاء الـ executor عند الحاجة"""
+        with self._lock:
+            if self._executor is None:
+                logger.info(f"🧵 Starting shared {self.kind} pool with {self.max_workers} workers")
+                if self.kind == 'thread':
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+                else:
+                    from concurrent.futures import ProcessPoolExecutor
+                    self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            self._users += 1
+            return self._executor
+
+    def release(self):
+        """تحرير المجمع - يُغلق الـ executor عند خروج آخر مستخدم"""
+        with self._lock:
+            if self._users == 0:
+                return
+            self._users -= 1
+            if self._users == 0 and self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+    def __enter__(self) -> Executor:
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+
+AGE_GROUPS = ('18-30', '31-45', '46-60', '60+')
+
+
+def _age_group_label(age: int) -> str:
+    if age <= 30:
+        return '18-30'
+    if age <= 45:
+        return '31-45'
+    if age <= 60:
+        return '46-60'
+    return '60+'
+
+
+def _vectorized_counts(records: List['PilgrimRecord']) -> Dict[str, Counter]:
+    """
+    عدّ عمودي: استخراج كل عمود بـ map وعدّه بـ Counter (حلقات C)
+    النتائج بمفاتيح خام قابلة للدمج بين الدفعات والعمليات
+    """
+    return {
+        'nationality': Counter(map(attrgetter('nationality'), records)),
+        'age': Counter(map(attrgetter('age'), records)),
+        'arrival_day': Counter(map(attrgetter('arrival_day'), records)),
+    }
+
+
+def _merge_counts(parts: List[Dict[str, Counter]]) -> Dict[str, Counter]:
+    merged: Dict[str, Counter] = {}
+    for part in parts:
+        for name, counts in part.items():
+            merged.setdefault(name, Counter()).update(counts)
+    return merged
+
+
+def _finalize_counts(counts: Dict[str, Counter], calendar: str = 'gregorian') -> Dict[str, Dict]:
+    """تحويل العدّ الخام إلى نفس شكل نتائج DataAnalyzer.analyze_*"""
+    age_groups = dict.fromkeys(AGE_GROUPS, 0)
+    for age, n in counts.get('age', {}).items():
+        age_groups[_age_group_label(age)] += n
+    return {
+        'nationality': {nat.value: n for nat, n in counts.get('nationality', {}).items()},
+        'age_groups': age_groups,
+        'peak_periods': relabel_days(counts.get('arrival_day', {}), calendar),
+    }
+
+
+# خانات مدة الإقامة بالأيام (ليالٍ): 0..STAY_HISTOGRAM_DAYS-1 ثم خانة "STAY_HISTOGRAM_DAYS+"
+STAY_HISTOGRAM_DAYS = 30
+
+
+def _flow_counts(records: List['PilgrimRecord']) -> Dict[str, Counter]:
+    """
+    نواة التدفقات في مرور واحد على أعمدة الدفعة:
+    مدة الإقامة لكل (جنسية، نوع) وساعات الوصول والمغادرة
+    القيم الدقيقة تُعدّ هنا (حلقات C) وتُطوى إلى خانات ثابتة في _finalize_flows
+    """
+    arrival_days = map(attrgetter('arrival_day'), records)
+    departure_days = map(attrgetter('departure_day'), records)
+    return {
+        'stay': Counter(zip(
+            map(attrgetter('nationality'), records),
+            map(attrgetter('pilgrim_type'), records),
+            map(sub, departure_days, arrival_days),
+        )),
+        'arrival_hour': Counter(map(attrgetter('arrival_hour'), records)),
+        'departure_hour': Counter(map(attrgetter('departure_hour'), records)),
+    }
+
+
+def _ranking_counts(records: List['PilgrimRecord']) -> Dict[str, Counter]:
+    """العدّ الخام لأقسام الترتيب: أعمدة _vectorized_counts مع السكن والنقل والجنسية×النوع"""
+    counts = _vectorized_counts(records)
+    counts['accommodation'] = Counter(map(attrgetter('accommodation_id'), records))
+    counts['transport'] = Counter(map(attrgetter('transport_id'), records))
+    counts['nationality_type'] = Counter(zip(
+        map(attrgetter('nationality'), records),
+        map(attrgetter('pilgrim_type'), records),
+    ))
+    return counts
+
+
+def _report_counts(records: List['PilgrimRecord']) -> Dict[str, Counter]:
+    """كل العدّ الخام للتقرير الشامل (التوزيعات والترتيب والتدفقات) لدفعة واحدة"""
+    counts = _ranking_counts(records)
+    counts.update(_flow_counts(records))
+    return counts
+
+
+def _histogram_quantile(bins: List[int], q: float) -> int:
+    target = q * sum(bins)
+    running = 0
+    for i, n in enumerate(bins):
+        running += n
+        if n and running >= target:
+            return i
+    return 0
+
+
+def _stay_histogram(stay_counts: Dict[int, int]) -> Dict[str, Any]:
+    """طي عدّ الأيام الدقيق إلى خانات ثابتة مع المتوسط والوسيط والمئين 90"""
+    bins = [0] * (STAY_HISTOGRAM_DAYS + 1)
+    for days, n in stay_counts.items():
+        bins[min(max(days, 0), STAY_HISTOGRAM_DAYS)] += n
+    total = sum(bins)
+    labels = [str(i) for i in range(STAY_HISTOGRAM_DAYS)] + [f"{STAY_HISTOGRAM_DAYS}+"]
+    return {
+        'count': total,
+        'mean_days': sum(d * n for d, n in stay_counts.items()) / total if total else 0,
+        'median_days': _histogram_quantile(bins, 0.5),
+        'p90_days': _histogram_quantile(bins, 0.9),
+        'histogram': dict(zip(labels, bins)),
+    }
+
+
+def _finalize_flows(counts: Dict[str, Counter], calendar: str = 'gregorian') -> Dict[str, Any]:
+    """تحويل عدّ التدفقات الخام إلى مدة الإقامة والتدفق اليومي وموجات الساعات"""
+    overall: Counter = Counter()
+    by_nationality: Dict[Nationality, Counter] = {}
+    by_type: Dict[PilgrimType, Counter] = {}
+    for (nationality, pilgrim_type, days), n in counts.get('stay', {}).items():
+        overall[days] += n
+        by_nationality.setdefault(nationality, Counter())[days] += n
+        by_type.setdefault(pilgrim_type, Counter())[days] += n
+
+    arrivals, departures = Counter(), Counter()
+    hourly = {'arrivals': [0] * 24, 'departures': [0] * 24}
+    for name, daily, wave in (('arrival_hour', arrivals, hourly['arrivals']),
+                              ('departure_hour', departures, hourly['departures'])):
+        for hour, n in counts.get(name, {}).items():
+            daily[hour // 24] += n
+            wave[hour % 24] += n
+
+    daily_flow: Dict[str, Dict[str, int]] = {}
+    days = sorted(arrivals.keys() | departures.keys())
+    if days:
+        table = get_calendar(days[0], days[-1])
+        for day in days:
+            flow = daily_flow.setdefault(table.label(day, calendar),
+                                         {'arrivals': 0, 'departures': 0, 'net': 0})
+            flow['arrivals'] += arrivals[day]
+            flow['departures'] += departures[day]
+            flow['net'] += arrivals[day] - departures[day]
+
+    return {
+        'length_of_stay': {
+            'overall': _stay_histogram(overall),
+            'by_nationality': {nat.value: _stay_histogram(c) for nat, c in by_nationality.items()},
+            'by_pilgrim_type': {kind.value: _stay_histogram(c) for kind, c in by_type.items()},
+        },
+        'daily_flow': daily_flow,
+        'hourly_waves': {name: {f"{h:02d}:00": n for h, n in enumerate(wave)}
+                         for name, wave in hourly.items()},
+    }
+
+
+@dataclass
+class ExecutionPlan:
+    """خطة التنفيذ المختارة مع التكلفة المقدرة لكل استراتيجية"""
+    strategy: str
+    workers: int
+    record_count: int
+    estimated_seconds: Dict[str, float]
+    reason: str
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'strategy': self.strategy,
+            'workers': self.workers,
+            'record_count': self.record_count,
+            'estimated_seconds': {k: round(v, 6) for k, v in self.estimated_seconds.items()},
+            'reason': self.reason,
+        }
+
+
+class ExecutionPlanner:
+    """
+    مخطط تنفيذ قائم على التكلفة: يختار بين serial و threads و vectorized و processes
+    حسب عدد السجلات وعدد الأنوية ومعايرة دقيقة تُجرى مرة واحدة لكل عملية
+    """
+    STRATEGIES = ('serial', 'threads', 'vectorized', 'processes')
+    CALIBRATION_SIZE = 2000
+    # عدد تكرارات قياس التكلفة الثابتة (تشغيل المسار على دفعة فارغة)
+    CALIBRATION_REPEATS = 50
+    # تكلفة تقديرية لتشغيل عامل process واحد (fork + import)
+    PROCESS_STARTUP_SECONDS = 0.05
+    # تكلفة تقديرية لذهاب وإياب مهمة واحدة عبر أنابيب مجمع العمليات
+    PROCESS_TASK_SECONDS = 0.001
+
+    _calibration: Optional[Dict[str, float]] = None
+    _calibration_lock = threading.Lock()
+
+    def __init__(self, max_workers: Optional[int] = None,
+                 calibration: Optional[Dict[str, float]] = None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        # معايرة مفروضة (للاختبارات والأجهزة المعروفة) بدل المعايرة المشتركة
+        self.calibration = calibration
+
+    @classmethod
+    def calibrate(cls) -> Dict[str, float]:
+        """معايرة micro-benchmark لمرة واحدة: تكلفة السجل والتكلفة الثابتة لكل مسار"""
+        with cls._calibration_lock:
+            if cls._calibration is None:
+                cls._calibration = cls._run_calibration()
+            return cls._calibration
+
+    @staticmethod
+    def _serial_pass(records: List['PilgrimRecord']):
+        nationality_count: Dict[str, int] = {}
+        age_groups = dict.fromkeys(AGE_GROUPS, 0)
+        daily: Dict[int, int] = {}
+        for r in records:
+            nat = r.nationality.value
+            nationality_count[nat] = nationality_count.get(nat, 0) + 1
+            age_groups[_age_group_label(r.age)] += 1
+            daily[r.arrival_day] = daily.get(r.arrival_day, 0) + 1
+        relabel_days(daily)
+
+    @staticmethod
+    def _vectorized_pass(records: List['PilgrimRecord']):
+        _finalize_counts(_vectorized_counts(records))
+
+    @classmethod
+    def _run_calibration(cls) -> Dict[str, float]:
+        sample = list(generate_synthetic_pilgrims(cls.CALIBRATION_SIZE))
+        n = len(sample)
+        repeats = cls.CALIBRATION_REPEATS
+
+        def per_call(fn, arg, times: int = 1) -> float:
+            start = time.perf_counter()
+            for _ in range(times):
+                fn(arg)
+            return (time.perf_counter() - start) / times
+
+        # التكلفة الثابتة من دفعة فارغة، وتكلفة السجل بعد طرحها
+        serial_fixed = per_call(cls._serial_pass, [], repeats)
+        vectorized_fixed = per_call(cls._vectorized_pass, [], repeats)
+        serial = max(per_call(cls._serial_pass, sample) - serial_fixed, 0.0) / n
+        vectorized = max(per_call(cls._vectorized_pass, sample) - vectorized_fixed, 0.0) / n
+
+        start = time.perf_counter()
+        pickle.loads(pickle.dumps(sample, protocol=pickle.HIGHEST_PROTOCOL))
+        transfer = (time.perf_counter() - start) / n
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            task = per_call(lambda _: pool.submit(int).result(), None, 20)
+
+        calibration = {
+            'serial_per_record': serial,
+            'serial_fixed': serial_fixed,
+            'vectorized_per_record': vectorized,
+            'vectorized_fixed': vectorized_fixed,
+            'transfer_per_record': transfer,
+            'task_overhead': task,
+        }
+        logger.info(f"🧪 Execution planner calibrated: {calibration}")
+        return calibration
+
+    @staticmethod
+    def _gil_enabled() -> bool:
+        is_gil_enabled = getattr(sys, '_is_gil_enabled', None)
+        return True if is_gil_enabled is None else is_gil_enabled()
+
+    def estimate(self, record_count: int) -> Dict[str, float]:
+        """
+        تقدير زمن كل استراتيجية بالثواني: تكلفة ثابتة + تكلفة السجل / التوازي الفعلي
+        processes: تشغيل المجمع (إن لم يكن يعمل) ومهمة لكل عامل، ونقل الدفعة وعدّها يتوزعان على العمال
+        """
+        cal = self.calibration or self.calibrate()
+        n = record_count
+        workers = self.max_workers
+        # التحليلات الثلاثة تتنافس على الـ GIL في الخيوط
+        thread_parallelism = 1 if self._gil_enabled() else min(3, workers)
+
+        estimates = {
+            'serial': cal['serial_fixed'] + n * cal['serial_per_record'],
+            'threads': (cal['serial_fixed'] + 3 * cal['task_overhead']
+                        + n * cal['serial_per_record'] / thread_parallelism),
+            'vectorized': cal['vectorized_fixed'] + n * cal['vectorized_per_record'],
+        }
+        if workers > 1:
+            pool = SharedWorkerPool.get('process', workers)
+            startup = 0.0 if pool.is_running else self.PROCESS_STARTUP_SECONDS * workers
+            estimates['processes'] = (
+                startup
+                + workers * (self.PROCESS_TASK_SECONDS + cal['task_overhead'] + cal['vectorized_fixed'])
+                + n * (cal['transfer_per_record'] + cal['vectorized_per_record']) / workers
+            )
+        return estimates
+
+    def plan(self, record_count: int, strategy: str = 'auto') -> ExecutionPlan:
+        """اختيار الاستراتيجية الأقل تكلفة (أو المفروضة عبر strategy)"""
+        if strategy != 'auto' and strategy not in self.STRATEGIES:
+            raise ValueError(f"Unknown execution strategy: {strategy}")
+
+        estimates = self.estimate(record_count)
+        if strategy == 'auto':
+            chosen = min(estimates, key=estimates.get)
+            reason = (f"lowest estimated cost for {record_count:,} records "
+                      f"on {self.max_workers} cores")
+        else:
+            chosen = strategy
+            reason = "forced by caller"
+
+        workers = {'serial': 1, 'vectorized': 1}.get(chosen, self.max_workers)
+        return ExecutionPlan(
+            strategy=chosen,
+            workers=workers,
+            record_count=record_count,
+            estimated_seconds=estimates,
+            reason=reason,
+        )
+
+
+# ==================== RANKING ====================
+
+# قسم التقرير -> (اسم العدّ الخام، عدد العناصر الافتراضي)
+RANKED_SECTIONS = {
+    'top_nationalities': ('nationality', 5),
+    'top_accommodations': ('accommodation', 10),
+    'top_transport_routes': ('transport', 10),
+    'busiest_days': ('arrival_day', 7),
+    'top_nationality_types': ('nationality_type', 10),
+}
+
+
+def resolve_ranking_sizes(overrides: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+    """عدد العناصر لكل قسم (الافتراضي مع التعديلات)"""
+    sizes = {section: n for section, (_, n) in RANKED_SECTIONS.items()}
+    for section, n in (overrides or {}).items():
+        if section not in sizes:
+            raise ValueError(f"Unknown ranked section {section!r}, expected one of {list(sizes)}")
+        sizes[section] = n
+    return sizes
+
+
+def _rank_key(name: str, key: Any) -> Any:
+    """مفتاح قابل للمقارنة (لكسر التعادل بالمفتاح) من مفتاح العدّ الخام"""
+    if name == 'nationality':
+        return key.value
+    if name == 'nationality_type':
+        return f"{key[0].value} / {key[1].value}"
+    return key
+
+
+def _rank_label(name: str, key: Any, calendar: str = 'gregorian') -> str:
+    if name == 'arrival_day':
+        return get_calendar(key, key).label(key, calendar)
+    return key
+
+
+def top_n(counts: Dict[Any, int], n: int) -> List[Tuple[Any, int]]:
+    """
+    أعلى n مفاتيح بـ heap بدل فرز كل المفاتيح: O(K log n) بدل O(K log K)
+    الترتيب: العدد تنازلياً ثم المفتاح تصاعدياً (نتيجة ثابتة عند التعادل)
+    """
+    if n <= 0:
+        return []
+    return heapq.nsmallest(n, counts.items(), key=lambda item: (-item[1], item[0]))
+
+
+class RankedCounter:
+    """
+    عدّاد مع ترتيب تزايدي: كل تغيير يدفع مدخلاً جديداً في heap، والمدخلات التي
+    تغير عددها بعدها تُهمل عند القراءة (lazy invalidation)
+    top(n) يكلف O(n log K) تقريباً مهما كثرت المفاتيح، ولا يعيد الفرز عند تغير العدّ
+    """
+
+    def __init__(self, counts: Optional[Dict[Any, int]] = None):
+        self._counts: Dict[Any, int] = {}
+        self._heap: List[Tuple[int, Any]] = []
+        if counts:
+            self.update(counts)
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def __getitem__(self, key: Any) -> int:
+        return self._counts.get(key, 0)
+
+    def items(self):
+        return self._counts.items()
+
+    def add(self, key: Any, delta: int = 1):
+        """تعديل عدّ مفتاح (delta سالب للطرح؛ المفاتيح الصفرية تُحذف)"""
+        if not delta:
+            return
+        count = self._counts.get(key, 0) + delta
+        if count > 0:
+            self._counts[key] = count
+            heapq.heappush(self._heap, (-count, key))
+        else:
+            self._counts.pop(key, None)
+        if len(self._heap) > 2 * len(self._counts) + 64:
+            self._compact()
+
+    def update(self, counts: Dict[Any, int]):
+        for key, delta in counts.items():
+            self.add(key, delta)
+
+    def subtract(self, counts: Dict[Any, int]):
+        for key, delta in counts.items():
+            self.add(key, -delta)
+
+    def _compact(self):
+        """إعادة بناء الـ heap من الأعداد الحالية فقط (يحد نموه مع كثرة التحديثات)"""
+        self._heap = [(-count, key) for key, count in self._counts.items()]
+        heapq.heapify(self._heap)
+
+    def top(self, n: int) -> List[Tuple[Any, int]]:
+        """أعلى n مفاتيح بنفس ترتيب top_n"""
+        heap, counts = self._heap, self._counts
+        popped, result = [], []
+        while heap and len(result) < n:
+            entry = heapq.heappop(heap)
+            count, key = -entry[0], entry[1]
+            if counts.get(key) == count and (not result or result[-1][0] != key):
+                result.append((key, count))
+                popped.append(entry)
+        # المدخلات الصالحة تعود للـ heap، والقديمة تبقى محذوفة
+        for entry in popped:
+            heapq.heappush(heap, entry)
+        return result
+
+
+def rank_sections(
+    counts: Dict[str, Dict[Any, int]],
+    sizes: Optional[Dict[str, int]] = None,
+    calendar: str = 'gregorian'
+) -> Dict[str, Dict[str, int]]:
+    """أقسام التقرير المرتبة من العدّ الخام (اختيار جزئي لكل قسم)"""
+    sizes = sizes or resolve_ranking_sizes()
+    sections = {}
+    for section, (name, _) in RANKED_SECTIONS.items():
+        ranked = {_rank_key(name, key): n for key, n in counts.get(name, {}).items()}
+        sections[section] = {_rank_label(name, key, calendar): n
+                             for key, n in top_n(ranked, sizes[section])}
+    return sections
+
+
+class RankingBoard:
+    """
+    ترتيب تزايدي لأقسام التقرير مرتبط برقم نسخة البيانات
+    يُبنى من أول تحليل شامل ثم يُحدَّث بفروق كل كتابة بدل إعادة العدّ والفرز،
+    ويُستخدم فقط عندما يطابق رقمه النسخة المثبتة للقراءة
+    """
+
+    def __init__(self):
+        self.version: Optional[int] = None
+        self._counters: Dict[str, RankedCounter] = {}
+        self._lock = threading.Lock()
+
+    def reset(self, counts: Dict[str, Dict[Any, int]], version: int):
+        counters = {
+            name: RankedCounter({_rank_key(name, key): n for key, n in counts.get(name, {}).items()})
+            for name, _ in RANKED_SECTIONS.values()
+        }
+        with self._lock:
+            if self.version is None or self.version < version:
+                self._counters, self.version = counters, version
+
+    def apply(self, added: List['PilgrimRecord'], removed: List['PilgrimRecord'],
+              previous: int, version: int):
+        """تطبيق فروق كتابة نقلت البيانات من النسخة previous إلى version"""
+        with self._lock:
+            if self.version != previous:
+                return
+            for records, sign in ((added, 1), (removed, -1)):
+                if not records:
+                    continue
+                counts = _ranking_counts(records)
+                for name, counter in self._counters.items():
+                    for key, n in counts[name].items():
+                        counter.add(_rank_key(name, key), sign * n)
+            self.version = version
+
+    def sections(self, version: int, sizes: Dict[str, int]) -> Optional[Dict[str, Dict[str, int]]]:
+        """الأقسام المرتبة للنسخة المطلوبة، أو None إن لم يكن الترتيب محدثاً لها"""
+        with self._lock:
+            if self.version != version:
+                return None
+            return {
+                section: {_rank_label(name, key): n
+                          for key, n in self._counters[name].top(sizes[section])}
+                for section, (name, _) in RANKED_SECTIONS.items()
+            }
+
+
+# ==================== MULTITHREADING ====================
+
+class DataAnalyzer:
+    """محلل البيانات مع دعم المعالجة المتوازية"""
+    
+    def __init__(self, max_workers: Optional[int] = None, strategy: str = 'auto'):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.strategy = strategy
+        self.planner = ExecutionPlanner(max_workers=self.max_workers)
+        self._pools: Dict[str, SharedWorkerPool] = {}
+        self._pools_lock = threading.Lock()
+    
+    def _acquire_pool(self, kind: str) -> Executor:
+        """حجز المجمع المشترك مرة واحدة لكل محلل (lazy)"""
+        with self._pools_lock:
+            pool = self._pools.get(kind)
+            if pool is None:
+                pool = SharedWorkerPool.get(kind, self.max_workers)
+                pool.acquire()
+                self._pools[kind] = pool
+            return pool.executor
+    
+    @property
+    def executor(self) -> Executor:
+        """مجمع الخيوط المشترك"""
+        return self._acquire_pool('thread')
+    
+    def plan(self, records: List[PilgrimRecord]) -> ExecutionPlan:
+        """خطة التنفيذ لهذه المجموعة من السجلات"""
+        if isinstance(records, SegmentedRecords) and self.strategy == 'auto':
+            plan = self.planner.plan(len(records), 'vectorized')
+            plan.reason = "out-of-core data: one sequential pass over partitions and segments"
+            return plan
+        return self.planner.plan(len(records), self.strategy)
+    
+    @performance_monitor
+    def analyze_by_nationality(self, records: List[PilgrimRecord]) -> Dict[str, int]:
+        """تحليل التوزيع حسب الجنسية"""
+        logger.info("🌍 Analyzing nationality distribution...")
+        
+        nationality_count = {}
+        for record in records:
+            nat = record.nationality.value
+            nationality_count[nat] = nationality_count.get(nat, 0) + 1
+        
+        return nationality_count
+    
+    @performance_monitor
+    def analyze_age_groups(self, records: List[PilgrimRecord]) -> Dict[str, int]:
+        """تحليل التوزيع العمري"""
+        logger.info("👥 Analyzing age group distribution...")
+        
+        age_groups = {
+            '18-30': 0,
+            '31-45': 0,
+            '46-60': 0,
+            '60+': 0
+        }
+        
+        for record in records:
+            if record.age <= 30:
+                age_groups['18-30'] += 1
+            elif record.age <= 45:
+                age_groups['31-45'] += 1
+            elif record.age <= 60:
+                age_groups['46-60'] += 1
+            else:
+                age_groups['60+'] += 1
+        
+        return age_groups
+    
+    @performance_monitor
+    def analyze_peak_periods(
+        self,
+        records: List[PilgrimRecord],
+        calendar: str = 'gregorian'
+    ) -> Dict[str, int]:
+        """
+        تحليل فترات الذروة
+        calendar: 'gregorian' | 'hijri' | 'phase' (مراحل الموسم مثل يوم عرفة)
+        """
+        logger.info("📅 Analyzing peak periods...")
+        
+        daily_arrivals = Counter(map(attrgetter('arrival_day'), records))
+        return relabel_days(daily_arrivals, calendar)
+    
+    @performance_monitor
+    def analyze_occupancy(
+        self,
+        records: List[PilgrimRecord],
+        calendar: str = 'gregorian'
+    ) -> Dict[str, int]:
+        """عدد الحجاج المتواجدين في كل يوم (من يوم الوصول حتى يوم المغادرة)"""
+        logger.info("🏨 Analyzing daily occupancy...")
+        
+        arrivals = Counter(map(attrgetter('arrival_day'), records))
+        departures = Counter(map(attrgetter('departure_day'), records))
+        if not arrivals:
+            return {}
+        
+        occupancy: Dict[int, int] = {}
+        present = 0
+        for day in range(min(arrivals), max(departures) + 1):
+            present += arrivals.get(day, 0)
+            occupancy[day] = present
+            present -= departures.get(day, 0)
+        
+        return relabel_days(occupancy, calendar)
+    
+    @performance_monitor
+    @privacy_compliance
+    def analyze_health_status(self, record: Dict) -> Dict[str, Any]:
+        """تحليل الحالة الصحية (مع حماية الخصوصية)"""
+        return {
+            'status': record.get('health_status', 'غير محدد'),
+            'requires_attention': record.get('health_status') == HEALTH_ATTENTION_STATUS
+        }
+    
+    @performance_monitor
+    def triage_health(
+        self,
+        records: Iterable[PilgrimRecord],
+        previous_flags: Optional[set] = None,
+        chunk_size: int = 50000,
+        full_scope: bool = True
+    ) -> Dict[str, Any]:
+        """
+        فرز صحي دفعي لكل البيانات أو لتدفق سجلات
+        - تقييم عمودي للحالة الصحية لكل دفعة (map + compress بدل استدعاء لكل سجل)
+        - حماية الخصوصية تُطبق مرة واحدة على قائمة المتابعة فقط
+        - previous_flags: معرفات المُعلَّمين في التشغيل السابق لاستخراج الحالات الجديدة
+          (تُعاد في flagged_ids لتمريرها إلى التشغيل التالي)
+        - full_scope=False لجزء من البيانات: cleared_flags تقتصر على السجلات المفحوصة
+        """
+        logger.info("🩺 Running batch health triage...")
+        
+        previous = previous_flags if previous_flags is not None else set()
+        screened = 0
+        screened_previous: set = set()
+        flagged: List[PilgrimRecord] = []
+        iterator = iter(records)
+        while True:
+            chunk = list(islice(iterator, chunk_size))
+            if not chunk:
+                break
+            screened += len(chunk)
+            if not full_scope:
+                screened_previous.update(previous.intersection(map(attrgetter('id'), chunk)))
+            mask = map(HEALTH_ATTENTION_STATUS.__eq__, map(attrgetter('health_status'), chunk))
+            flagged.extend(compress(chunk, mask))
+        
+        flagged_ids = set(map(attrgetter('id'), flagged))
+        if full_scope:
+            screened_previous = previous
+        
+        by_age_group = dict.fromkeys(AGE_GROUPS, 0)
+        for age, n in Counter(map(attrgetter('age'), flagged)).items():
+            by_age_group[_age_group_label(age)] += n
+        
+        return {
+            'screened': screened,
+            'requires_attention': len(flagged),
+            'attention_list': redact_records(flagged),
+            'by_age_group': by_age_group,
+            'by_nationality': {nat.value: n for nat, n in
+                               Counter(map(attrgetter('nationality'), flagged)).items()},
+            'by_accommodation': dict(Counter(map(attrgetter('accommodation_id'), flagged))),
+            'new_flags': sorted(flagged_ids - previous),
+            'cleared_flags': sorted(screened_previous - flagged_ids),
+            'flagged_ids': flagged_ids,
+        }
+    
+    def aggregate_counts(
+        self,
+        records: List[PilgrimRecord],
+        plan: Optional[ExecutionPlan] = None,
+        kernel: Callable[[List[PilgrimRecord]], Dict[str, Counter]] = _vectorized_counts
+    ) -> Dict[str, Counter]:
+        """
+        العدّ الخام القابل للدمج (بين الدفعات والعمليات والعقد)
+        processes: موزع على مجمع العمليات | غير ذلك: عدّ عمودي في هذه العملية
+        kernel: دالة العدّ لكل دفعة (على مستوى الوحدة ليمكن إرسالها للعمليات)
+        """
+        plan = plan or self.plan(records)
+        if plan.strategy == 'processes':
+            executor = self._acquire_pool('process')
+            chunk_size = -(-len(records) // plan.workers) or 1
+            futures = [
+                executor.submit(kernel, records[i:i + chunk_size])
+                for i in range(0, len(records), chunk_size)
+            ]
+            return _merge_counts([f.result() for f in futures])
+        if isinstance(records, SegmentedRecords):
+            return _merge_counts(list(map(kernel, records.chunks())))
+        return kernel(records)
+    
+    @performance_monitor
+    def analyze_flows(
+        self,
+        records: Iterable[PilgrimRecord],
+        calendar: str = 'gregorian',
+        chunk_size: int = 50000
+    ) -> Dict[str, Any]:
+        """
+        مدة الإقامة حسب الجنسية والنوع، والتدفق اليومي الصافي، وموجات الوصول والمغادرة بالساعة
+        يقبل قائمة أو تدفق سجلات (يُعالج على دفعات ويُدمج العدّ)
+        """
+        logger.info("🛬 Analyzing length of stay and arrival/departure flows...")
+        
+        if isinstance(records, Sequence):
+            counts = self.aggregate_counts(records, kernel=_flow_counts)
+        else:
+            iterator = iter(records)
+            chunks = iter(lambda: list(islice(iterator, chunk_size)), [])
+            counts = _merge_counts(list(map(_flow_counts, chunks)))
+        return _finalize_flows(counts, calendar)
+    
+    @performance_monitor
+    def parallel_comprehensive_analysis(
+        self,
+        records: List[PilgrimRecord],
+        plan: Optional[ExecutionPlan] = None
+    ) -> Dict[str, Any]:
+        """
+        تحليل شامل حسب خطة التنفيذ
+        serial: تشغيل التحليلات مباشرة | threads: بالتوازي على مجمع الخيوط المشترك
+        vectorized: عدّ عمودي | processes: عدّ عمودي موزع على مجمع العمليات
+        """
+        plan = plan or self.plan(records)
+        logger.info(f"🚀 Starting {plan.strategy} analysis with {plan.workers} workers...")
+        
+        if plan.strategy in ('vectorized', 'processes'):
+            return _finalize_counts(self.aggregate_counts(records, plan))
+        
+        analyses = {
+            'nationality': self.analyze_by_nationality,
+            'age_groups': self.analyze_age_groups,
+            'peak_periods': self.analyze_peak_periods,
+        }
+        
+        if plan.strategy == 'serial':
+            return {name: analysis(records) for name, analysis in analyses.items()}
+        
+        executor = self.executor
+        futures = {name: executor.submit(analysis, records) for name, analysis in analyses.items()}
+        
+        results = {}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+                logger.info(f"  ✅ {name} analysis completed")
+            except Exception as e:
+                logger.error(f"  ❌ {name} analysis failed: {e}")
+                results[name] = None
+        
+        return results
+    
+    def comprehensive_analysis(
+        self,
+        records: List[PilgrimRecord],
+        plan: Optional[ExecutionPlan] = None
+    ) -> Tuple[Dict[str, Any], Dict[str, Any], Optional[Dict[str, Counter]]]:
+        """
+        التوزيعات والتدفقات معاً للتقرير الشامل، مع العدّ الخام إن توفر
+        vectorized / processes: مرور واحد بنواة _report_counts يُبنى منه الكل (ويُعاد العدّ)
+        threads: التدفقات مهمة إضافية على المجمع بالتوازي مع التحليلات | serial: بالتتابع
+        """
+        plan = plan or self.plan(records)
+        if plan.strategy in ('vectorized', 'processes'):
+            logger.info(f"🚀 Starting {plan.strategy} analysis with {plan.workers} workers...")
+            counts = self.aggregate_counts(records, plan, kernel=_report_counts)
+            return _finalize_counts(counts), _finalize_flows(counts), counts
+        if plan.strategy == 'threads':
+            flows = self.executor.submit(self.analyze_flows, records)
+            return self.parallel_comprehensive_analysis(records, plan=plan), flows.result(), None
+        return (self.parallel_comprehensive_analysis(records, plan=plan),
+                self.analyze_flows(records), None)
+    
+    def shutdown(self):
+        """تحرير المجمعات المشتركة التي حجزها هذا المحلل"""
+        with self._pools_lock:
+            pools, self._pools = self._pools, {}
+        for pool in pools.values():
+            pool.release()
+
+
+# ==================== MAIN APPLICATION ====================
+
+# أخطاء المصدر التي تستحق إعادة المحاولة وتُحسب في قاطع الدائرة (أخطاء المستدعي تُرفع فوراً)
+DATA_SOURCE_ERRORS: Tuple[Type[BaseException], ...] = (OSError, ConnectionError)
+
+
+@dataclass(frozen=True, eq=False)
+class DataVersion:
+    """
+    نسخة بيانات غير قابلة للتعديل (MVCC)
+    القارئ يثبّت نسخة ويعمل عليها دون أقفال، والكاتب يبني نسخة جديدة وينشرها ذرياً
+    """
+    number: int
+    records: Sequence = field(repr=False)
+    index: PilgrimIndex = field(repr=False)
+    store: PartitionedStore = field(repr=False)
+    token: str = field(default_factory=lambda: os.urandom(8).hex())
+    created_at: datetime = field(default_factory=datetime.now)
+
+    @functools.cached_property
+    def summary(self) -> Dict[str, Any]:
+        """الإحصائيات الملخصة للنسخة (تُحسب عند أول طلب وتُحرر مع النسخة نفسها)"""
+        # من إحصائيات الـ partitions المحسوبة مسبقاً بدل المرور على كل السجلات
+        return self.store.stats().to_summary()
+
+
+def _assemble_report(
+    summary: Dict[str, Any],
+    detailed: Dict[str, Any],
+    flows: Dict[str, Any],
+    rankings: Dict[str, Dict[str, int]],
+    diagnostics: Dict[str, Any]
+) -> Dict[str, Any]:
+    """شكل التقرير الشامل (مشترك بين التحليل المحلي ودمج نتائج الشاردات)"""
+    return {
+        'generated_at': datetime.now().isoformat(),
+        'summary': summary,
+        'detailed_analysis': detailed,
+        'top_nationalities': rankings['top_nationalities'],
+        'rankings': rankings,
+        'flow_analysis': flows,
+        'diagnostics': diagnostics,
+    }
+
+
+class HajjUmrahAnalyticsPlatform:
+    """
+    المنصة الرئيسية لتحليل بيانات الحج والعمرة
+    التزامن بنموذج اللقطات (MVCC): كل تحميل أو إضافة ينشر DataVersion جديدة ذرياً،
+    والقراءات (التحليل الشامل، التصفية، الإحصائيات) تثبّت نسخة ولا تحجب الكتّاب
+    """
+    
+    def __init__(
+        self,
+        partition_days: int = 1,
+        spill_dir: Optional[str] = None,
+        memory_budget: Optional[int] = None,
+        strategy: str = 'auto',
+        max_workers: Optional[int] = None,
+        ranking_sizes: Optional[Dict[str, int]] = None
+    ):
+        """
+        memory_budget: أقصى عدد سجلات في الذاكرة؛ عند تحديده تُخلى أقدم الـ partitions
+        إلى segments على القرص وتعمل التحليلات عبر الذاكرة والقرص معاً
+        strategy / max_workers: استراتيجية التنفيذ وعدد العمال (انظر ExecutionPlanner)
+        ranking_sizes: عدد العناصر لكل قسم مرتب في التقرير (انظر RANKED_SECTIONS)
+        """
+        self.analyzer = DataAnalyzer(max_workers=max_workers, strategy=strategy)
+        # قاطع دائرة لمصدر بيانات هذه المنصة (لا يتأثر بإخفاقات المنصات الأخرى)
+        self.source_breaker = CircuitBreaker(failure_threshold=5, recovery_timeout=30.0,
+                                             name='data_source')
+        self.ranking_sizes = resolve_ranking_sizes(ranking_sizes)
+        # الترتيب التزايدي: يُبنى مع أول تقرير شامل ثم يتبع فروق الكتابات
+        self._rankings = RankingBoard()
+        self.memory_budget = memory_budget
+        self.partition_days = partition_days
+        self._spill_dir = spill_dir
+        self.ingestion_report: Dict[str, Any] = {'duplicates': []}
+        self._health_flags: set = set()
+        # الكتّاب فقط يأخذون هذا القفل؛ القرّاء يقرؤون self._version مباشرة
+        self._write_lock = threading.Lock()
+        index = PilgrimIndex()
+        self._version = DataVersion(
+            0, index.records, index, PartitionedStore(partition_days, spill_dir)
+        )
+    
+    # ---------- data versions ----------
+    
+    def snapshot(self) -> DataVersion:
+        """تثبيت النسخة الحالية للقراءة (تبقى صالحة مهما نُشر بعدها)"""
+        return self._version
+    
+    @property
+    def version(self) -> int:
+        return self._version.number
+    
+    @property
+    def records(self) -> Sequence:
+        return self._version.records
+    
+    @property
+    def index(self) -> PilgrimIndex:
+        return self._version.index
+    
+    @property
+    def store(self) -> PartitionedStore:
+        return self._version.store
+    
+    def _draft(self) -> Tuple[Sequence, PilgrimIndex, PartitionedStore]:
+        """نسخة قابلة للتعديل من البيانات الحالية (copy-on-write للـ partitions)"""
+        version = self._version
+        store = version.store.copy()
+        if isinstance(version.index, PartitionLocatorIndex):
+            index = version.index.copy(store)
+            return SegmentedRecords(store), index, store
+        index = version.index.copy()
+        return index.records, index, store
+    
+    def _publish(self, records: Sequence, index: PilgrimIndex, store: PartitionedStore) -> DataVersion:
+        """نشر نسخة جديدة ذرياً (يُستدعى مع قفل الكتابة)"""
+        version = DataVersion(self._version.number + 1, records, index, store)
+        self._version = version
+        logger.info(f"🆕 Published data version {version.number} ({len(records):,} records)")
+        return version
+    
+    # ---------- writers ----------
+    
+    @performance_monitor
+    def load_data(self, count: int = 50000, seed: Optional[int] = None,
+                  reference: Optional[datetime] = None):
+        """
+        تحميل البيانات باستخدام Generator
+        إعادة المحاولة وقاطع الدائرة (الخاص بهذه المنصة) لأخطاء المصدر فقط
+        """
+        @retry_on_failure(max_retries=3, delay=1.0, exceptions=DATA_SOURCE_ERRORS,
+                          circuit_breaker=self.source_breaker)
+        def load():
+            logger.info(f"📥 Loading {count:,} pilgrim records...")
+            
+            # استخدام Generator لتوليد البيانات (يُعاد إنشاؤه في كل محاولة)
+            self.load_records(generate_synthetic_pilgrims(count, seed, reference))
+        
+        load()
+    
+    def load_records(self, generator: Iterable[PilgrimRecord]):
+        """تحميل سجلات من أي مصدر (يستبدل البيانات الحالية بنسخة جديدة)"""
+        with self._write_lock:
+            store = PartitionedStore(self.partition_days, self.store.spill_dir)
+            
+            if self.memory_budget is not None:
+                records, index, duplicates = self._ingest_out_of_core(generator, store)
+            else:
+                records = list(generator)
+                
+                # بناء الفهارس والـ partitions واكتشاف التكرارات
+                index = PilgrimIndex()
+                duplicates = index.build(records)
+                records = index.records
+                store.add(records)
+            
+            self._publish(records, index, store)
+        
+        self.ingestion_report = {'duplicates': duplicates}
+        if duplicates:
+            logger.warning(f"⚠️  Found {len(duplicates):,} duplicate identifiers during ingestion")
+        
+        logger.info(f"✅ Successfully loaded {len(records):,} records")
+    
+    def _ingest_out_of_core(
+        self,
+        records: Iterable[PilgrimRecord],
+        store: PartitionedStore
+    ) -> Tuple[Sequence, PilgrimIndex, List[Dict[str, str]]]:
+        """
+        استيعاب على دفعات ضمن ميزانية الذاكرة: كل دفعة تُضاف للـ partitions
+        ثم تُخلى أقدمها إلى القرص حتى يعود عدد السجلات المقيمة ضمن الميزانية
+        """
+        index = PartitionLocatorIndex(store)
+        chunk_size = max(1, min(self.memory_budget // 2, 50000))
+        
+        duplicates: List[Dict[str, str]] = []
+        spilled = 0
+        iterator = iter(records)
+        while True:
+            chunk = list(islice(iterator, chunk_size))
+            if not chunk:
+                break
+            chunk, chunk_duplicates = index.add_chunk(chunk)
+            duplicates.extend(chunk_duplicates)
+            store.add(chunk)
+            spilled += store.enforce_budget(self.memory_budget)
+        
+        logger.info(f"💾 Out-of-core load: {store.resident_count:,} records in memory, "
+                    f"{spilled:,} spilled to {store.spill_dir}")
+        return SegmentedRecords(store), index, duplicates
+    
+    def upsert_records(self, records: Iterable[PilgrimRecord]) -> Dict[str, int]:
+        """
+        إدراج أو تحديث سجلات (أو إلحاق سجلات جديدة) مع اكتشاف تكرار الهويات
+        الدفعة كاملة تُنشر كنسخة بيانات واحدة، والمعرف المكرر داخلها يأخذ آخر قيمة
+        السجلات الجديدة تُضاف إلى الـ partitions مرة واحدة لكل partition
+        """
+        stats = {'inserted': 0, 'updated': 0, 'duplicates': 0}
+        batch = list({record.id: record for record in records}.values())
+        replaced: List[PilgrimRecord] = []
+        with self._write_lock:
+            previous = self._version.number
+            draft_records, index, store = self._draft()
+            # السجلات الحالية للدفعة كلها بقراءة واحدة لكل partition معنية
+            current = index.get_many([record.id for record in batch])
+            for record in batch:
+                conflicts = index.identity_conflicts(record)
+                if conflicts:
+                    stats['duplicates'] += len(conflicts)
+                    self.ingestion_report['duplicates'].extend(conflicts)
+                existing = current.get(record.id)
+                if index.upsert(record, existing):
+                    stats['inserted'] += 1
+                else:
+                    stats['updated'] += 1
+                    replaced.append(existing)
+            store.remove_many(replaced)
+            store.add(batch)
+            
+            if self.memory_budget is not None:
+                store.enforce_budget(self.memory_budget)
+            version = self._publish(draft_records, index, store)
+            self._rankings.apply(batch, replaced, previous, version.number)
+        
+        logger.info(f"🔁 Upserted records: {stats}")
+        return stats
+    
+    def delete_pilgrim(self, record_id: str) -> bool:
+        """حذف حاج بالمعرف"""
+        with self._write_lock:
+            previous = self._version.number
+            draft_records, index, store = self._draft()
+            record = index.get(record_id)
+            if record is None:
+                return False
+            index.delete(record_id, record)
+            store.remove(record)
+            if self.memory_budget is not None:
+                store.enforce_budget(self.memory_budget)
+            version = self._publish(draft_records, index, store)
+            self._rankings.apply([], [record], previous, version.number)
+        return True
+    
+    def evict_partitions(self, before: datetime) -> int:
+        """
+        إخلاء الـ partitions الأقدم من التاريخ المحدد إلى القرص
+        السجلات المُخلاة تبقى جزءاً من البيانات (records والفهرس والإحصائيات) وتُقرأ من القرص:
+        في وضع الذاكرة الكاملة ينتقل الإصدار إلى تمثيل وضع memory_budget
+        (SegmentedRecords وفهرس يشير إلى الـ partition) فتخرج من الذاكرة دون أن تختفي
+        """
+        with self._write_lock:
+            draft_records, index, store = self._draft()
+            evicted = store.evict_before(to_epoch_hour(before) // 24)
+            removed = sum(map(len, evicted))
+            if removed and not isinstance(index, PartitionLocatorIndex):
+                index = PartitionLocatorIndex.from_index(index, store)
+                draft_records = SegmentedRecords(store)
+            self._publish(draft_records, index, store)
+        
+        logger.info(f"💾 Evicted {removed:,} records older than {before.date().isoformat()}")
+        return removed
+    
+    # ---------- readers ----------
+    
+    def get_pilgrim(self, record_id: str) -> Optional[PilgrimRecord]:
+        """البحث عن حاج بالمعرف"""
+        return self.snapshot().index.get(record_id)
+    
+    def find_pilgrim(
+        self,
+        national_id: Optional[str] = None,
+        passport_number: Optional[str] = None
+    ) -> Optional[PilgrimRecord]:
+        """البحث عن حاج بالهوية الوطنية أو رقم الجواز"""
+        index = self.snapshot().index
+        if national_id is not None:
+            return index.find_by_identity('national_id', national_id)
+        if passport_number is not None:
+            return index.find_by_identity('passport_number', passport_number)
+        raise ValueError("national_id or passport_number is required")
+    
+    def filter_records(self, criteria: Dict[str, Any]) -> Generator[PilgrimRecord, None, None]:
+        """Generator: تصفية سجلات النسخة المثبتة (مع تقليم الـ partitions لمعايير التاريخ)"""
+        version = self.snapshot()
+        if 'arrival_from' in criteria or 'arrival_to' in criteria:
+            return filter_by_criteria(version.store, criteria)
+        return filter_by_criteria(version.records, criteria)
+    
+    def health_triage(self, records: Optional[Iterable[PilgrimRecord]] = None) -> Dict[str, Any]:
+        """
+        فرز صحي لكل البيانات (أو لتدفق سجلات) مع الحالات الجديدة منذ آخر تشغيل
+        تشغيل على جزء من البيانات يحدّث علامات ذلك الجزء فقط ولا يستبدل البقية
+        """
+        full_scope = records is None
+        triage = self.analyzer.triage_health(
+            self.snapshot().records if full_scope else records,
+            previous_flags=self._health_flags,
+            full_scope=full_scope
+        )
+        flagged_ids = triage.pop('flagged_ids')
+        if full_scope:
+            self._health_flags = flagged_ids
+        else:
+            self._health_flags = (self._health_flags - set(triage['cleared_flags'])) | flagged_ids
+        logger.info(f"🩺 {triage['requires_attention']:,} pilgrims require attention "
+                    f"({len(triage['new_flags']):,} new)")
+        return triage
+    
+    @performance_monitor
+    def get_summary_statistics(self, version: Optional[DataVersion] = None) -> Dict[str, Any]:
+        """الحصول على إحصائيات ملخصة"""
+        logger.info("📈 Calculating summary statistics...")
+        
+        return (version or self.snapshot()).summary
+    
+    def peak_periods(
+        self,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        calendar: str = 'gregorian'
+    ) -> Dict[str, int]:
+        """فترات الذروة لمدى زمني [start, end) من إحصائيات الـ partitions"""
+        start_day = None if start is None else to_epoch_hour(start) // 24
+        end_day = None if end is None else (_hour_bound(end, end=True) - 1) // 24
+        daily = self.snapshot().store.daily_arrivals(start_day, end_day)
+        return relabel_days(daily, calendar)
+    
+    def flow_analysis(
+        self,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        calendar: str = 'gregorian'
+    ) -> Dict[str, Any]:
+        """مدة الإقامة والتدفقات للحجاج الواصلين في [start, end) (مع تقليم الـ partitions)"""
+        version = self.snapshot()
+        records = version.records
+        if start is not None or end is not None:
+            records = filter_by_criteria(version.store, {'arrival_from': start, 'arrival_to': end})
+        return self.analyzer.analyze_flows(records, calendar)
+    
+    def stream_analysis(
+        self,
+        chunk_size: int = 5000,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None
+    ):
+        """تحليل متدفق للبيانات الزمنية (مع تقليم الـ partitions عند تحديد مدى)"""
+        logger.info("🌊 Starting streaming analysis...")
+        
+        version = self.snapshot()
+        records = version.records
+        if start is not None or end is not None:
+            records = filter_by_criteria(version.store, {'arrival_from': start, 'arrival_to': end})
+        for chunk_analysis in stream_time_series_analysis(records, chunk_size):
+            logger.info(f"  Chunk {chunk_analysis['chunk_id']}: {chunk_analysis['statistics']['total_pilgrims']} records")
+            yield chunk_analysis
+    
+    @performance_monitor
+    def run_comprehensive_analysis(self) -> Dict[str, Any]:
+        """تشغيل التحليل الشامل على نسخة بيانات مثبتة"""
+        logger.info("🎯 Running comprehensive analysis...")
+        version = self.snapshot()
+        
+        # التوزيعات ومدة الإقامة والتدفقات حسب خطة التنفيذ
+        plan = self.analyzer.plan(version.records)
+        parallel_results, flows, counts = self.analyzer.comprehensive_analysis(version.records, plan=plan)
+        rankings = self._ranked_sections(version, plan, counts)
+        
+        # الإحصائيات الملخصة
+        summary = self.get_summary_statistics(version)
+        
+        # دمج النتائج
+        return _assemble_report(summary, parallel_results, flows, rankings, {
+            'execution_plan': plan.to_dict(),
+            'data_version': version.number
+        })
+    
+    def _ranked_sections(
+        self,
+        version: DataVersion,
+        plan: ExecutionPlan,
+        counts: Optional[Dict[str, Counter]] = None
+    ) -> Dict[str, Dict[str, int]]:
+        """
+        الأقسام المرتبة من الترتيب التزايدي إن كان محدثاً لهذه النسخة،
+        وإلا يُعاد بناؤه من العدّ الخام (من مرور التحليل نفسه إن توفر)
+        """
+        rankings = self._rankings.sections(version.number, self.ranking_sizes)
+        if rankings is not None:
+            return rankings
+        if counts is None:
+            counts = self.analyzer.aggregate_counts(version.records, plan, kernel=_ranking_counts)
+        self._rankings.reset(counts, version.number)
+        rankings = self._rankings.sections(version.number, self.ranking_sizes)
+        # كاتب نشر نسخة أحدث أثناء البناء: ترتيب النسخة المثبتة من العدّ مباشرة
+        return rankings if rankings is not None else rank_sections(counts, self.ranking_sizes)
+    
+    def partial_aggregate(self, shard: Optional[str] = None) -> 'PartialAggregate':
+        """
+        النتيجة الجزئية القابلة للدمج لبيانات هذه العقدة (نسخة مثبتة)
+        تُرسل إلى AggregationCoordinator بدلاً من السجلات نفسها
+        """
+        version = self.snapshot()
+        plan = self.analyzer.plan(version.records)
+        counts = self.analyzer.aggregate_counts(version.records, plan, kernel=_report_counts)
+        return PartialAggregate(counts, version.store.stats(), [{
+            'shard': shard,
+            'records': len(version.records),
+            'data_version': version.number,
+            'strategy': plan.strategy,
+        }])
+    
+    def export_report(self, report: Dict[str, Any], filename: str = 'report.json'):
+        """تصدير التقرير"""
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        logger.info(f"📄 Report exported to {filename}")
+    
+    def cleanup(self):
+        """تنظيف الموارد (ومجلد الـ segments المؤقت إن أنشأته المنصة)"""
+        self.analyzer.shutdown()
+        spill_dir = self.store.spill_dir
+        if self._spill_dir is None and spill_dir is not None:
+            import shutil
+            shutil.rmtree(spill_dir, ignore_errors=True)
+
+
+# ==================== DISTRIBUTED AGGREGATION ====================
+
+SHARD_KEYS = ('nationality', 'arrival')
+CLUSTER_KEY_ENV = 'HAJJ_CLUSTER_KEY'
+# الإطار: magic + طول الحمولة + HMAC-SHA256 ثم الحمولة (JSON مضغوط)
+_FRAME_MAGIC = b'HUA1'
+_FRAME_HEADER = struct.Struct('>4sI32s')
+_FRAME_MAX_BYTES = 256 * 1024 * 1024
+_ACK, _NAK = b'\x01', b'\x00'
+_NATIONALITY_CODES = {nat: i for i, nat in enumerate(_NATIONALITIES)}
+
+
+def shard_of(record: PilgrimRecord, shard_count: int, by: str = 'nationality',
+             partition_days: int = 1) -> int:
+    """
+    رقم الشارد المالك للسجل (ثابت بين العقد والعمليات، بخلاف hash() للنصوص)
+    nationality: كل جنسية في شارد واحد | arrival: توزيع دوري لـ partitions الوصول
+    """
+    if by == 'nationality':
+        return _NATIONALITY_CODES[record.nationality] % shard_count
+    if by == 'arrival':
+        return (record.arrival_day // partition_days) % shard_count
+    raise ValueError(f"unknown shard key {by!r}, expected one of {SHARD_KEYS}")
+
+
+def shard_records(
+    records: Iterable[PilgrimRecord],
+    shard_count: int,
+    by: str = 'nationality'
+) -> List[List[PilgrimRecord]]:
+    """تقسيم السجلات إلى shard_count شارد"""
+    shards: List[List[PilgrimRecord]] = [[] for _ in range(shard_count)]
+    for record in records:
+        shards[shard_of(record, shard_count, by)].append(record)
+    return shards
+
+
+# محوّلات مفاتيح العدّ الخام بعد JSON (المفاتيح غير المذكورة تبقى كما هي)
+_COUNT_KEY_DECODERS: Dict[str, Callable[[Any], Any]] = {
+    'nationality': Nationality.__getitem__,
+    'stay': lambda key: (Nationality[key[0]], PilgrimType[key[1]], key[2]),
+    'nationality_type': lambda key: (Nationality[key[0]], PilgrimType[key[1]]),
+}
+
+
+def _encode_count_key(key: Any) -> Any:
+    if isinstance(key, tuple):
+        return [_encode_count_key(part) for part in key]
+    return key.name if isinstance(key, Enum) else key
+
+
+class PartialAggregate:
+    """
+    نتيجة جزئية قابلة للدمج لشارد أو أكثر: العدّ الخام لـ DataAnalyzer مع PartitionStats
+    الدمج جمع عدّادات، فترتيب وصول الشاردات لا يغير التقرير النهائي
+    """
+
+    def __init__(
+        self,
+        counts: Optional[Dict[str, Counter]] = None,
+        stats: Optional[PartitionStats] = None,
+        shards: Optional[List[Dict[str, Any]]] = None
+    ):
+        self.counts: Dict[str, Counter] = counts if counts is not None else {}
+        self.stats = stats if stats is not None else PartitionStats()
+        self.shards: List[Dict[str, Any]] = shards if shards is not None else []
+
+    @classmethod
+    def from_records(
+        cls,
+        records: List[PilgrimRecord],
+        analyzer: Optional[DataAnalyzer] = None,
+        shard: Optional[str] = None
+    ) -> 'PartialAggregate':
+        """حساب النتيجة الجزئية لقائمة سجلات (دون بناء منصة)"""
+        analyzer = analyzer or DataAnalyzer(strategy='vectorized')
+        stats = PartitionStats()
+        stats.update(records)
+        return cls(analyzer.aggregate_counts(records, kernel=_report_counts), stats,
+                   [{'shard': shard, 'records': len(records)}])
+
+    def merge(self, other: 'PartialAggregate') -> 'PartialAggregate':
+        self.counts = _merge_counts([self.counts, other.counts])
+        self.stats.merge(other.stats)
+        self.shards.extend(other.shards)
+        return self
+
+    def to_bytes(self) -> bytes:
+        """تسلسل مضغوط (JSON + zlib) بدل pickle لأن الحمولة تعبر الشبكة"""
+        payload = {
+            'counts': {name: [[_encode_count_key(k), n] for k, n in counts.items()]
+                       for name, counts in self.counts.items()},
+            'stats': self.stats.to_dict(),
+            'shards': self.shards,
+        }
+        return zlib.compress(json.dumps(payload, ensure_ascii=False, separators=(',', ':'))
+                             .encode('utf-8'), 6)
+
+    @classmethod
+    def from_bytes(cls, payload: bytes) -> 'PartialAggregate':
+        data = json.loads(zlib.decompress(payload).decode('utf-8'))
+        counts = {}
+        for name, pairs in data['counts'].items():
+            decode = _COUNT_KEY_DECODERS.get(name)
+            counts[name] = Counter({(decode(k) if decode else k): n for k, n in pairs})
+        return cls(counts, PartitionStats.from_dict(data['stats']), data['shards'])
+
+    def to_report(
+        self,
+        calendar: str = 'gregorian',
+        ranking_sizes: Optional[Dict[str, int]] = None
+    ) -> Dict[str, Any]:
+        """التقرير الشامل بنفس شكل run_comprehensive_analysis"""
+        rankings = rank_sections(self.counts, resolve_ranking_sizes(ranking_sizes), calendar)
+        return _assemble_report(self.stats.to_summary(), _finalize_counts(self.counts, calendar),
+                                _finalize_flows(self.counts, calendar), rankings, {
+            'shards': self.shards,
+            'shard_count': len(self.shards),
+        })
+
+
+def _cluster_key(authkey: Optional[Any] = None) -> bytes:
+    """مفتاح HMAC المشترك (من المعامل أو متغير البيئة HAJJ_CLUSTER_KEY)"""
+    if authkey is None:
+        authkey = os.environ.get(CLUSTER_KEY_ENV, '')
+    return authkey.encode('utf-8') if isinstance(authkey, str) else authkey
+
+
+def _is_loopback(host: str) -> bool:
+    """هل كل عناوين المضيف محلية (loopback)؟ العنوان الفارغ يعني كل الواجهات"""
+    import ipaddress
+    import socket
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, None)}
+        return all(ipaddress.ip_address(address.split('%')[0]).is_loopback for address in addresses)
+    except (OSError, ValueError):
+        return False
+
+
+def _recv_exact(sock, size: int) -> bytes:
+    buffer = bytearray()
+    while len(buffer) < size:
+        chunk = sock.recv(min(size - len(buffer), 1 << 20))
+        if not chunk:
+            raise ConnectionError("connection closed mid-frame")
+        buffer += chunk
+    return bytes(buffer)
+
+
+def _write_frame(sock, payload: bytes, key: bytes):
+    digest = hmac.new(key, payload, hashlib.sha256).digest()
+    sock.sendall(_FRAME_HEADER.pack(_FRAME_MAGIC, len(payload), digest) + payload)
+
+
+def _read_frame(sock, key: bytes) -> bytes:
+    magic, length, digest = _FRAME_HEADER.unpack(_recv_exact(sock, _FRAME_HEADER.size))
+    if magic != _FRAME_MAGIC or length > _FRAME_MAX_BYTES:
+        raise ValueError("not a partial aggregate frame")
+    payload = _recv_exact(sock, length)
+    if not hmac.compare_digest(digest, hmac.new(key, payload, hashlib.sha256).digest()):
+        raise ValueError("partial aggregate failed authentication")
+    return payload
+
+
+@retry_on_failure(max_retries=5, delay=0.2, max_delay=2.0, exceptions=(OSError,))
+def send_partial(
+    address: Tuple[str, int],
+    partial: PartialAggregate,
+    authkey: Optional[Any] = None,
+    timeout: float = 30.0
+) -> int:
+    """
+    إرسال نتيجة جزئية إلى المنسق (مع إعادة المحاولة إن لم يكن جاهزاً بعد)
+    يعيد حجم الحمولة بالبايت
+    """
+    import socket
+    payload = partial.to_bytes()
+    with socket.create_connection(tuple(address), timeout=timeout) as sock:
+        _write_frame(sock, payload, _cluster_key(authkey))
+        if _recv_exact(sock, 1) != _ACK:
+            raise ValueError("coordinator rejected the partial aggregate")
+    logger.info(f"📤 Sent partial aggregate ({len(payload):,} bytes) to {address[0]}:{address[1]}")
+    return len(payload)
+
+
+class AggregationCoordinator:
+    """
+    المنسق: يستقبل النتائج الجزئية من العقد عبر TCP ويدمجها في التقرير الشامل
+    - الإطارات موقعة بـ HMAC، والإطارات غير الصالحة تُرفض دون إيقاف المنسق
+    - الشارد المكرر (إعادة إرسال بعد ضياع التأكيد) يُؤكَّد ولا يُدمج مرتين
+    - بلا مفتاح مشترك لا يقبل الاستماع إلا على عنوان محلي (loopback)
+    """
+
+    def __init__(
+        self,
+        expected_shards: int,
+        host: str = '127.0.0.1',
+        port: int = 0,
+        authkey: Optional[Any] = None,
+        timeout: float = 60.0
+    ):
+        import socket
+        self.expected_shards = expected_shards
+        self.timeout = timeout
+        self._key = _cluster_key(authkey)
+        if not self._key and not _is_loopback(host):
+            raise ValueError(f"refusing to listen on {host or 'all interfaces'} without a cluster key: "
+                             f"set {CLUSTER_KEY_ENV} or pass authkey")
+        self._socket = socket.create_server((host, port))
+        self.address: Tuple[str, int] = self._socket.getsockname()[:2]
+        self.partial = PartialAggregate()
+        self.payload_bytes = 0
+        self._received: set = set()
+        self._anonymous = 0
+
+    def __enter__(self) -> 'AggregationCoordinator':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self._socket.close()
+
+    def _receive(self, conn) -> bool:
+        """استقبال إطار واحد ودمجه؛ يعيد True عند قبول شارد جديد"""
+        try:
+            payload = _read_frame(conn, self._key)
+            partial = PartialAggregate.from_bytes(payload)
+        except (ValueError, ConnectionError, KeyError, TypeError, zlib.error) as e:
+            # إطار موقع بحمولة تالفة أو بصيغة غير متوقعة يُرفض دون إيقاف المنسق
+            logger.warning(f"⚠️  Rejected partial aggregate: {e!r}")
+            conn.sendall(_NAK)
+            return False
+
+        # الشاردات بلا اسم تُعد بالترتيب ولا يمكن اكتشاف تكرارها
+        shards = [str(info['shard']) if info.get('shard') is not None
+                  else f"#{self._anonymous + i}" for i, info in enumerate(partial.shards)]
+        accepted = not self._received.intersection(shards)
+        if accepted:
+            self._anonymous += sum(info.get('shard') is None for info in partial.shards)
+            self._received.update(shards)
+            self.partial.merge(partial)
+            self.payload_bytes += len(payload)
+            logger.info(f"📥 Merged shard(s) {', '.join(shards)} "
+                        f"({len(self._received)}/{self.expected_shards})")
+        conn.sendall(_ACK)
+        return accepted
+
+    def collect(self) -> PartialAggregate:
+        """انتظار كل الشاردات المتوقعة (أو TimeoutError بعد timeout ثانية)"""
+        deadline = time.monotonic() + self.timeout
+        while len(self._received) < self.expected_shards:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"received {len(self._received)} of "
+                                   f"{self.expected_shards} shards before the timeout")
+            self._socket.settimeout(remaining)
+            try:
+                conn, _ = self._socket.accept()
+            except OSError as e:
+                raise TimeoutError(f"received {len(self._received)} of "
+                                   f"{self.expected_shards} shards before the timeout") from e
+            with conn:
+                conn.settimeout(remaining)
+                try:
+                    self._receive(conn)
+                except OSError as e:
+                    logger.warning(f"⚠️  Lost connection from a worker: {e}")
+        return self.partial
+
+    def report(
+        self,
+        calendar: str = 'gregorian',
+        ranking_sizes: Optional[Dict[str, int]] = None
+    ) -> Dict[str, Any]:
+        """التقرير الشامل المدمج من كل الشاردات المستلمة"""
+        report = self.partial.to_report(calendar, ranking_sizes)
+        report['diagnostics']['payload_bytes'] = self.payload_bytes
+        return report
+
+
+def run_shard_worker(
+    address: Tuple[str, int],
+    records: Iterable[PilgrimRecord],
+    shard: Optional[str] = None,
+    authkey: Optional[Any] = None,
+    **platform_options
+) -> int:
+    """
+    عقدة عاملة: تحميل شاردها وحساب تجميعات DataAnalyzer محلياً ثم إرسال النتيجة الجزئية
+    platform_options: تمرر إلى HajjUmrahAnalyticsPlatform (strategy، max_workers، memory_budget)
+    """
+    platform = HajjUmrahAnalyticsPlatform(**platform_options)
+    try:
+        platform.load_records(records)
+        partial = platform.partial_aggregate(shard)
+    finally:
+        platform.cleanup()
+    return send_partial(address, partial, authkey)
+
+
+def run_local_cluster(
+    records: Iterable[PilgrimRecord],
+    shard_count: int,
+    by: str = 'nationality',
+    authkey: Optional[Any] = None,
+    timeout: float = 120.0,
+    calendar: str = 'gregorian',
+    **platform_options
+) -> Dict[str, Any]:
+    """
+    تشغيل منسق وعمليات محلية كبديل للعقد (كل عملية تتصل بالمنسق عبر socket)
+    """
+    import multiprocessing
+    shards = shard_records(records, shard_count, by)
+    with AggregationCoordinator(shard_count, authkey=authkey, timeout=timeout) as coordinator:
+        workers = [
+            multiprocessing.Process(
+                target=run_shard_worker,
+                args=(coordinator.address, shard, f"{by}-{i}", authkey),
+                kwargs=platform_options,
+            )
+            for i, shard in enumerate(shards)
+        ]
+        for worker in workers:
+            worker.start()
+        try:
+            coordinator.collect()
+        finally:
+            for worker in workers:
+                worker.join(timeout)
+                if worker.is_alive():
+                    worker.terminate()
+        return coordinator.report(calendar)
 
 
 # ==================== DEMO ====================
 
-def main():
+def run_demo(output: str = 'hajj_analysis_report.json', count: int = 50000):
     """
-    التطبيق الرئيسي - عرض توضيحي
+    عرض توضيحي لكل مراحل المنصة
     """
     print("=" * 60)
     print("🕋 منصة تحليل بيانات الحج والعمرة")
@@ -483,7 +3372,7 @@ def main():
     try:
         # 1. تحميل البيانات (Generator)
         print("📊 Step 1: Loading data using Generators...")
-        platform.load_data(count=50000)
+        platform.load_data(count=count)
         print()
         
         # 2. الإحصائيات الملخصة (Cached Decorator)
@@ -517,7 +3406,7 @@ def main():
         
         # 6. حفظ التقرير
         print("💾 Step 5: Exporting report...")
-        platform.export_report(report, '/home/claude/hajj_analysis_report.json')
+        platform.export_report(report, output)
         print()
         
         print("=" * 60)
@@ -532,5 +3421,389 @@ def main():
         platform.cleanup()
 
 
+# ==================== COMMAND LINE ====================
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'hajj_umrah_analytics')
+# يُرفع عند تغيير شكل البيانات أو التقرير لإبطال الذاكرة المؤقتة القديمة
+CACHE_FORMAT_VERSION = 3
+
+
+class SnapshotCache:
+    """
+    ذاكرة مؤقتة على القرص لمجموعات البيانات (segments مضغوطة) والتقارير
+    المفتاح مشتق من المدخلات، فأي تغيير في المدخلات ينتج مفتاحاً جديداً
+    """
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, enabled: bool = True):
+        self.directory = directory
+        self.enabled = enabled
+
+    @staticmethod
+    def key(**inputs) -> str:
+        payload = json.dumps({'format': CACHE_FORMAT_VERSION, **inputs}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()[:20]
+
+    def _path(self, kind: str, key: str, extension: str) -> str:
+        return os.path.join(self.directory, f"{kind}-{key}.{extension}")
+
+    def _read(self, path: str) -> Optional[bytes]:
+        if not self.enabled or not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def _write(self, path: str, payload: bytes):
+        """كتابة ذرية (ملف مؤقت ثم os.replace) لتفادي قراءة ملف ناقص"""
+        if not self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(payload)
+        os.replace(temp_path, path)
+
+    def load_dataset(self, key: str) -> Optional[List[PilgrimRecord]]:
+        payload = self._read(self._path('dataset', key, 'seg'))
+        return None if payload is None else decode_segment(payload)
+
+    def save_dataset(self, key: str, records: List[PilgrimRecord]):
+        self._write(self._path('dataset', key, 'seg'), encode_segment(records))
+
+    def load_report(self, key: str) -> Optional[Dict[str, Any]]:
+        payload = self._read(self._path('report', key, 'json'))
+        return None if payload is None else json.loads(payload.decode('utf-8'))
+
+    def save_report(self, key: str, report: Dict[str, Any]):
+        self._write(self._path('report', key, 'json'),
+                    json.dumps(report, ensure_ascii=False).encode('utf-8'))
+
+
+def read_records_file(path: str) -> Generator[PilgrimRecord, None, None]:
+    """Generator: قراءة سجلات من ملف JSON Lines أو مصفوفة JSON (بصيغة to_dict)"""
+    with open(path, encoding='utf-8') as f:
+        first = f.read(1)
+        f.seek(0)
+        if first == '[':
+            for item in json.load(f):
+                yield PilgrimRecord.from_dict(item)
+            return
+        for line in f:
+            if line.strip():
+                yield PilgrimRecord.from_dict(json.loads(line))
+
+
+def _dataset_key(args) -> str:
+    if args.input:
+        stat = os.stat(args.input)
+        return SnapshotCache.key(source='file', path=os.path.abspath(args.input),
+                                 size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+    return SnapshotCache.key(source='synthetic', count=args.count, seed=args.seed,
+                             reference=args.reference_date)
+
+
+def _resolve_dataset(args, cache: SnapshotCache) -> Tuple[str, List[PilgrimRecord]]:
+    """مجموعة البيانات من الذاكرة المؤقتة إن لم تتغير مدخلاتها، وإلا تُقرأ أو تُولّد ثم تُحفظ"""
+    key = _dataset_key(args)
+    records = cache.load_dataset(key)
+    if records is not None:
+        logger.info(f"📦 Reusing cached dataset snapshot {key} ({len(records):,} records)")
+        return key, records
+
+    if args.input:
+        records = list(read_records_file(args.input))
+    else:
+        reference = datetime.fromisoformat(args.reference_date)
+        records = list(generate_synthetic_pilgrims(args.count, args.seed, reference))
+    cache.save_dataset(key, records)
+    return key, records
+
+
+def _make_platform(args) -> HajjUmrahAnalyticsPlatform:
+    return HajjUmrahAnalyticsPlatform(
+        memory_budget=args.memory_budget,
+        strategy=args.engine,
+        max_workers=args.workers,
+    )
+
+
+def _resolve_report(args, cache: SnapshotCache) -> Tuple[str, Dict[str, Any]]:
+    """
+    التقرير من الذاكرة المؤقتة إن لم تتغير البيانات وإعدادات التنفيذ، وإلا يُحسب ويُحفظ
+    (التقرير يحمل خطة التنفيذ في diagnostics فالمفتاح يشمل المحرك والعمال وميزانية الذاكرة)
+    """
+    dataset_key = _dataset_key(args)
+    key = SnapshotCache.key(report='comprehensive', dataset=dataset_key, engine=args.engine,
+                            workers=args.workers, memory_budget=args.memory_budget)
+    report = cache.load_report(key)
+    if report is not None:
+        logger.info(f"📦 Reusing cached report {key}")
+        return key, report
+
+    _, records = _resolve_dataset(args, cache)
+    platform = _make_platform(args)
+    try:
+        platform.load_records(records)
+        report = platform.run_comprehensive_analysis()
+    finally:
+        platform.cleanup()
+    cache.save_report(key, report)
+    return key, report
+
+
+def _parse_nationality(value: str) -> Nationality:
+    try:
+        return Nationality[value.upper()]
+    except KeyError:
+        return Nationality(value)
+
+
+def _parse_pilgrim_type(value: str) -> PilgrimType:
+    try:
+        return PilgrimType[value.upper()]
+    except KeyError:
+        return PilgrimType(value)
+
+
+def _cmd_generate(args, cache: SnapshotCache) -> int:
+    key, records = _resolve_dataset(args, cache)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record.to_dict(), ensure_ascii=False) + '\n')
+    print(f"generated {len(records):,} records (snapshot {key})")
+    return 0
+
+
+def _cmd_ingest(args, cache: SnapshotCache) -> int:
+    key, records = _resolve_dataset(args, cache)
+    duplicates = PilgrimIndex().build(records)
+    print(f"ingested {len(records):,} records (snapshot {key}, {len(duplicates):,} duplicate identifiers)")
+    return 0
+
+
+def _print_report(title: str, report: Dict[str, Any], output: Optional[str] = None):
+    summary = report['summary']
+    print(f"{title} (generated at {report['generated_at']})")
+    print(f"  total pilgrims: {summary['total_pilgrims']:,} "
+          f"(hajj {summary['hajj_pilgrims']:,} | umrah {summary['umrah_pilgrims']:,})")
+    print(f"  average age: {summary['average_age']:.1f}")
+    for nationality, count in report['top_nationalities'].items():
+        print(f"  {nationality}: {count:,}")
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+def _cmd_analyze(args, cache: SnapshotCache) -> int:
+    key, report = _resolve_report(args, cache)
+    _print_report(f"report {key}", report, args.output)
+    return 0
+
+
+def _cmd_filter(args, cache: SnapshotCache) -> int:
+    _, records = _resolve_dataset(args, cache)
+    criteria: Dict[str, Any] = {}
+    if args.nationality:
+        criteria['nationality'] = _parse_nationality(args.nationality)
+    if args.pilgrim_type:
+        criteria['pilgrim_type'] = _parse_pilgrim_type(args.pilgrim_type)
+    if args.min_age is not None:
+        criteria['min_age'] = args.min_age
+    if args.max_age is not None:
+        criteria['max_age'] = args.max_age
+    if args.arrival_from:
+        criteria['arrival_from'] = datetime.fromisoformat(args.arrival_from)
+    if args.arrival_to:
+        criteria['arrival_to'] = datetime.fromisoformat(args.arrival_to)
+
+    if 'arrival_from' in criteria or 'arrival_to' in criteria:
+        store = PartitionedStore()
+        store.add(records)
+        matches = list(filter_by_criteria(store, criteria))
+    else:
+        matches = list(filter_by_criteria(records, criteria))
+    rows = redact_records(matches)
+
+    output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    try:
+        for row in rows:
+            output.write(json.dumps(row, ensure_ascii=False) + '\n')
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    if args.output:
+        print(f"{len(rows):,} matching records written to {args.output}")
+    return 0
+
+
+def _cmd_export(args, cache: SnapshotCache) -> int:
+    _, report = _resolve_report(args, cache)
+    if args.format == 'json':
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    else:
+        import csv
+        with open(args.output, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['section', 'key', 'value'])
+            for name, value in report['summary'].items():
+                writer.writerow(['summary', name, value])
+            for section, values in report['detailed_analysis'].items():
+                for name, value in (values or {}).items():
+                    writer.writerow([section, name, value])
+            for day, flow in report['flow_analysis']['daily_flow'].items():
+                for name, value in flow.items():
+                    writer.writerow([f"daily_{name}", day, value])
+            for name, value in report['flow_analysis']['length_of_stay']['overall']['histogram'].items():
+                writer.writerow(['length_of_stay_days', name, value])
+    print(f"report exported to {args.output}")
+    return 0
+
+
+def _parse_address(value: str) -> Tuple[str, int]:
+    host, _, port = value.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+def _cmd_coordinate(args, cache: SnapshotCache) -> int:
+    host, port = _parse_address(args.bind)
+    with AggregationCoordinator(args.shards, host, port, timeout=args.timeout) as coordinator:
+        print(f"listening on {coordinator.address[0]}:{coordinator.address[1]} "
+              f"for {args.shards} shards", flush=True)
+        coordinator.collect()
+        report = coordinator.report()
+    _print_report(f"merged report from {args.shards} shards "
+                  f"({report['diagnostics']['payload_bytes']:,} bytes received)", report, args.output)
+    return 0
+
+
+def _cmd_worker(args, cache: SnapshotCache) -> int:
+    _, records = _resolve_dataset(args, cache)
+    shard = args.shard_id
+    if args.shards:
+        # مجموعة بيانات كاملة على كل عقدة: كل عامل يحتفظ بشارده فقط
+        if shard is None:
+            raise SystemExit("--shards requires --shard-id")
+        shard_id = int(shard)
+        records = [r for r in records if shard_of(r, args.shards, args.by) == shard_id]
+        shard = f"{args.by}-{shard_id}"
+    if shard is None:
+        import socket
+        shard = f"{socket.gethostname()}:{os.getpid()}"
+
+    platform = _make_platform(args)
+    try:
+        platform.load_records(records)
+        partial = platform.partial_aggregate(shard)
+    finally:
+        platform.cleanup()
+    size = send_partial(_parse_address(args.coordinator), partial)
+    print(f"shard {shard}: sent {len(records):,} records as a {size:,}-byte partial aggregate")
+    return 0
+
+
+def _cmd_demo(args, cache: SnapshotCache) -> int:
+    run_demo(args.output, args.count)
+    return 0
+
+
+def build_parser():
+    """بناء واجهة سطر الأوامر"""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog='hajj_umrah_analytics',
+        description='Hajj & Umrah Analytics Platform - منصة تحليل بيانات الحج والعمرة',
+    )
+    parser.add_argument('--log-level', default='WARNING',
+                        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'])
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--no-cache', action='store_true',
+                        help='always regenerate datasets and reports')
+    parser.add_argument('--engine', default='auto',
+                        choices=('auto',) + ExecutionPlanner.STRATEGIES)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--memory-budget', type=int, default=None,
+                        help='max records kept in memory before spilling to disk')
+
+    dataset = argparse.ArgumentParser(add_help=False)
+    dataset.add_argument('--input', help='JSON Lines / JSON file of records (to_dict format)')
+    dataset.add_argument('--count', type=int, default=50000, help='synthetic records to generate')
+    dataset.add_argument('--seed', type=int, default=0)
+    dataset.add_argument('--reference-date', default=date.today().isoformat(),
+                         help='synthetic arrivals fall in the 30 days before this date')
+
+    commands = parser.add_subparsers(dest='command')
+
+    generate = commands.add_parser('generate', parents=[dataset], help='generate synthetic records')
+    generate.add_argument('--output', help='write records as JSON Lines')
+    generate.set_defaults(handler=_cmd_generate)
+
+    ingest = commands.add_parser('ingest', help='ingest a records file into the snapshot cache')
+    ingest.add_argument('input')
+    ingest.set_defaults(handler=_cmd_ingest)
+
+    analyze = commands.add_parser('analyze', parents=[dataset], help='run the comprehensive analysis')
+    analyze.add_argument('--output', help='also write the report as JSON')
+    analyze.set_defaults(handler=_cmd_analyze)
+
+    filter_ = commands.add_parser('filter', parents=[dataset], help='filter records')
+    filter_.add_argument('--nationality', help='e.g. SAUDI or سعودي')
+    filter_.add_argument('--type', dest='pilgrim_type', help='HAJJ or UMRAH')
+    filter_.add_argument('--min-age', type=int)
+    filter_.add_argument('--max-age', type=int)
+    filter_.add_argument('--from', dest='arrival_from', help='ISO date/time (inclusive)')
+    filter_.add_argument('--to', dest='arrival_to', help='ISO date/time (exclusive)')
+    filter_.add_argument('--output', help='JSON Lines output (default: stdout)')
+    filter_.set_defaults(handler=_cmd_filter)
+
+    export = commands.add_parser('export', parents=[dataset], help='export the report')
+    export.add_argument('--output', required=True)
+    export.add_argument('--format', choices=['json', 'csv'], default='json')
+    export.set_defaults(handler=_cmd_export)
+
+    coordinate = commands.add_parser('coordinate',
+                                     help='merge partial aggregates sent by worker nodes')
+    coordinate.add_argument('--shards', type=int, required=True, help='number of workers to wait for')
+    coordinate.add_argument('--bind', default='127.0.0.1:7390', help='HOST:PORT to listen on')
+    coordinate.add_argument('--timeout', type=float, default=600.0)
+    coordinate.add_argument('--output', help='also write the merged report as JSON')
+    coordinate.set_defaults(handler=_cmd_coordinate)
+
+    worker = commands.add_parser('worker', parents=[dataset],
+                                 help='aggregate a local shard and send it to the coordinator')
+    worker.add_argument('--coordinator', required=True, help='HOST:PORT of the coordinator')
+    worker.add_argument('--shard-id', help='shard name (or number with --shards)')
+    worker.add_argument('--shards', type=int, help='keep only records of shard --shard-id out of N')
+    worker.add_argument('--by', choices=SHARD_KEYS, default='nationality')
+    worker.set_defaults(handler=_cmd_worker)
+
+    demo = commands.add_parser('demo', help='run the walkthrough demo (default)')
+    demo.add_argument('--output', default='hajj_analysis_report.json')
+    demo.add_argument('--count', type=int, default=50000)
+    demo.set_defaults(handler=_cmd_demo)
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    نقطة الدخول: python hajj_umrah_analytics.py <command> [options]
+    بدون أمر يُشغّل العرض التوضيحي
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command is None:
+        args = parser.parse_args(['--log-level', 'INFO', *argv, 'demo'])
+
+    logging.basicConfig(
+        level=getattr(logging, args.log_level),
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    cache = SnapshotCache(args.cache_dir, enabled=not args.no_cache)
+    return args.handler(args, cache)
+
+
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -5,6 +5,8 @@ Unit tests for Hajj & Umrah Analytics Platform
 import unittest
 import sys
 import os
+import pickle
+from dataclasses import replace
 from datetime import datetime, timedelta
 from unittest.mock import patch, MagicMock
 
@@ -21,6 +23,30 @@ from hajj_umrah_analytics import (
     privacy_compliance,
     performance_monitor,
     cache_results,
+    retry_on_failure,
+    CircuitBreaker,
+    CircuitOpenError,
+    RetryBudget,
+    ExecutionPlanner,
+    SharedWorkerPool,
+    CalendarTable,
+    hijri_from_ordinal,
+    get_calendar,
+    PilgrimIndex,
+    PartitionedStore,
+    filter_by_criteria,
+    encode_segment,
+    decode_segment,
+    PartialAggregate,
+    AggregationCoordinator,
+    send_partial,
+    shard_records,
+    run_local_cluster,
+    top_n,
+    RankedCounter,
+    rank_sections,
+    resolve_ranking_sizes,
+    main,
 )
 
 
@@ -83,6 +109,145 @@ class TestDecorators(unittest.TestCase):
         self.assertEqual(call_count[0], 1)  # لم يزد
 
 
+class TestRetry(unittest.TestCase):
+    """اختبارات إعادة المحاولة وقاطع الدائرة"""
+    
+    def test_retry_filters_exception_types(self):
+        """اختبار إعادة المحاولة لأنواع الاستثناءات المحددة فقط"""
+        calls = [0]
+        
+        @retry_on_failure(max_retries=3, delay=0.001, exceptions=(ConnectionError,))
+        def flaky():
+            calls[0] += 1
+            if calls[0] < 3:
+                raise ConnectionError("down")
+            return "ok"
+        
+        self.assertEqual(flaky(), "ok")
+        self.assertEqual(calls[0], 3)
+        
+        @retry_on_failure(max_retries=3, delay=0.001, exceptions=(ConnectionError,))
+        def broken():
+            calls[0] += 1
+            raise ValueError("bad input")
+        
+        calls[0] = 0
+        with self.assertRaises(ValueError):
+            broken()
+        self.assertEqual(calls[0], 1)  # لا إعادة محاولة
+    
+    def test_retry_budget_and_deadline(self):
+        """اختبار ميزانية إعادة المحاولة والمهلة الكلية"""
+        budget = RetryBudget(ratio=0.1, min_retries=1)
+        calls = [0]
+        
+        @retry_on_failure(max_retries=5, delay=0.001, budget=budget)
+        def always_fails():
+            calls[0] += 1
+            raise IOError("down")
+        
+        with self.assertRaises(IOError):
+            always_fails()
+        self.assertEqual(calls[0], 2)  # محاولة + إعادة واحدة من الميزانية
+        
+        @retry_on_failure(max_retries=10, delay=1.0, jitter=False, deadline=0.5)
+        def slow_fails():
+            raise IOError("down")
+        
+        import time
+        start = time.monotonic()
+        with self.assertRaises(IOError):
+            slow_fails()
+        self.assertLess(time.monotonic() - start, 0.5)
+    
+    def test_circuit_breaker_fails_fast(self):
+        """اختبار فشل قاطع الدائرة السريع ثم التعافي"""
+        breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=0.05)
+        calls = [0]
+        
+        @retry_on_failure(max_retries=1, circuit_breaker=breaker)
+        def source(fail=True):
+            calls[0] += 1
+            if fail:
+                raise IOError("down")
+            return "ok"
+        
+        for _ in range(2):
+            with self.assertRaises(IOError):
+                source()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        
+        with self.assertRaises(CircuitOpenError):
+            source()
+        self.assertEqual(calls[0], 2)  # لم يُستدعَ المصدر
+        
+        import time
+        time.sleep(0.06)
+        self.assertEqual(source(fail=False), "ok")
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+    
+    def test_circuit_breaker_allows_single_trial_when_half_open(self):
+        """اختبار مرور مستدعٍ تجريبي واحد فقط في حالة half_open"""
+        import time
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0.05)
+        breaker.record_failure()
+        time.sleep(0.06)
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        
+        breaker.before_call()  # المحاولة التجريبية
+        for _ in range(4):
+            with self.assertRaises(CircuitOpenError):
+                breaker.before_call()
+        
+        breaker.record_failure()  # فشل التجربة يعيد فتح الدائرة
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        time.sleep(0.06)
+        breaker.before_call()
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        breaker.before_call()
+        breaker.before_call()
+    
+    def test_caller_errors_do_not_trip_the_breaker(self):
+        """اختبار أن أخطاء المستدعي لا تُعاد ولا تفتح الدائرة ولا تمس المنصات الأخرى"""
+        first, second = HajjUmrahAnalyticsPlatform(), HajjUmrahAnalyticsPlatform()
+        for _ in range(6):
+            with self.assertRaises(ValueError):
+                first.load_data(count="bad")
+        self.assertEqual(first.source_breaker.state, CircuitBreaker.CLOSED)
+        second.load_data(count=10)
+        self.assertEqual(len(second.records), 10)
+        
+        with patch('hajj_umrah_analytics.generate_synthetic_pilgrims', side_effect=OSError("disk")), \
+                patch('time.sleep'):
+            for _ in range(2):
+                with self.assertRaises((OSError, CircuitOpenError)):
+                    second.load_data(count=10)
+        self.assertEqual(second.source_breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(first.source_breaker.state, CircuitBreaker.CLOSED)
+        first.load_data(count=5)
+        self.assertEqual(len(first.records), 5)
+        for platform in (first, second):
+            platform.cleanup()
+    
+    def test_async_retry(self):
+        """اختبار إعادة المحاولة غير الحاجبة لدوال async"""
+        import asyncio
+        import inspect
+        calls = [0]
+        
+        @retry_on_failure(max_retries=3, delay=0.001)
+        async def flaky():
+            calls[0] += 1
+            if calls[0] < 2:
+                raise ConnectionError("down")
+            return "ok"
+        
+        self.assertTrue(inspect.iscoroutinefunction(flaky))
+        self.assertEqual(asyncio.run(flaky()), "ok")
+        self.assertEqual(calls[0], 2)
+
+
 class TestGenerators(unittest.TestCase):
     """اختبارات الـ Generators"""
     
@@ -168,6 +333,86 @@ class TestDataAnalyzer(unittest.TestCase):
         self.assertIn('age_groups', result)
         self.assertIn('peak_periods', result)
     
+    def test_strategies_agree(self):
+        """اختبار تطابق نتائج كل استراتيجيات التنفيذ"""
+        expected = None
+        for strategy in ExecutionPlanner.STRATEGIES:
+            analyzer = DataAnalyzer(max_workers=2, strategy=strategy)
+            try:
+                plan = analyzer.plan(self.test_records)
+                self.assertEqual(plan.strategy, strategy)
+                result = analyzer.parallel_comprehensive_analysis(self.test_records, plan=plan)
+            finally:
+                analyzer.shutdown()
+            if expected is None:
+                expected = result
+            self.assertEqual(result, expected)
+    
+    def test_planner_prefers_inline_for_small_inputs(self):
+        """اختبار اختيار المسار المباشر للبيانات الصغيرة"""
+        planner = ExecutionPlanner(max_workers=4)
+        plan = planner.plan(100)
+        estimates = plan.estimated_seconds
+        self.assertEqual(plan.strategy, min(estimates, key=estimates.get))
+        self.assertIn(plan.strategy, ('serial', 'vectorized'))
+        self.assertGreater(estimates['processes'], estimates[plan.strategy])
+        # التكاليف الثابتة محسوبة حتى دون سجلات
+        self.assertTrue(all(cost > 0 for cost in planner.estimate(0).values()))
+        with self.assertRaises(ValueError):
+            ExecutionPlanner().plan(100, strategy='gpu')
+    
+    def test_planner_choice_follows_records_and_cores(self):
+        """اختبار تغيّر الاختيار مع عدد السجلات وعدد الأنوية"""
+        calibration = {
+            'serial_per_record': 2e-6,
+            'serial_fixed': 1e-6,
+            'vectorized_per_record': 1e-6,
+            'vectorized_fixed': 1e-4,
+            'transfer_per_record': 2e-6,
+            'task_overhead': 1e-4,
+        }
+        choose = lambda workers, n: ExecutionPlanner(workers, calibration).plan(n).strategy
+        
+        # التكلفة الثابتة تحسم البيانات الصغيرة، وتكلفة السجل تحسم الكبيرة
+        self.assertEqual(choose(1, 10), 'serial')
+        self.assertEqual(choose(1, 100000), 'vectorized')
+        # النقل يتوزع على العمال: مع أنوية كافية تفوز processes بنفس عدد السجلات
+        self.assertEqual(choose(2, 10**7), 'vectorized')
+        self.assertEqual(choose(16, 10**7), 'processes')
+        self.assertEqual(choose(16, 10), 'serial')
+    
+    def test_shared_worker_pool_lifecycle(self):
+        """اختبار إنشاء المجمع المشترك عند الحاجة وإغلاقه مع آخر مستخدم"""
+        pool = SharedWorkerPool.get('thread', 3)
+        self.assertIs(pool, SharedWorkerPool.get('thread', 3))
+        self.assertFalse(pool.is_running)
+        with pool as executor:
+            with pool:
+                self.assertEqual(executor.submit(sum, [1, 2]).result(), 3)
+            self.assertTrue(pool.is_running)
+        self.assertFalse(pool.is_running)
+    
+    def test_batch_health_triage(self):
+        """اختبار الفرز الصحي الدفعي"""
+        expected = [r for r in self.test_records if r.health_status == 'يحتاج متابعة']
+        result = self.analyzer.triage_health(iter(self.test_records), chunk_size=30)
+        
+        self.assertEqual(result['screened'], 100)
+        self.assertEqual(result['requires_attention'], len(expected))
+        self.assertEqual(sum(result['by_age_group'].values()), len(expected))
+        self.assertEqual(sum(result['by_nationality'].values()), len(expected))
+        self.assertEqual(sum(result['by_accommodation'].values()), len(expected))
+        self.assertEqual(sorted(result['new_flags']), sorted(r.id for r in expected))
+        for row, record in zip(result['attention_list'], expected):
+            self.assertEqual(row['id'], record.id)
+            self.assertNotEqual(row['national_id'], record.national_id)
+            self.assertNotIn(record.phone, str(row))
+        
+        # تشغيل ثانٍ: لا حالات جديدة
+        again = self.analyzer.triage_health(self.test_records, previous_flags=result['flagged_ids'])
+        self.assertEqual(again['new_flags'], [])
+        self.assertEqual(again['cleared_flags'], [])
+    
     def test_health_status_privacy(self):
         """اختبار حماية البيانات الصحية"""
         test_record = {
@@ -181,6 +426,491 @@ class TestDataAnalyzer(unittest.TestCase):
         self.assertNotIn('1234567890', str(result))
 
 
+class TestFlowAnalytics(unittest.TestCase):
+    """اختبارات مدة الإقامة والتدفقات اليومية وموجات الساعات"""
+    
+    def setUp(self):
+        self.analyzer = DataAnalyzer(strategy='vectorized')
+        base = list(generate_synthetic_pilgrims(4, seed=5))
+        day = datetime(2025, 6, 1)
+        # (جنسية، نوع، وصول، مدة الإقامة بالأيام)
+        layout = [
+            (Nationality.SAUDI, PilgrimType.HAJJ, day + timedelta(hours=8), 3),
+            (Nationality.SAUDI, PilgrimType.UMRAH, day + timedelta(hours=8, minutes=30), 5),
+            (Nationality.EGYPTIAN, PilgrimType.HAJJ, day + timedelta(days=1, hours=22), 5),
+            (Nationality.EGYPTIAN, PilgrimType.HAJJ, day + timedelta(days=1, hours=23), 45),
+        ]
+        self.records = [
+            replace(record, nationality=nat, pilgrim_type=kind, arrival_date=arrival,
+                    departure_date=arrival + timedelta(days=stay))
+            for record, (nat, kind, arrival, stay) in zip(base, layout)
+        ]
+    
+    def test_length_of_stay_histograms(self):
+        """اختبار خانات مدة الإقامة الثابتة حسب الجنسية والنوع"""
+        stay = self.analyzer.analyze_flows(self.records)['length_of_stay']
+        
+        overall = stay['overall']
+        self.assertEqual(overall['count'], 4)
+        self.assertEqual(overall['histogram']['3'], 1)
+        self.assertEqual(overall['histogram']['5'], 2)
+        self.assertEqual(overall['histogram']['30+'], 1)
+        self.assertEqual(len(overall['histogram']), 31)
+        self.assertEqual(overall['mean_days'], (3 + 5 + 5 + 45) / 4)
+        self.assertEqual(overall['median_days'], 5)
+        
+        self.assertEqual(stay['by_nationality']['سعودي']['histogram']['3'], 1)
+        self.assertEqual(stay['by_nationality']['مصري']['p90_days'], 30)
+        self.assertEqual(stay['by_pilgrim_type']['عمرة']['count'], 1)
+        self.assertEqual(stay['by_pilgrim_type']['حج']['count'], 3)
+    
+    def test_daily_flow_and_hourly_waves(self):
+        """اختبار التدفق اليومي الصافي وموجات الوصول والمغادرة بالساعة"""
+        flows = self.analyzer.analyze_flows(self.records)
+        
+        daily = flows['daily_flow']
+        self.assertEqual(daily['2025-06-01'], {'arrivals': 2, 'departures': 0, 'net': 2})
+        self.assertEqual(daily['2025-06-04'], {'arrivals': 0, 'departures': 1, 'net': -1})
+        self.assertEqual(sum(f['net'] for f in daily.values()), 0)
+        self.assertEqual(list(daily), sorted(daily))
+        
+        waves = flows['hourly_waves']
+        self.assertEqual(len(waves['arrivals']), 24)
+        self.assertEqual(waves['arrivals']['08:00'], 2)
+        self.assertEqual(waves['departures']['22:00'], 1)
+        self.assertEqual(sum(waves['departures'].values()), 4)
+    
+    def test_flows_merge_across_chunks_and_ranges(self):
+        """اختبار تطابق التدفقات بين قائمة كاملة وتدفق على دفعات ومدى زمني"""
+        records = list(generate_synthetic_pilgrims(500, seed=3, reference=datetime(2025, 6, 1)))
+        expected = self.analyzer.analyze_flows(records, calendar='hijri')
+        self.assertEqual(self.analyzer.analyze_flows(iter(records), 'hijri', chunk_size=64), expected)
+        
+        platform = HajjUmrahAnalyticsPlatform()
+        platform.load_records(records)
+        start, end = datetime(2025, 5, 10), datetime(2025, 5, 15)
+        in_range = sum(1 for r in records if start <= r.arrival_date < end)
+        flows = platform.flow_analysis(start, end)
+        self.assertEqual(flows['length_of_stay']['overall']['count'], in_range)
+        self.assertEqual(platform.run_comprehensive_analysis()['flow_analysis'],
+                         self.analyzer.analyze_flows(records))
+        platform.cleanup()
+    
+    def test_comprehensive_report_counts_in_one_pass(self):
+        """اختبار بناء التوزيعات والتدفقات من مرور عدّ واحد بنفس نتائج كل الاستراتيجيات"""
+        import hajj_umrah_analytics
+        records = list(generate_synthetic_pilgrims(600, seed=8, reference=datetime(2025, 6, 1)))
+        reports = {}
+        for strategy in ('serial', 'threads', 'vectorized'):
+            platform = HajjUmrahAnalyticsPlatform(strategy=strategy)
+            platform.load_records(records)
+            with patch.object(hajj_umrah_analytics, '_report_counts',
+                              wraps=hajj_umrah_analytics._report_counts) as kernel, \
+                    patch.object(DataAnalyzer, 'aggregate_counts',
+                                 wraps=platform.analyzer.aggregate_counts) as aggregate:
+                reports[strategy] = platform.run_comprehensive_analysis()
+            if strategy == 'vectorized':
+                kernel.assert_called_once()
+                aggregate.assert_called_once()
+            platform.cleanup()
+        for strategy in ('threads', 'vectorized'):
+            self.assertEqual(reports[strategy]['detailed_analysis'], reports['serial']['detailed_analysis'])
+            self.assertEqual(reports[strategy]['flow_analysis'], reports['serial']['flow_analysis'])
+
+
+class TestCalendar(unittest.TestCase):
+    """اختبارات ترميز التواريخ والتقويم الهجري"""
+    
+    def test_epoch_day_encoding(self):
+        """اختبار ترميز التواريخ كأرقام أيام وساعات"""
+        record = next(generate_synthetic_pilgrims(1))
+        table = get_calendar(record.arrival_day, record.arrival_day)
+        self.assertEqual(
+            table.label(record.arrival_day),
+            record.arrival_date.strftime('%Y-%m-%d')
+        )
+        self.assertEqual(record.arrival_hour % 24, record.arrival_date.hour)
+    
+    def test_hijri_conversion_and_phases(self):
+        """اختبار التحويل الهجري ومراحل الموسم"""
+        from datetime import date
+        self.assertEqual(hijri_from_ordinal(date(2025, 3, 1).toordinal()), (1446, 9, 1))
+        
+        day = date(2024, 6, 15).toordinal() - date(1970, 1, 1).toordinal()
+        table = CalendarTable(day, day + 1)
+        self.assertEqual(table.label(day, 'hijri'), '1445-12-09')
+        self.assertEqual(table.label(day, 'phase'), 'يوم عرفة')
+        self.assertEqual(table.label(day + 1, 'phase'), 'يوم النحر')
+        with self.assertRaises(ValueError):
+            table.label(day, 'julian')
+    
+    def test_arafah_matches_umm_al_qura(self):
+        """اختبار مطابقة يوم عرفة لتقويم أم القرى واستمرارية الأيام عند حدود التصحيح"""
+        from datetime import date
+        for arafah in (date(2023, 6, 27), date(2024, 6, 15), date(2025, 6, 5)):
+            year, month, day = hijri_from_ordinal(arafah.toordinal())
+            self.assertEqual((month, day), (12, 9))
+        self.assertEqual(hijri_from_ordinal(date(2025, 6, 26).toordinal()), (1447, 1, 1))
+        
+        previous = hijri_from_ordinal(date(2023, 1, 1).toordinal())
+        for ordinal in range(date(2023, 1, 2).toordinal(), date(2026, 1, 1).toordinal()):
+            current = hijri_from_ordinal(ordinal)
+            if current[:2] == previous[:2]:
+                self.assertEqual(current[2], previous[2] + 1)
+            else:
+                self.assertEqual(current[2], 1)
+                self.assertIn(previous[2], (29, 30))
+            previous = current
+    
+    def test_peak_periods_calendars(self):
+        """اختبار تحليل الذروة بالتقويمين والإشغال اليومي"""
+        analyzer = DataAnalyzer(max_workers=1)
+        records = list(generate_synthetic_pilgrims(200))
+        try:
+            gregorian = analyzer.analyze_peak_periods(records)
+            hijri = analyzer.analyze_peak_periods(records, calendar='hijri')
+            occupancy = analyzer.analyze_occupancy(records)
+        finally:
+            analyzer.shutdown()
+        
+        self.assertEqual(sum(gregorian.values()), 200)
+        self.assertEqual(sum(hijri.values()), 200)
+        self.assertEqual(len(gregorian), len(hijri))
+        self.assertEqual(max(occupancy.values()), max(
+            sum(1 for r in records if r.arrival_date.date() <= d <= r.departure_date.date())
+            for d in {r.arrival_date.date() for r in records}
+        ))
+
+
+class TestPilgrimIndex(unittest.TestCase):
+    """اختبارات الفهرس الأساسي وفهارس الهوية"""
+    
+    def setUp(self):
+        self.records = list(generate_synthetic_pilgrims(50))
+        self.index = PilgrimIndex()
+        self.duplicates = self.index.build(self.records)
+    
+    def test_lookup_by_id_and_identity(self):
+        """اختبار البحث بالمعرف والهوية المجزأة"""
+        record = self.records[10]
+        self.assertIs(self.index.get(record.id), record)
+        self.assertIs(self.index.find_by_identity('national_id', record.national_id), record)
+        self.assertIs(self.index.find_by_identity('passport_number', record.passport_number), record)
+        self.assertIsNone(self.index.get('missing'))
+        # الفهرس لا يحتفظ بالرقم الوطني الأصلي
+        self.assertNotIn(record.national_id, str(self.index.identities))
+    
+    def test_duplicate_detection(self):
+        """اختبار اكتشاف تكرار الهوية أثناء البناء والإدراج"""
+        import dataclasses
+        clone = dataclasses.replace(self.records[0], id="PIL99999999")
+        duplicates = PilgrimIndex().build(self.records + [clone])
+        fields = {d['field'] for d in duplicates}
+        self.assertEqual(fields, {'national_id', 'passport_number'})
+        self.assertTrue(all(d['existing_id'] == self.records[0].id for d in duplicates))
+        self.assertEqual(len(self.index.identity_conflicts(clone)), 2)
+    
+    def test_upsert_and_delete(self):
+        """اختبار الإدراج والتحديث والحذف"""
+        import dataclasses
+        old_national_id = self.records[5].national_id
+        updated = dataclasses.replace(self.records[5], national_id="1111111111")
+        self.assertFalse(self.index.upsert(updated))
+        self.assertIsNone(self.index.find_by_identity('national_id', old_national_id))
+        self.assertIs(self.index.find_by_identity('national_id', "1111111111"), updated)
+        
+        new = next(generate_synthetic_pilgrims(1))
+        new = dataclasses.replace(new, id="PIL77777777")
+        self.assertTrue(self.index.upsert(new))
+        self.assertEqual(len(self.index), 51)
+        
+        first_id = self.records[0].id
+        self.assertTrue(self.index.delete(first_id))
+        self.assertFalse(self.index.delete(first_id))
+        self.assertIsNone(self.index.get(first_id))
+        self.assertIs(self.index.get(new.id), new)  # نُقل إلى مكان المحذوف
+        self.assertEqual(len(self.index.records), 50)
+    
+    def test_duplicate_ids_are_rejected_on_build(self):
+        """اختبار استبعاد المعرفات المكررة أثناء البناء (يبقى أول ظهور)"""
+        import dataclasses
+        repeat = dataclasses.replace(self.records[3], age=99)
+        index = PilgrimIndex()
+        duplicates = index.build(self.records + [repeat])
+        self.assertIn({'field': 'id', 'record_id': repeat.id, 'existing_id': repeat.id}, duplicates)
+        self.assertEqual(len(index), len(index.records))
+        self.assertIs(index.get(repeat.id), self.records[3])
+        
+        # الحذف بالتبديل مع آخر سجل يبقى متسقاً
+        for record in self.records[:10]:
+            self.assertTrue(index.delete(record.id))
+        self.assertEqual(len(index), len(index.records))
+        for record in self.records[10:]:
+            self.assertIs(index.get(record.id), record)
+    
+    def test_identity_conflict_keeps_existing_owner(self):
+        """اختبار عدم استيلاء سجل جديد على هوية مسجلة لسجل آخر"""
+        import dataclasses
+        owner = self.records[0]
+        clone = dataclasses.replace(owner, id="PIL99999999")
+        self.assertTrue(self.index.upsert(clone))
+        self.assertIs(self.index.find_by_identity('national_id', owner.national_id), owner)
+        self.assertIs(self.index.get(clone.id), clone)
+        
+        self.index.delete(clone.id)
+        self.assertIs(self.index.find_by_identity('national_id', owner.national_id), owner)
+
+    def test_copy_shares_unchanged_data(self):
+        """اختبار أن نسخ الفهرس لكل كتابة يتشارك الكتل والـ shards غير المعدلة"""
+        records = list(generate_synthetic_pilgrims(10000))
+        base = PilgrimIndex(records)
+        base.delete(records[0].id)  # أول كتابة تقسم القواميس المبنية دفعة واحدة
+        
+        clone = base.copy()
+        updated = replace(records[5000], age=99)
+        clone.upsert(updated)
+        clone.delete(records[1].id)
+        
+        self.assertEqual(base.get(records[5000].id).age, records[5000].age)
+        self.assertIs(base.get(records[1].id), records[1])
+        self.assertEqual(len(base), 9999)
+        self.assertIs(clone.get(updated.id), updated)
+        self.assertIsNone(clone.get(records[1].id))
+        self.assertEqual(len(clone), 9998)
+        self.assertEqual(sorted(r.id for r in clone.records), sorted(clone.primary))
+        
+        shared_shards = sum(a is b for a, b in zip(base.primary._shards, clone.primary._shards))
+        self.assertGreaterEqual(shared_shards, len(base.primary._shards) - 2)
+        shared_blocks = sum(a is b for a, b in zip(base.records._blocks, clone.records._blocks))
+        self.assertGreaterEqual(shared_blocks, len(base.records._blocks) - 3)
+        self.assertEqual(clone.records[4000:4200], list(clone.records)[4000:4200])
+        self.assertEqual(clone.records[-3:], list(clone.records)[-3:])
+
+
+class TestPartitionedStore(unittest.TestCase):
+    """اختبارات التخزين المقسم حسب تاريخ الوصول"""
+    
+    def setUp(self):
+        self.records = list(generate_synthetic_pilgrims(500))
+        self.store = PartitionedStore(granularity_days=2)
+        self.store.add(self.records)
+    
+    def test_partition_stats(self):
+        """اختبار الإحصائيات المحسوبة مسبقاً"""
+        self.assertEqual(len(self.store), 500)
+        stats = self.store.stats()
+        self.assertEqual(stats.count, 500)
+        self.assertEqual(stats.age_sum, sum(r.age for r in self.records))
+        self.assertEqual(sum(self.store.daily_arrivals().values()), 500)
+        for partition in self.store.partitions.values():
+            hours = [r.arrival_hour for r in partition.records]
+            self.assertEqual(hours, sorted(hours))
+    
+    def test_range_filter_prunes_partitions(self):
+        """اختبار تصفية المدى الزمني مع تقليم الـ partitions"""
+        ordered = sorted(self.records, key=lambda r: r.arrival_date)
+        start, end = ordered[100].arrival_date, ordered[300].arrival_date
+        criteria = {'arrival_from': start, 'arrival_to': end}
+        
+        expected = [r.id for r in filter_by_criteria(iter(self.records), criteria)]
+        actual = [r.id for r in filter_by_criteria(self.store, criteria)]
+        self.assertEqual(sorted(actual), sorted(expected))
+        self.assertEqual(len(actual), 200)
+        
+        first_day = ordered[100].arrival_day
+        pruned = self.store.partitions_between(first_day, first_day)
+        self.assertEqual(len(pruned), 1)
+    
+    def test_small_batches_keep_partitions_sorted(self):
+        """اختبار إدراج الدفعات الصغيرة بالبحث الثنائي مع بقاء الترتيب والمدى صحيحين"""
+        extra = list(generate_synthetic_pilgrims(20, seed=8))
+        for record in extra:
+            self.store.add([record])
+        for partition in self.store.partitions.values():
+            hours = [r.arrival_hour for r in partition.records]
+            self.assertEqual(hours, sorted(hours))
+        
+        everything = self.records + extra
+        ordered = sorted(everything, key=lambda r: r.arrival_date)
+        criteria = {'arrival_from': ordered[50].arrival_date, 'arrival_to': ordered[400].arrival_date}
+        expected = [r.id for r in filter_by_criteria(iter(everything), criteria)]
+        actual = [r.id for r in filter_by_criteria(self.store, criteria)]
+        self.assertEqual(sorted(actual), sorted(expected))
+    
+    def test_eviction_to_disk(self):
+        """اختبار إخلاء الـ partitions القديمة إلى القرص"""
+        import os
+        import tempfile
+        spill_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(spill_dir.cleanup)
+        self.store.spill_dir = spill_dir.name
+        last_day = max(r.arrival_day for r in self.records)
+        evicted = self.store.evict_before(last_day - 5)
+        self.assertTrue(evicted)
+        for partition in evicted:
+            self.assertTrue(partition.is_evicted)
+            self.assertTrue(all(os.path.exists(path) for path in partition.segments))
+        
+        # الاستعلامات تبقى صحيحة بعد الإخلاء
+        self.assertEqual(sorted(r.id for r in self.store), sorted(r.id for r in self.records))
+        self.assertEqual(self.store.stats().count, 500)
+        
+        evicted[0].restore()
+        self.assertFalse(evicted[0].is_evicted)
+
+    def test_segments_deleted_when_unused(self):
+        """اختبار حذف ملفات الـ segments التي لم تعد أي نسخة تستخدمها"""
+        import gc
+        import tempfile
+        spill_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(spill_dir.cleanup)
+        self.store.spill_dir = spill_dir.name
+        self.store.evict_before(max(r.arrival_day for r in self.records) + 1)
+        key = self.store._keys[0]
+        segments = list(self.store.partitions[key].segments)
+        files = set(os.listdir(spill_dir.name))
+        
+        # نسخة أحدث تعيد الـ partition إلى الذاكرة: الملفات تبقى ما دامت النسخة القديمة موجودة
+        previous, self.store = self.store, self.store.copy()
+        self.store._partition(key).restore()
+        self.assertEqual(set(os.listdir(spill_dir.name)), files)
+        
+        del previous
+        gc.collect()
+        self.assertFalse(any(os.path.exists(path) for path in segments))
+        in_use = {os.path.basename(path) for p in self.store.partitions.values() for path in p.segments}
+        self.assertEqual(set(os.listdir(spill_dir.name)), in_use)
+        self.assertEqual(sorted(r.id for r in self.store), sorted(r.id for r in self.records))
+
+
+class TestOutOfCore(unittest.TestCase):
+    """اختبارات وضع الذاكرة المحدودة والإخلاء إلى القرص"""
+    
+    def setUp(self):
+        import tempfile
+        spill_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(spill_dir.cleanup)
+        self.platform = HajjUmrahAnalyticsPlatform(
+            spill_dir=spill_dir.name, memory_budget=300
+        )
+        self.platform.load_data(count=3000)
+    
+    def tearDown(self):
+        self.platform.cleanup()
+    
+    def test_segment_roundtrip(self):
+        """اختبار الترميز المضغوط للـ segments"""
+        records = list(generate_synthetic_pilgrims(50))
+        payload = encode_segment(records)
+        decoded = decode_segment(payload)
+        self.assertEqual(decoded, records)
+        self.assertEqual([r.arrival_hour for r in decoded], [r.arrival_hour for r in records])
+        self.assertLess(len(payload), len(__import__('pickle').dumps(records)))
+    
+    def test_records_spill_within_budget(self):
+        """اختبار بقاء السجلات المقيمة ضمن الميزانية"""
+        store = self.platform.store
+        self.assertLessEqual(store.resident_count, self.platform.memory_budget)
+        self.assertTrue(any(p.segments for p in store.partitions.values()))
+        self.assertEqual(len(self.platform.records), 3000)
+        self.assertEqual(len(set(r.id for r in self.platform.records)), 3000)
+    
+    def test_analyses_span_memory_and_disk(self):
+        """اختبار عمل التحليلات عبر الذاكرة والقرص"""
+        summary = self.platform.get_summary_statistics()
+        self.assertEqual(summary['total_pilgrims'], 3000)
+        
+        report = self.platform.run_comprehensive_analysis()
+        self.assertEqual(sum(report['detailed_analysis']['nationality'].values()), 3000)
+        self.assertEqual(report['diagnostics']['execution_plan']['strategy'], 'vectorized')
+        
+        ages = self.platform.analyzer.analyze_age_groups(self.platform.records)
+        self.assertEqual(sum(ages.values()), 3000)
+        
+        chunks = list(self.platform.stream_analysis(chunk_size=1000))
+        self.assertEqual([c['chunk_size'] for c in chunks], [1000, 1000, 1000])
+        
+        record = self.platform.records[2500]
+        self.assertEqual(self.platform.records[2500:2501], [record])
+        self.assertEqual(self.platform.get_pilgrim(record.id), record)
+        self.assertTrue(self.platform.delete_pilgrim(record.id))
+        self.assertIsNone(self.platform.get_pilgrim(record.id))
+        self.assertEqual(len(self.platform.records), 2999)
+
+    def test_single_day_arrivals_spill_within_budget(self):
+        """اختبار أن الميزانية حد صارم حتى لو وصلت كل السجلات في يوم واحد"""
+        import tempfile
+        spill_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(spill_dir.cleanup)
+        platform = HajjUmrahAnalyticsPlatform(spill_dir=spill_dir.name, memory_budget=100)
+        self.addCleanup(platform.cleanup)
+        day = datetime(2025, 6, 1)
+        records = [replace(r, arrival_date=day + timedelta(minutes=i % 1440))
+                   for i, r in enumerate(generate_synthetic_pilgrims(2000, seed=5))]
+        
+        platform.load_records(records)
+        self.assertEqual(len(platform.store.partitions), 1)
+        self.assertLessEqual(platform.store.resident_count, 100)
+        self.assertEqual(len(platform.records), 2000)
+        
+        platform.upsert_records([replace(r, age=50) for r in records[:150]])
+        self.assertLessEqual(platform.store.resident_count, 100)
+        self.assertEqual(platform.get_pilgrim(records[0].id).age, 50)
+        self.assertEqual(len(platform.records), 2000)
+    
+    def test_batched_upsert_reads_each_segment_once(self):
+        """اختبار أن تحديث دفعة يقرأ كل segment معني مرة للبحث ومرة للحذف فقط"""
+        import hajj_umrah_analytics
+        store = self.platform.store
+        key = next(k for k in store._keys if store.partitions[k].is_evicted)
+        partition = store.partitions[key]
+        batch = [replace(r, age=90) for r in partition.records[:50]]
+        
+        with patch.object(hajj_umrah_analytics, '_segment_columns',
+                          wraps=hajj_umrah_analytics._segment_columns) as reads:
+            stats = self.platform.upsert_records(batch)
+        self.assertEqual(stats['updated'], 50)
+        self.assertLessEqual(reads.call_count, 2 * len(partition.segments))
+        self.assertEqual(len(self.platform.records), 3000)
+        self.assertTrue(all(self.platform.get_pilgrim(r.id).age == 90 for r in batch))
+        self.assertEqual(len(self.platform.store.partitions[key]), len(partition))
+    
+    def test_delete_spilled_record_stays_on_disk(self):
+        """اختبار حذف سجل من segment دون إعادة الـ partition إلى الذاكرة"""
+        import dataclasses
+        store = self.platform.store
+        key = next(k for k in store._keys if store.partitions[k].is_evicted)
+        record = store.partitions[key].records[0]
+        segments = list(store.partitions[key].segments)
+
+        self.assertTrue(self.platform.delete_pilgrim(record.id))
+        partition = self.platform.store.partitions[key]
+        self.assertTrue(partition.is_evicted)
+        self.assertEqual(partition.segments, segments)
+        self.assertIsNone(self.platform.get_pilgrim(record.id))
+        self.assertEqual(len(partition), len(partition.records))
+
+        # إعادة الإدراج تعيد السجل رغم علامة الحذف على الـ segment القديم
+        self.platform.upsert_records([dataclasses.replace(record, age=77)])
+        self.assertEqual(self.platform.get_pilgrim(record.id).age, 77)
+        self.assertLessEqual(self.platform.store.resident_count, self.platform.memory_budget)
+        self.assertEqual(len(self.platform.records), 3000)
+        self.assertEqual(len(set(r.id for r in self.platform.records)), 3000)
+
+    def test_repeated_spills_leave_no_orphaned_segments(self):
+        """اختبار عدم تراكم ملفات segments يتيمة مع الكتابات المتكررة ودمج الـ segments"""
+        import gc
+        for i in range(12):
+            batch = [replace(r, age=20 + i) for r in self.platform.records[i * 100:i * 100 + 100]]
+            self.platform.upsert_records(batch)
+        gc.collect()
+        spill_dir = self.platform.store.spill_dir
+        in_use = {os.path.basename(path)
+                  for p in self.platform.store.partitions.values() for path in p.segments}
+        self.assertEqual(set(os.listdir(spill_dir)), in_use)
+        self.assertEqual(len(self.platform.records), 3000)
+
+
 class TestPlatform(unittest.TestCase):
     """اختبارات المنصة الرئيسية"""
     
@@ -198,6 +928,9 @@ class TestPlatform(unittest.TestCase):
         self.platform.load_data(count=count)
         
         self.assertEqual(len(self.platform.records), count)
+        record = self.platform.records[123]
+        self.assertIs(self.platform.get_pilgrim(record.id), record)
+        self.assertIs(self.platform.find_pilgrim(passport_number=record.passport_number), record)
     
     def test_summary_statistics(self):
         """اختبار الإحصائيات الملخصة"""
@@ -210,6 +943,148 @@ class TestPlatform(unittest.TestCase):
         self.assertIn('average_age', summary)
         self.assertGreater(summary['average_age'], 0)
     
+    def test_summary_lives_with_its_version(self):
+        """اختبار حساب الملخص مرة لكل نسخة وتحريره مع النسخة (دون ذاكرة مؤقتة تنمو)"""
+        import dataclasses
+        import gc
+        import weakref
+        self.platform.load_data(count=200)
+        version = self.platform.snapshot()
+        with patch.object(version.store, 'stats', wraps=version.store.stats) as stats:
+            first = self.platform.get_summary_statistics()
+            self.assertIs(self.platform.get_summary_statistics(), first)
+        self.assertEqual(stats.call_count, 1)
+        
+        superseded = weakref.ref(version)
+        del version
+        record = self.platform.records[0]
+        self.platform.upsert_records([dataclasses.replace(record, age=record.age + 1)])
+        self.assertEqual(self.platform.get_summary_statistics()['total_pilgrims'], 200)
+        gc.collect()
+        self.assertIsNone(superseded())
+    
+    def test_upsert_delete_and_range_queries(self):
+        """اختبار التحديث والحذف واستعلامات المدى عبر المنصة"""
+        import dataclasses
+        self.platform.load_data(count=300)
+        record = self.platform.records[0]
+        
+        older = dataclasses.replace(record, age=record.age + 1)
+        self.assertEqual(self.platform.upsert_records([older])['updated'], 1)
+        self.assertEqual(self.platform.get_pilgrim(record.id).age, record.age + 1)
+        self.assertTrue(self.platform.delete_pilgrim(record.id))
+        self.assertEqual(len(self.platform.store), 299)
+        
+        peaks = self.platform.peak_periods()
+        self.assertEqual(sum(peaks.values()), 299)
+        day = record.arrival_date.replace(hour=0, minute=0, second=0, microsecond=0)
+        one_day = self.platform.peak_periods(day, day + timedelta(days=1))
+        self.assertEqual(list(one_day), [day.strftime('%Y-%m-%d')])
+    
+    def test_evicted_records_stay_consistent(self):
+        """اختبار أن السجلات المُخلاة في وضع الذاكرة الكاملة تبقى في كل العروض"""
+        import dataclasses
+        import tempfile
+        spill_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(spill_dir.cleanup)
+        platform = HajjUmrahAnalyticsPlatform(spill_dir=spill_dir.name)
+        self.addCleanup(platform.cleanup)
+        reference = datetime(2025, 6, 1)
+        platform.load_data(count=1000, seed=3, reference=reference)
+        oldest = min(platform.records, key=lambda r: r.arrival_day)
+        
+        self.assertGreater(platform.evict_partitions(reference - timedelta(days=15)), 0)
+        self.assertTrue(any(p.is_evicted for p in platform.store.partitions.values()))
+        self.assertEqual(len(platform.records), 1000)
+        self.assertEqual(platform.get_summary_statistics()['total_pilgrims'], 1000)
+        detailed, _, _ = platform.analyzer.comprehensive_analysis(platform.records)
+        self.assertEqual(sum(detailed['nationality'].values()), 1000)
+        self.assertEqual(len(list(platform.filter_records({}))), 1000)
+        everything = {'arrival_from': reference - timedelta(days=60)}
+        self.assertEqual(len(list(platform.filter_records(everything))), 1000)
+        
+        self.assertEqual(platform.get_pilgrim(oldest.id), oldest)
+        self.assertEqual(platform.find_pilgrim(national_id=oldest.national_id), oldest)
+        stats = platform.upsert_records([dataclasses.replace(oldest, age=oldest.age + 1)])
+        self.assertEqual((stats['inserted'], stats['updated']), (0, 1))
+        self.assertEqual(len(platform.store), 1000)
+        self.assertEqual(platform.get_pilgrim(oldest.id).age, oldest.age + 1)
+    
+    def test_health_triage_tracks_new_flags(self):
+        """اختبار تتبع الحالات الجديدة بين تشغيلات الفرز"""
+        import dataclasses
+        self.platform.load_data(count=200)
+        first = self.platform.health_triage()
+        self.assertEqual(len(first['new_flags']), first['requires_attention'])
+        
+        healthy = next(r for r in self.platform.records if r.health_status != 'يحتاج متابعة')
+        self.platform.upsert_records([dataclasses.replace(healthy, health_status='يحتاج متابعة')])
+        second = self.platform.health_triage()
+        self.assertEqual(second['new_flags'], [healthy.id])
+        self.assertNotIn('flagged_ids', second)
+
+    def test_subset_triage_keeps_other_flags(self):
+        """اختبار أن فرز جزء من البيانات لا يُسقط علامات بقية السجلات"""
+        self.platform.load_data(count=200)
+        first = self.platform.health_triage()
+        flagged = set(first['new_flags'])
+        subset = [r for r in self.platform.records if r.id not in flagged][:10]
+
+        partial = self.platform.health_triage(records=subset)
+        self.assertEqual(partial['cleared_flags'], [])
+        self.assertEqual(partial['new_flags'], [])
+
+        again = self.platform.health_triage()
+        self.assertEqual(again['new_flags'], [])
+        self.assertEqual(again['cleared_flags'], [])
+
+    def test_snapshot_isolation(self):
+        """اختبار ثبات النسخة المثبتة أثناء الكتابة"""
+        import dataclasses
+        self.platform.load_data(count=300)
+        pinned = self.platform.snapshot()
+        record = pinned.records[0]
+        
+        self.platform.upsert_records([dataclasses.replace(record, age=99)])
+        self.platform.delete_pilgrim(pinned.records[1].id)
+        
+        self.assertEqual(self.platform.version, pinned.number + 2)
+        self.assertEqual(len(pinned.records), 300)
+        self.assertEqual(pinned.index.get(record.id).age, record.age)
+        self.assertEqual(pinned.store.stats().count, 300)
+        self.assertEqual(self.platform.get_summary_statistics(pinned)['total_pilgrims'], 300)
+        self.assertEqual(self.platform.get_summary_statistics()['total_pilgrims'], 299)
+        self.assertEqual(self.platform.get_pilgrim(record.id).age, 99)
+    
+    def test_concurrent_readers_during_ingestion(self):
+        """اختبار القراءة المتزامنة مع التحميل دون حالات نصف محدثة"""
+        import threading
+        self.platform.load_data(count=200)
+        errors = []
+        done = threading.Event()
+        
+        def reader():
+            while not done.is_set():
+                version = self.platform.snapshot()
+                summary = self.platform.get_summary_statistics(version)
+                if summary['total_pilgrims'] != len(version.records):
+                    errors.append(summary)
+                if summary['hajj_pilgrims'] + summary['umrah_pilgrims'] != summary['total_pilgrims']:
+                    errors.append(summary)
+        
+        readers = [threading.Thread(target=reader) for _ in range(4)]
+        for thread in readers:
+            thread.start()
+        for count in (300, 400, 500):
+            self.platform.load_data(count=count)
+            self.platform.upsert_records(generate_synthetic_pilgrims(10))
+        done.set()
+        for thread in readers:
+            thread.join()
+        
+        self.assertEqual(errors, [])
+        self.assertEqual(len(self.platform.records), 500)
+    
     def test_comprehensive_analysis(self):
         """اختبار التحليل الشامل"""
         self.platform.load_data(count=1000)
@@ -220,6 +1095,7 @@ class TestPlatform(unittest.TestCase):
         self.assertIn('detailed_analysis', report)
         self.assertIn('top_nationalities', report)
         self.assertIn('generated_at', report)
+        self.assertIn('strategy', report['diagnostics']['execution_plan'])
     
     def test_stream_analysis(self):
         """اختبار التحليل المتدفق"""
@@ -230,8 +1106,17 @@ class TestPlatform(unittest.TestCase):
             chunks_processed += 1
             self.assertIn('chunk_id', chunk)
             self.assertIn('statistics', chunk)
+            self.assertIn('hijri_range', chunk)
         
         self.assertEqual(chunks_processed, 5)
+    
+    def test_stream_date_range_keeps_exact_times(self):
+        """اختبار أن مدى التواريخ في التحليل المتدفق يحتفظ بالوقت الدقيق للسجلات"""
+        from hajj_umrah_analytics import stream_time_series_analysis
+        records = list(generate_synthetic_pilgrims(50, seed=4))
+        chunk = next(stream_time_series_analysis(records, chunk_size=50))
+        self.assertEqual(chunk['date_range']['start'], min(r.arrival_date for r in records).isoformat())
+        self.assertEqual(chunk['date_range']['end'], max(r.departure_date for r in records).isoformat())
 
 
 class TestDataModels(unittest.TestCase):
@@ -286,6 +1171,291 @@ class TestDataModels(unittest.TestCase):
         self.assertEqual(record_dict['id'], "PIL00000001")
         self.assertEqual(record_dict['nationality'], "مصري")
         self.assertEqual(record_dict['pilgrim_type'], "عمرة")
+    
+    def test_derived_date_fields_follow_dates(self):
+        """اختبار تحديث الأيام والساعات المشتقة عند تغيير التواريخ"""
+        arrival = datetime(2025, 6, 1, 10)
+        record = PilgrimRecord(
+            id="PIL00000001", national_id="1234567890", passport_number="P12345678",
+            name="Test", age=30, gender="ذكر", nationality=Nationality.SAUDI,
+            phone="+966501234567", pilgrim_type=PilgrimType.HAJJ,
+            arrival_date=arrival, departure_date=arrival + timedelta(days=5),
+            accommodation_id="ACC1234", transport_id="TRN123", health_status="جيد"
+        )
+        day, hour = record.arrival_day, record.arrival_hour
+        
+        record.arrival_date = arrival + timedelta(days=2, hours=3)
+        self.assertEqual(record.arrival_day, day + 2)
+        self.assertEqual(record.arrival_hour, hour + 51)
+        record.departure_date = arrival + timedelta(days=9)
+        self.assertEqual(record.departure_day, day + 9)
+        
+        moved = replace(record, arrival_date=arrival)
+        self.assertEqual((moved.arrival_day, moved.arrival_hour), (day, hour))
+        restored = pickle.loads(pickle.dumps(record))
+        self.assertEqual(restored.arrival_hour, record.arrival_hour)
+        self.assertEqual(restored, record)
+
+
+class TestCommandLine(unittest.TestCase):
+    """اختبارات واجهة سطر الأوامر والذاكرة المؤقتة للبيانات والتقارير"""
+    
+    def setUp(self):
+        import tempfile
+        self.directory = tempfile.mkdtemp()
+        self.cache_args = ['--cache-dir', os.path.join(self.directory, 'cache')]
+    
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.directory, ignore_errors=True)
+    
+    def run_cli(self, *argv):
+        import io
+        from contextlib import redirect_stdout
+        out = io.StringIO()
+        with redirect_stdout(out):
+            code = main([*self.cache_args, *argv])
+        self.assertEqual(code, 0)
+        return out.getvalue()
+    
+    def test_import_has_no_logging_side_effects(self):
+        """اختبار عدم ضبط logging عند الاستيراد"""
+        import logging
+        import hajj_umrah_analytics
+        handlers = hajj_umrah_analytics.logger.handlers
+        self.assertTrue(all(isinstance(h, logging.NullHandler) for h in handlers))
+        self.assertNotIn('asyncio', hajj_umrah_analytics.__dict__)
+    
+    def test_seeded_generation_and_roundtrip(self):
+        """اختبار إعادة إنتاج البيانات بالـ seed والتحويل من/إلى قاموس"""
+        reference = datetime(2025, 6, 1)
+        first = list(generate_synthetic_pilgrims(20, seed=7, reference=reference))
+        second = list(generate_synthetic_pilgrims(20, seed=7, reference=reference))
+        self.assertEqual(first, second)
+        self.assertEqual([PilgrimRecord.from_dict(r.to_dict()) for r in first], first)
+    
+    def test_analyze_reuses_cached_report(self):
+        """اختبار إعادة استخدام التقرير عند عدم تغير المدخلات"""
+        args = ['analyze', '--count', '300', '--seed', '3', '--reference-date', '2025-06-01']
+        first = self.run_cli(*args)
+        with patch.object(HajjUmrahAnalyticsPlatform, 'run_comprehensive_analysis') as run:
+            second = self.run_cli(*args)
+            run.assert_not_called()
+        self.assertEqual(first, second)
+        self.assertIn('300', first)
+        
+        # مدخلات مختلفة => تقرير جديد
+        self.run_cli('analyze', '--count', '301', '--seed', '3', '--reference-date', '2025-06-01')
+        reports = [n for n in os.listdir(self.cache_args[1]) if n.startswith('report-')]
+        self.assertEqual(len(reports), 2)
+        
+        # إعدادات تنفيذ مختلفة => تقرير جديد بتشخيصات صحيحة
+        report_path = os.path.join(self.directory, 'serial.json')
+        self.run_cli('--engine', 'serial', *args, '--output', report_path)
+        reports = [n for n in os.listdir(self.cache_args[1]) if n.startswith('report-')]
+        self.assertEqual(len(reports), 3)
+        with open(report_path, encoding='utf-8') as f:
+            plan = __import__('json').load(f)['diagnostics']['execution_plan']
+        self.assertEqual(plan['strategy'], 'serial')
+    
+    def test_generate_ingest_filter_export(self):
+        """اختبار أوامر التوليد والاستيعاب والتصفية والتصدير"""
+        import json
+        records_path = os.path.join(self.directory, 'records.jsonl')
+        filtered_path = os.path.join(self.directory, 'filtered.jsonl')
+        report_path = os.path.join(self.directory, 'report.csv')
+        
+        self.run_cli('generate', '--count', '100', '--seed', '1', '--output', records_path)
+        self.assertIn('100 records', self.run_cli('ingest', records_path))
+        
+        self.run_cli('filter', '--input', records_path, '--type', 'HAJJ',
+                     '--min-age', '40', '--output', filtered_path)
+        with open(filtered_path, encoding='utf-8') as f:
+            rows = [json.loads(line) for line in f]
+        self.assertTrue(all(r['pilgrim_type'] == 'حج' and r['age'] >= 40 for r in rows))
+        self.assertTrue(all(len(r['national_id']) == 16 for r in rows))
+        
+        # لا خيار لتصدير المعرفات الحساسة دون تجزئة
+        import io
+        from contextlib import redirect_stderr
+        with redirect_stderr(io.StringIO()), self.assertRaises(SystemExit):
+            main([*self.cache_args, 'filter', '--input', records_path, '--raw'])
+        
+        self.run_cli('--engine', 'serial', 'export', '--input', records_path,
+                     '--output', report_path, '--format', 'csv')
+        with open(report_path, encoding='utf-8') as f:
+            self.assertIn('summary,total_pilgrims,100', f.read())
+
+
+class TestDistributedAggregation(unittest.TestCase):
+    """اختبارات التجميع الموزع: شاردات عاملة ومنسق عبر sockets محلية"""
+    
+    @classmethod
+    def setUpClass(cls):
+        cls.records = list(generate_synthetic_pilgrims(3000, seed=11, reference=datetime(2025, 6, 1)))
+        platform = HajjUmrahAnalyticsPlatform(strategy='serial')
+        platform.load_records(cls.records)
+        cls.expected = platform.run_comprehensive_analysis()
+        platform.cleanup()
+    
+    def collect_in_background(self, coordinator):
+        import threading
+        result = {}
+        thread = threading.Thread(target=lambda: result.update(partial=coordinator.collect()))
+        thread.start()
+        return thread, result
+    
+    def test_partials_roundtrip_and_merge(self):
+        """اختبار تسلسل النتائج الجزئية ودمجها إلى نفس التقرير"""
+        merged = PartialAggregate()
+        for i, shard in enumerate(shard_records(self.records, 4, by='arrival')):
+            partial = PartialAggregate.from_records(shard, shard=str(i))
+            merged.merge(PartialAggregate.from_bytes(partial.to_bytes()))
+        
+        report = merged.to_report()
+        self.assertEqual(report['summary'], self.expected['summary'])
+        self.assertEqual(report['flow_analysis'], self.expected['flow_analysis'])
+        self.assertEqual(report['detailed_analysis'], self.expected['detailed_analysis'])
+        self.assertEqual(report['top_nationalities'], self.expected['top_nationalities'])
+        self.assertEqual(report['rankings'], self.expected['rankings'])
+        self.assertEqual(report['diagnostics']['shard_count'], 4)
+    
+    def test_local_cluster_matches_single_node(self):
+        """اختبار عمليات محلية كعقد: التقرير المدمج يطابق التحليل على عقدة واحدة"""
+        for by in ('nationality', 'arrival'):
+            report = run_local_cluster(self.records, 3, by=by, strategy='vectorized', timeout=60)
+            self.assertEqual(report['summary'], self.expected['summary'])
+            self.assertEqual(report['detailed_analysis'], self.expected['detailed_analysis'])
+            self.assertEqual(report['flow_analysis'], self.expected['flow_analysis'])
+            self.assertEqual(report['rankings'], self.expected['rankings'])
+            shards = report['diagnostics']['shards']
+            self.assertEqual(sorted(s['shard'] for s in shards), [f"{by}-{i}" for i in range(3)])
+            self.assertEqual(sum(s['records'] for s in shards), len(self.records))
+    
+    def test_coordinator_rejects_bad_key_and_ignores_resent_shards(self):
+        """اختبار رفض الإطارات غير الموقعة وعدم دمج الشارد المعاد إرساله مرتين"""
+        half = len(self.records) // 2
+        first = PartialAggregate.from_records(self.records[:half], shard='a')
+        second = PartialAggregate.from_records(self.records[half:], shard='b')
+        
+        with AggregationCoordinator(2, authkey='secret', timeout=30) as coordinator:
+            thread, result = self.collect_in_background(coordinator)
+            with self.assertRaises(ValueError):
+                send_partial(coordinator.address, first, authkey='wrong')
+            send_partial(coordinator.address, first, authkey='secret')
+            send_partial(coordinator.address, first, authkey='secret')
+            send_partial(coordinator.address, second, authkey='secret')
+            thread.join(30)
+            report = coordinator.report()
+        
+        self.assertEqual(result['partial'].stats.count, len(self.records))
+        self.assertEqual(report['summary'], self.expected['summary'])
+    
+    def test_coordinator_rejects_malformed_signed_payloads(self):
+        """اختبار رفض حمولة موقعة لكنها تالفة بـ NAK مع بقاء المنسق يعمل"""
+        import zlib
+        partial = PartialAggregate.from_records(self.records, shard='all')
+        with AggregationCoordinator(1, authkey='secret', timeout=30) as coordinator:
+            thread, result = self.collect_in_background(coordinator)
+            for payload in (b'not zlib', zlib.compress(b'{}'), zlib.compress(b'[1, 2]')):
+                with patch.object(PartialAggregate, 'to_bytes', return_value=payload):
+                    with self.assertRaises(ValueError):
+                        send_partial(coordinator.address, partial, authkey='secret')
+            send_partial(coordinator.address, partial, authkey='secret')
+            thread.join(30)
+        self.assertEqual(result['partial'].stats.count, len(self.records))
+    
+    def test_coordinator_requires_key_off_loopback(self):
+        """اختبار رفض الاستماع على عنوان غير محلي دون مفتاح مشترك"""
+        with patch.dict(os.environ, {'HAJJ_CLUSTER_KEY': ''}):
+            with self.assertRaises(ValueError):
+                AggregationCoordinator(1, host='0.0.0.0')
+            AggregationCoordinator(1, host='127.0.0.1').close()
+            AggregationCoordinator(1, host='0.0.0.0', authkey='secret').close()
+    
+    def test_coordinator_times_out_on_missing_shards(self):
+        """اختبار انتهاء مهلة المنسق عند غياب شاردات"""
+        with AggregationCoordinator(1, timeout=0.2) as coordinator:
+            with self.assertRaises(TimeoutError):
+                coordinator.collect()
+    
+    def test_worker_command_line(self):
+        """اختبار أمر worker في سطر الأوامر مع منسق"""
+        import io
+        from contextlib import redirect_stdout
+        argv = ['--no-cache', 'worker', '--count', '500', '--seed', '2',
+                '--reference-date', '2025-06-01', '--shards', '2', '--by', 'arrival']
+        with AggregationCoordinator(2, timeout=30) as coordinator:
+            thread, result = self.collect_in_background(coordinator)
+            address = f"{coordinator.address[0]}:{coordinator.address[1]}"
+            with redirect_stdout(io.StringIO()):
+                for shard_id in ('0', '1'):
+                    main([*argv, '--coordinator', address, '--shard-id', shard_id])
+            thread.join(30)
+        self.assertEqual(result['partial'].stats.count, 500)
+
+
+class TestRanking(unittest.TestCase):
+    """اختبارات الترتيب الجزئي والتزايدي لأقسام التقرير"""
+    
+    def test_top_n_matches_full_sort(self):
+        """اختبار مطابقة الاختيار الجزئي للفرز الكامل مع كسر التعادل بالمفتاح"""
+        import random
+        rng = random.Random(4)
+        counts = {f"K{i:05d}": rng.randint(1, 50) for i in range(5000)}
+        expected = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+        for n in (0, 1, 10, 5000, 6000):
+            self.assertEqual(top_n(counts, n), expected[:n])
+    
+    def test_ranked_counter_follows_updates(self):
+        """اختبار بقاء الترتيب التزايدي صحيحاً مع الإضافة والطرح ودون نمو الـ heap"""
+        import random
+        rng = random.Random(9)
+        counter = RankedCounter({f"K{i}": rng.randint(1, 20) for i in range(300)})
+        for _ in range(5000):
+            counter.add(f"K{rng.randrange(400)}", rng.choice((-3, -1, 1, 2, 5)))
+        expected = top_n(dict(counter.items()), 15)
+        self.assertEqual(counter.top(15), expected)
+        self.assertEqual(counter.top(15), expected)  # القراءة لا تُفسد الـ heap
+        self.assertTrue(all(n > 0 for _, n in counter.items()))
+        self.assertLessEqual(len(counter._heap), 2 * len(counter) + 64)
+    
+    def test_section_sizes(self):
+        """اختبار ضبط عدد العناصر لكل قسم ورفض الأقسام غير المعروفة"""
+        sizes = resolve_ranking_sizes({'busiest_days': 3})
+        self.assertEqual(sizes['busiest_days'], 3)
+        self.assertEqual(sizes['top_nationalities'], 5)
+        with self.assertRaises(ValueError):
+            resolve_ranking_sizes({'top_hotels': 3})
+    
+    def test_report_rankings_follow_writes(self):
+        """اختبار تحديث أقسام التقرير المرتبة بفروق الكتابات دون إعادة العدّ"""
+        import hajj_umrah_analytics
+        records = list(generate_synthetic_pilgrims(1500, seed=6, reference=datetime(2025, 6, 1)))
+        sizes = {'top_accommodations': 4, 'busiest_days': 3}
+        platform = HajjUmrahAnalyticsPlatform(strategy='serial', ranking_sizes=sizes)
+        platform.load_records(records)
+        first = platform.run_comprehensive_analysis()
+        self.assertEqual(len(first['rankings']['top_accommodations']), 4)
+        self.assertEqual(len(first['rankings']['busiest_days']), 3)
+        self.assertEqual(first['top_nationalities'], first['rankings']['top_nationalities'])
+        
+        # نقل ثلاثين حاجاً إلى نفس السكن ووسيلة النقل ثم حذف بعضهم
+        moved = [replace(r, accommodation_id='ACC-HUB', transport_id='TRN-HUB') for r in records[:30]]
+        platform.upsert_records(moved)
+        for record in moved[:5]:
+            platform.delete_pilgrim(record.id)
+        
+        with patch.object(hajj_umrah_analytics, '_ranking_counts',
+                          wraps=hajj_umrah_analytics._ranking_counts) as kernel:
+            report = platform.run_comprehensive_analysis()
+            kernel.assert_not_called()
+        self.assertEqual(next(iter(report['rankings']['top_accommodations'].items())), ('ACC-HUB', 25))
+        self.assertEqual(report['rankings']['top_transport_routes']['TRN-HUB'], 25)
+        
+        counts = hajj_umrah_analytics._ranking_counts(list(platform.records))
+        self.assertEqual(report['rankings'], rank_sections(counts, resolve_ranking_sizes(sizes)))
+        platform.cleanup()
 
 
 def run_tests():
@@ -296,10 +1466,19 @@ def run_tests():
     
     # إضافة جميع الاختبارات
     suite.addTests(loader.loadTestsFromTestCase(TestDecorators))
+    suite.addTests(loader.loadTestsFromTestCase(TestRetry))
     suite.addTests(loader.loadTestsFromTestCase(TestGenerators))
     suite.addTests(loader.loadTestsFromTestCase(TestDataAnalyzer))
+    suite.addTests(loader.loadTestsFromTestCase(TestFlowAnalytics))
+    suite.addTests(loader.loadTestsFromTestCase(TestCalendar))
+    suite.addTests(loader.loadTestsFromTestCase(TestPilgrimIndex))
+    suite.addTests(loader.loadTestsFromTestCase(TestPartitionedStore))
+    suite.addTests(loader.loadTestsFromTestCase(TestOutOfCore))
     suite.addTests(loader.loadTestsFromTestCase(TestPlatform))
     suite.addTests(loader.loadTestsFromTestCase(TestDataModels))
+    suite.addTests(loader.loadTestsFromTestCase(TestCommandLine))
+    suite.addTests(loader.loadTestsFromTestCase(TestDistributedAggregation))
+    suite.addTests(loader.loadTestsFromTestCase(TestRanking))
     
     # تشغيل الاختبارات
     runner = unittest.TextTestRunner(verbosity=2)